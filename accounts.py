@@ -0,0 +1,132 @@
+import threading, time
+from collections import OrderedDict
+from flask import g, session, has_app_context
+from db import get_reader, VersionWatcher
+
+ACCOUNT_CACHE_SIZE = 2048
+ACCOUNT_CACHE_TTL = 30  # seconds
+
+
+class AccountCache:
+    """Bounded LRU of per-user account state (id, username, premium) with TTL.
+
+    Writes in this worker call invalidate(); writes in other workers bump the
+    "users" data version, which clears the whole cache here on the next poll.
+    Missing users are cached as None so a kicked account costs one query.
+    """
+
+    def __init__(self, maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.watcher = VersionWatcher("users")
+
+    def get(self, username):
+        if self.watcher.changed():
+            self.clear()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(username)
+                return entry[1]
+
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("SELECT id, username, premium FROM users WHERE username=?", (username,))
+        row = cur.fetchone()
+        conn.close()
+        account = dict(row) if row else None
+
+        with self.lock:
+            self.entries[username] = (now + self.ttl, account)
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return account
+
+    def invalidate(self, *usernames):
+        with self.lock:
+            for username in usernames:
+                self.entries.pop(username, None)
+        if has_app_context():
+            g.pop("account", None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+accounts = AccountCache()
+
+
+USERNAME_CACHE_SIZE = 8192
+USERNAME_BATCH = 500  # ids per IN (...) query
+
+
+class Usernames:
+    """Bounded LRU of user id -> username, for display.
+
+    Content rows store users.id; lists that are not already joined against
+    users (chat, subscriptions, admin sections) resolve every id on the page
+    with get_many(): cache hits are free and misses cost one IN (...) query
+    per USERNAME_BATCH ids. A rename or kick bumps "users", which clears the
+    cache here on the next poll. Ids of deleted users map to None.
+    """
+
+    def __init__(self, maxsize=USERNAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.watcher = VersionWatcher("users")
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        if self.watcher.changed():
+            self.clear()
+        found, missing = {}, []
+        with self.lock:
+            for user_id in set(user_ids):
+                if user_id in self.entries:
+                    self.entries.move_to_end(user_id)
+                    found[user_id] = self.entries[user_id]
+                elif user_id is not None:
+                    missing.append(user_id)
+        if missing:
+            loaded = dict.fromkeys(missing)
+            conn = get_reader()
+            cur = conn.cursor()
+            for start in range(0, len(missing), USERNAME_BATCH):
+                batch = missing[start:start + USERNAME_BATCH]
+                cur.execute(f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(batch))})",
+                            batch)
+                loaded.update((row["id"], row["username"]) for row in cur.fetchall())
+            conn.close()
+            with self.lock:
+                self.entries.update(loaded)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, *user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+usernames = Usernames()
+
+
+def current_account():
+    """Account row for session["user"], memoised on flask.g for the request."""
+    if "account" not in g:
+        g.account = accounts.get(session["user"]) if "user" in session else None
+    return g.account
@@ -0,0 +1,68 @@
+from db import get_reader
+from accounts import usernames
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NO_CURSOR = 2**63 - 1
+
+# Dashboard sections: columns returned and the equality filters allowed.
+# Every section pages on id DESC; filtered sections have a (filter, id) index.
+# "names" maps a user id column to the name it is shown as (see
+# accounts.Usernames); filters on a name compare the user's id.
+SECTIONS = {
+    "videos": {"columns": "id, title, uploader_id, likes, views", "filters": ("uploader",),
+               "names": {"uploader_id": "uploader"}},
+    "comments": {"columns": "id, video_id, user_id, text", "filters": ("video_id",),
+                 "names": {"user_id": "user"}},
+    "users": {"columns": "id, email, username, password, premium, ip_address", "filters": ()},
+    "reports": {"columns": "id, reporter, reported_user, reason, status", "filters": ("status",)},
+    "messages": {"columns": "id, user_id, message", "filters": (), "names": {"user_id": "user"}},
+    "blocked_ips": {"columns": "id, ip_address", "filters": ()},
+    "premium_requests": {"columns": "id, user_id, status", "filters": ("status",),
+                         "names": {"user_id": "username"}},
+}
+
+
+def counters():
+    """Summary counts from the trigger-maintained counters table."""
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute("SELECT name, value FROM counters")
+    values = {row["name"]: row["value"] for row in cur.fetchall()}
+    conn.close()
+    return values
+
+
+def section_page(name, filters=None, before=None, limit=PAGE_SIZE):
+    """(rows, next_before) for one keyset page of a dashboard section."""
+    section = SECTIONS[name]
+    by_name = {shown: column for column, shown in section.get("names", {}).items()}
+    where, params = ["id < ?"], [before if before is not None else NO_CURSOR]
+    for column, value in (filters or {}).items():
+        if column in section["filters"] and value not in (None, ""):
+            if column in by_name:
+                where.append(f"{by_name[column]} = (SELECT id FROM users WHERE username = ?)")
+            else:
+                where.append(f"{column} = ?")
+            params.append(value)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT {section['columns']} FROM {name}
+        WHERE {' AND '.join(where)}
+        ORDER BY id DESC LIMIT ?
+    """, params + [limit + 1])
+    rows = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    for column, shown in section.get("names", {}).items():
+        names = usernames.get_many([row[column] for row in rows])
+        for row in rows:
+            row[shown] = names.get(row[column])
+
+    next_before = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_before = rows[-1]["id"]
+    return rows, next_before
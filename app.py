@@ -1,133 +1,94 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
-import sqlite3, os, time
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, abort, jsonify
+import sqlite3, os, posixpath, time
+from markupsafe import Markup
 from functools import wraps
-import werkzeug
+import db
+from db import get_reader, bump_version, bump_versions
+from writer import writer
+from ipblock import blocked_ips, parse_block_entry
+from accounts import accounts, usernames, current_account
+from migrations import migrate
+from uploads import ChunkedUploads, UploadError
+from media import send_media, process_video
+from jobs import queue as job_queue
+from maintenance import maintenance, schedule as schedule_job, cleanup_orphans
+from likes import likes
+from chat import chat
+from search import search_videos, suggest
+from timeline import timeline
+from views import views, view_stats
+from metrics import metrics, labels, scrape_allowed, init_app as init_metrics
+from assets import init_app as init_assets
+from ratelimit import limiter, rate_limited
+from werkzeug.exceptions import TooManyRequests
+from cache import (fragments, versions, conditional, etag, page_etag,
+                   FEED_VERSION, video_version, user_version, views_epoch)
+from admin import SECTIONS as ADMIN_SECTIONS, PAGE_SIZE as ADMIN_PAGE_SIZE, counters as admin_counters, section_page
+from leaderboard import leaderboard as rankings, LEADERBOARD_SIZE, WINDOWS as LEADERBOARD_WINDOWS
 
 # --- Flask app setup ---
 app = Flask(__name__)
 app.secret_key = "supersecretkey"   # ⚠️ replace with env var in production
-DB_FILE = "buzz.db"
+db.init_app(app)
+init_metrics(app)  # per-request latency, SQL and template timings, see metrics.py
+init_assets(app)   # /assets/<name>: fingerprinted, gzipped CSS/JS, see assets.py
 
 # --- Uploads folder setup ---
 UPLOAD_FOLDER = "static/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+uploads = ChunkedUploads(UPLOAD_FOLDER)
 
 # --- Database helper ---
-def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# get_reader() hands out pooled, read-only WAL connections (see db.py);
+# conn.close() returns them to the per-thread pool instead of closing the
+# file. Every write goes through writer.write(), which group-commits it
+# with the worker's other pending writes (see writer.py).
+# The schema lives in migrations.py; on an up-to-date database this is a
+# single PRAGMA user_version read.
+migrate()
+
+@app.template_filter("duration")
+def format_duration(seconds):
+    if seconds is None:
+        return ""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+# Write endpoints are throttled per IP and per user (see ratelimit.py)
+metrics.describe("buzz_rate_limited_total", "counter", "Writes refused with 429, by policy.")
+limiter.rejected.append(lambda name: metrics.inc("buzz_rate_limited_total", labels(policy=name)))
+
+@app.errorhandler(TooManyRequests)
+def too_many_requests(e):
+    # fetch() callers (chat, chunked upload, admin) get JSON, forms the HTML page
+    if request.is_json or request.path.startswith(("/api/", "/upload/")) or wants_json():
+        return jsonify(error=e.description), 429, {"Retry-After": str(e.retry_after)}
+    return e
+
+PUBLIC_FILES = ("asset", "static")
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Users table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            premium INTEGER DEFAULT 0,
-            ip_address TEXT
-        )
-    """)
-
-    # Videos
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS videos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            uploader TEXT NOT NULL,
-            filepath TEXT,
-            likes INTEGER DEFAULT 0
-        )
-    """)
-
-    # Likes
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS likes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            video_id INTEGER,
-            user TEXT,
-            UNIQUE(video_id, user)
-        )
-    """)
-
-    # Comments
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS comments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            video_id INTEGER,
-            user TEXT,
-            text TEXT
-        )
-    """)
-
-    # Messages (Public Chat)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT,
-            message TEXT
-        )
-    """)
-
-    # Reports
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            reporter TEXT,
-            reported_user TEXT,
-            reason TEXT,
-            status TEXT DEFAULT 'pending'
-        )
-    """)
-
-    # Follows
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS follows (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            follower TEXT,
-            following TEXT
-        )
-    """)
-
-    # Blocked IPs
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS blocked_ips (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip_address TEXT UNIQUE
-        )
-    """)
-
-    # Premium Requests
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS premium_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            status TEXT CHECK(status IN ('pending','granted','rejected')) NOT NULL DEFAULT 'pending'
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-
-# Initialize DB at startup
-init_db()
 # Middleware: block requests if IP is in blocked list
+# (served from the in-memory index in ipblock.py, exact IPs and CIDR ranges)
 @app.before_request
 def check_ip_block():
-    ip = request.remote_addr
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM blocked_ips WHERE ip_address=?", (ip,))
-    if cur.fetchone():
-        conn.close()
+    # static/uploads (and its .partial chunks) only goes out through /media/,
+    # which is subject to the block list below
+    if request.endpoint == "static" and posixpath.normpath(request.view_args["filename"]).startswith("uploads/"):
+        abort(404)
+    if request.endpoint in PUBLIC_FILES:
+        return  # same bytes for everyone; skips the block list refresh
+    if blocked_ips.is_blocked(request.remote_addr):
         abort(403)  # Forbidden
-    conn.close()
+
+# Chat retention, orphan and file cleanup, vacuum (see maintenance.py);
+# jobs left queued by a previous run are resubmitted here too, never at
+# import time (the job pool's processes re-import this module)
+@app.before_request
+def start_maintenance():
+    maintenance.start(app.config["UPLOAD_FOLDER"])
+    job_queue.start()
 
 # Premium decorator
 def premium_required(f):
@@ -137,11 +98,7 @@ def premium_required(f):
             flash("You must log in first.", "warning")
             return redirect(url_for("login"))
 
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT premium FROM users WHERE username=?", (session["user"],))
-        user = cur.fetchone()
-        conn.close()
+        user = current_account()  # cached, see accounts.py
 
         if not user:
             session.clear()
@@ -170,20 +127,21 @@ def signup():
             flash("Email, username, and password are required.", "danger")
             return redirect(url_for("signup"))
 
-        conn = get_db()
-        cur = conn.cursor()
-        try:
+        def insert(cur):
             cur.execute(
                 "INSERT INTO users (email, username, password, premium, ip_address) VALUES (?, ?, ?, ?, ?)",
                 (email, username, password, 0, ip_address)
             )
-            conn.commit()
+            # a name freed by a kick may still be cached as missing in any worker
+            bump_version(cur, "users")
+
+        try:
+            writer.write(insert)
+            accounts.invalidate(username)
             flash("Signup successful! Please log in.", "success")
             return redirect(url_for("login"))
         except sqlite3.IntegrityError:
             flash("Email or username already exists.", "danger")
-        finally:
-            conn.close()
     return render_template("signup.html")
 
 @app.route("/request_premium", methods=["POST"])
@@ -192,16 +150,12 @@ def request_premium():
     if "user" not in session:
         return "Unauthorized", 403
 
-    user = session["user"]
+    user_id = current_account()["id"]
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO premium_requests (username, status) VALUES (?, ?)",
-        (user, "pending")
-    )
-    conn.commit()
-    conn.close()
+    writer.write(lambda cur: cur.execute(
+        "INSERT INTO premium_requests (user_id, status) VALUES (?, ?)",
+        (user_id, "pending")
+    ))
 
     flash("Your premium request has been submitted!", "success")
     return redirect(url_for("home"))
@@ -219,7 +173,7 @@ def login():
             flash("Email, username, and password are required.", "danger")
             return redirect(url_for("login"))
 
-        conn = get_db()
+        conn = get_reader()
         cur = conn.cursor()
         cur.execute(
             "SELECT * FROM users WHERE email=? AND username=? AND password=?",
@@ -251,63 +205,293 @@ def logout():
 def grant_premium_user(username):
     if not session.get("admin"):
         abort(403)
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET premium=1 WHERE username=?", (username,))
-    conn.commit()
-    conn.close()
+    def grant(cur):
+        cur.execute("UPDATE users SET premium=1 WHERE username=? RETURNING id", (username,))
+        user = cur.fetchone()
+        bump_version(cur, "users")
+        if user:
+            bump_version(cur, user_version(user["id"]))
+
+    writer.write(grant)
+    accounts.invalidate(username)
 
     flash(f"Premium granted to {username}!", "success")
     return redirect(url_for("profile", username=username))
-@app.route("/")
-@premium_required
-def home():
-    conn = get_db()
+# --- Home feed (keyset pagination on videos.id) ---
+FEED_PAGE_SIZE = 12
+FEED_MAX_PAGE_SIZE = 50
+
+def fetch_feed(before=None, limit=FEED_PAGE_SIZE):
+    """Return (videos, next_before) for the page of videos older than `before`."""
+    conn = get_reader()
     cur = conn.cursor()
     cur.execute("""
-        SELECT videos.*, users.premium
+        SELECT videos.*, users.username AS uploader, users.premium
         FROM videos
-        JOIN users ON videos.uploader = users.username
+        JOIN users ON users.id = videos.uploader_id
+        WHERE videos.id < ?
         ORDER BY videos.id DESC
-    """)
+        LIMIT ?
+    """, (before if before is not None else 2**63 - 1, limit + 1))
     videos = cur.fetchall()
+    conn.close()
+
+    next_before = None
+    if len(videos) > limit:
+        videos = videos[:limit]
+        next_before = videos[-1]["id"]
+    return videos, next_before
 
-    cur.execute("SELECT premium FROM users WHERE username=?", (session["user"],))
-    user = cur.fetchone()
-    premium = user["premium"] if user else 0
 
+def fetch_videos(ids):
+    """{id: row} for the given videos, with the uploader's premium flag."""
+    if not ids:
+        return {}
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT videos.*, users.username AS uploader, users.premium
+        FROM videos
+        JOIN users ON users.id = videos.uploader_id
+        WHERE videos.id IN ({','.join('?' * len(ids))})
+    """, list(ids))
+    rows = {row["id"]: row for row in cur.fetchall()}
     conn.close()
-    return render_template("home.html", videos=videos, premium=premium)
+    return rows
+
+
+def card_keys(videos):
+    """Fragment-cache keys for video cards: (id, video version, uploader version, views epoch)."""
+    found = versions([video_version(v["id"]) for v in videos] +
+                     [user_version(v["uploader_id"]) for v in videos])
+    epoch = views_epoch()
+    return [("card", v["id"], found[video_version(v["id"])], found[user_version(v["uploader_id"])], epoch)
+            for v in videos]
+
+
+def video_cards(keys, rows=None):
+    """Rendered video_card.html per key; misses are fetched and rendered together."""
+    def render(missing):
+        found = rows or fetch_videos([key[1] for key in missing])
+        return {key: Markup(render_template("video_card.html", v=found[key[1]]))
+                for key in missing if key[1] in found}
+    cards = fragments.get_many(keys, render)
+    return [cards[key] for key in keys if key in cards]
+
+
+def feed_index():
+    videos, next_before = fetch_feed()
+    return [{"id": v["id"], "uploader_id": v["uploader_id"]} for v in videos], next_before
+
+
+@app.route("/")
+@premium_required
+def home():
+    premium = current_account()["premium"]
+    # first page of ids per feed version, cards per video/uploader version
+    feed_version = versions([FEED_VERSION])[FEED_VERSION]
+    index, next_before = fragments.get(("feed", feed_version), feed_index)
+    keys = card_keys(index)
+    return conditional(page_etag("home", premium, feed_version, keys),
+                       lambda: render_template("home.html", cards=video_cards(keys), premium=premium,
+                                               next_before=next_before))
+
+
+@app.route("/api/feed")
+@premium_required
+def api_feed():
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", FEED_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    videos, next_before = fetch_feed(before, limit)
+    return feed_json(videos, next_before)
+
+
+def feed_json(videos, next_before):
+    html = "".join(video_cards(card_keys(videos), {v["id"]: v for v in videos}))
+    return jsonify(
+        videos=[{
+            "id": v["id"],
+            "title": v["title"],
+            "uploader": v["uploader"],
+            "premium": v["premium"],
+            "filepath": v["filepath"],
+            "likes": v["likes"],
+            "comments": v["comments"],
+            "duration": v["duration"],
+            "views": v["views"],
+            "unique_views": v["unique_views"],
+        } for v in videos],
+        next_before=next_before,
+        html=html,
+    )
+
+
+@app.route("/following")
+@premium_required
+def following():
+    videos, next_before = timeline.page(current_account()["id"])
+    premium = current_account()["premium"]
+    cards = video_cards(card_keys(videos), {v["id"]: v for v in videos})
+    return render_template("home.html", cards=cards, premium=premium,
+                           next_before=next_before, heading="Following",
+                           feed_url=url_for("api_following"), splash=False)
+
+
+@app.route("/api/following")
+@premium_required
+def api_following():
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", FEED_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    videos, next_before = timeline.page(current_account()["id"], before, limit)
+    return feed_json(videos, next_before)
 
 
 @app.route("/video/<int:id>", methods=["GET", "POST"])
 @premium_required
+@rate_limited("comment")
 def video(id):
-    conn = get_db()
-    cur = conn.cursor()
-
+    # form POST is the no-JavaScript fallback for /api/video/<id>/comments
     if request.method == "POST":
-        text = request.form["text"]
-        cur.execute("INSERT INTO comments (video_id, user, text) VALUES (?, ?, ?)",
-                    (id, session["user"], text))
-        conn.commit()
+        text = (request.form.get("text") or "").strip()
+        if text:
+            add_comment(id, text)
+        return redirect(url_for("video", id=id))
 
-    cur.execute("SELECT * FROM videos WHERE id=?", (id,))
-    v = cur.fetchone()
-    cur.execute("SELECT * FROM comments WHERE video_id=?", (id,))
-    comments = cur.fetchall()
+    premium = current_account()["premium"]
+    # "users" because the page shows the uploader's and commenters' names
+    found = versions([video_version(id), "users"])
+    version = (found[video_version(id)], found["users"])
 
-    cur.execute("SELECT premium FROM users WHERE username=?", (session["user"],))
-    user = cur.fetchone()
+    def render():
+        conn = get_reader()
+        cur = conn.cursor()
+        # a kicked or unknown uploader hides the video, as in the feed and leaderboard
+        cur.execute("""
+            SELECT videos.*, users.username AS uploader
+            FROM videos JOIN users ON users.id = videos.uploader_id
+            WHERE videos.id=?
+        """, (id,))
+        v = cur.fetchone()
+        conn.close()
+        if v is None:
+            abort(404)
+        # counted in memory, flushed in batches (see views.py)
+        views.record(id, session["user"])
+        # include this worker's likes and views that are not flushed yet
+        v = dict(v, likes=v["likes"] + likes.pending(id), views=v["views"] + views.pending(id))
+        # first page only; the rest comes from /api/video/<id>/comments on scroll
+        comments = fragments.get(("comments", id, version), lambda: comment_list(id))
+        return render_template("video.html", v=v, comments=comments, premium=premium)
+
+    # view counts refresh with the epoch, not the version (see views.py)
+    response = conditional(page_etag("video", id, premium, version, views_epoch()), render)
+    if response.status_code == 304:
+        views.record(id, session["user"])  # the client already has the page
+    return response
+
+
+# --- Comments (keyset pagination on idx_comments_video, newest first) ---
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+
+def fetch_comments(video_id, before=None, limit=COMMENTS_PAGE_SIZE):
+    """Return (comments, next_before) for the page of comments older than `before`."""
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT comments.id, users.username AS user, comments.text
+        FROM comments LEFT JOIN users ON users.id = comments.user_id
+        WHERE comments.video_id=? AND comments.id < ?
+        ORDER BY comments.id DESC
+        LIMIT ?
+    """, (video_id, before if before is not None else 2**63 - 1, limit + 1))
+    comments = [dict(row) for row in cur.fetchall()]
     conn.close()
 
-    premium = user["premium"] if user else 0
-    return render_template("video.html", v=v, comments=comments, premium=premium)
+    next_before = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_before = comments[-1]["id"]
+    return comments, next_before
+
+
+def add_comment(video_id, text):
+    """Insert a comment by the current user; None if the video does not exist."""
+    def insert(cur, user_id):
+        cur.execute("""
+            INSERT INTO comments (video_id, user_id, text)
+            SELECT id, ?, ? FROM videos WHERE id=?
+        """, (user_id, text, video_id))
+        if not cur.rowcount:
+            return None
+        comment_id = cur.lastrowid
+        bump_version(cur, video_version(video_id))  # page, comment list and card count
+        return comment_id
+
+    comment_id = writer.write(insert, current_account()["id"])
+    if comment_id is None:
+        return None
+    return {"id": comment_id, "user": session["user"], "text": text}
+
+
+def comment_list(video_id):
+    comments, next_before = fetch_comments(video_id)
+    return Markup(render_template("comment_list.html", comments=comments, next_before=next_before,
+                                  video_id=video_id))
+
+
+@app.route("/api/video/<int:id>/comments", methods=["GET", "POST"])
+@premium_required
+@rate_limited("comment")
+def api_comments(id):
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        text = (data.get("text") or "").strip()
+        if not text:
+            return jsonify(error="Comment text is required."), 400
+        comment = add_comment(id, text)
+        if comment is None:
+            return jsonify(error="Video not found."), 404
+        return jsonify(comment=comment, html=render_template("comment_items.html", comments=[comment])), 201
+
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", COMMENTS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, COMMENTS_MAX_PAGE_SIZE))
+    comments, next_before = fetch_comments(id, before, limit)
+    return jsonify(comments=comments, next_before=next_before,
+                   html=render_template("comment_items.html", comments=comments))
+
+
+def add_video(title, stored_path):
+    web_path = url_for("media", name=stored_path)
+    uploader_id = current_account()["id"]
+
+    def insert(cur):
+        cur.execute(
+            "INSERT INTO videos (title, uploader_id, filepath) VALUES (?, ?, ?)",
+            (title, uploader_id, web_path)
+        )
+        video_id = cur.lastrowid
+        timeline.on_upload(cur, video_id, uploader_id)  # followers' inboxes
+        bump_versions(cur, [FEED_VERSION, user_version(uploader_id)])
+        # faststart + duration/resolution/codec in the background (see media.py)
+        job_id = job_queue.insert(cur, process_video,
+                                  {"video_id": video_id, "folder": app.config["UPLOAD_FOLDER"]})
+        return video_id, job_id
+
+    video_id, job_id = writer.write(insert)
+    job_queue.submit(job_id, process_video)
+    return video_id
 
 
 @app.route("/upload", methods=["GET", "POST"])
 @premium_required
+@rate_limited("upload")
 def upload():
+    # Form POST is the no-JavaScript fallback; upload.html normally uses the
+    # chunked /upload/init -> PUT chunk -> finalize protocol below.
     if request.method == "POST":
         title = request.form.get("title")
         if not title:
@@ -320,22 +504,7 @@ def upload():
             return redirect(url_for("upload"))
 
         try:
-            filename = werkzeug.utils.secure_filename(file.filename)
-            os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-            save_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            file.save(save_path)
-
-            web_path = url_for("static", filename=f"uploads/{filename}")
-
-            conn = get_db()
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO videos (title, uploader, filepath) VALUES (?, ?, ?)",
-                (title, session["user"], web_path)
-            )
-            conn.commit()
-            conn.close()
-
+            add_video(title, uploads.store_stream(file.stream, file.filename))
             flash("Video uploaded successfully!", "success")
             return redirect(url_for("home"))
 
@@ -346,79 +515,212 @@ def upload():
     return render_template("upload.html")
 
 
+@app.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify(error=str(e)), e.status
+
+
+@app.route("/upload/init", methods=["POST"])
+@premium_required
+@rate_limited("upload")
+def upload_init():
+    data = request.get_json(silent=True) or {}
+    title = (data.get("title") or "").strip()
+    if not title:
+        raise UploadError("Title is required.")
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        raise UploadError("File size is required.")
+    return jsonify(uploads.start(current_account()["id"], title, data.get("filename"), size))
+
+
+@app.route("/upload/<upload_id>")
+@premium_required
+def upload_status(upload_id):
+    return jsonify(uploads.status(upload_id, current_account()["id"]))
+
+
+@app.route("/upload/<upload_id>/<int:index>", methods=["PUT"])
+@premium_required
+def upload_chunk(upload_id, index):
+    # request.stream is read in small blocks straight to disk, never buffered
+    status = uploads.write_chunk(upload_id, current_account()["id"], index,
+                                 request.stream, request.content_length)
+    return jsonify(status)
+
+
+@app.route("/upload/<upload_id>/finalize", methods=["POST"])
+@premium_required
+def upload_finalize(upload_id):
+    row, stored_path = uploads.finish(upload_id, current_account()["id"])
+    video_id = add_video(row["title"], stored_path)
+    flash("Video uploaded successfully!", "success")
+    return jsonify(video_id=video_id, url=url_for("video", id=video_id))
+
+
+# Uploaded videos: Range/ETag aware and sent with sendfile (see media.py).
+# Public like the old /static/uploads URLs, so it never loads the account.
+@app.route("/media/<path:name>")
+def media(name):
+    return send_media(app.config["UPLOAD_FOLDER"], name, request)
+
+
 @app.route("/leaderboard")
 @premium_required
 def leaderboard():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT title, likes FROM videos ORDER BY likes DESC LIMIT 5")
-    videos = cur.fetchall()
-    conn.close()
+    # served from memory, see leaderboard.py
+    window = request.args.get("window", "all")
+    if window not in LEADERBOARD_WINDOWS:
+        window = "all"
+    n = request.args.get("n", LEADERBOARD_SIZE, type=int)
+    videos = with_view_stats(rankings.top(window, n))
+
+    # the rankings live in memory, so the ETag is taken from what is shown
+    tag = etag("leaderboard", window,
+               [(v["id"], v["title"], v["likes"], v["views"], v["unique_views"]) for v in videos])
+
+    def render():
+        titles = [v["title"] for v in videos]
+        likes = [v["likes"] for v in videos]
+        return render_template("leaderboard.html", titles=titles, likes=likes, videos=videos,
+                               window=window, windows=LEADERBOARD_WINDOWS)
+
+    return conditional(tag, lambda: fragments.get(("leaderboard", tag), render))
+
+
+@app.route("/api/leaderboard")
+@premium_required
+def api_leaderboard():
+    window = request.args.get("window", "all")
+    if window not in LEADERBOARD_WINDOWS:
+        return jsonify(error=f"window must be one of {', '.join(LEADERBOARD_WINDOWS)}"), 400
+    n = request.args.get("n", LEADERBOARD_SIZE, type=int)
+    return jsonify(window=window, videos=with_view_stats(rankings.top(window, n)))
 
-    titles = [v["title"] for v in videos]
-    likes = [v["likes"] for v in videos]
 
-    return render_template("leaderboard.html", titles=titles, likes=likes, videos=videos)
+def with_view_stats(videos):
+    stats = view_stats([v["id"] for v in videos])
+    for v in videos:
+        v["views"], v["unique_views"] = stats.get(v["id"], (0, 0))
+    return videos
 
 
 @app.route("/publichat", methods=["GET", "POST"])
 @premium_required
+@rate_limited("chat")
 def publichat():
-    conn = get_db()
-    cur = conn.cursor()
-
+    # form POST is the no-JavaScript fallback for /api/chat
     if request.method == "POST":
-        msg = request.form["message"]
-        cur.execute("INSERT INTO messages (user, message) VALUES (?, ?)",
-                    (session["user"], msg))
-        conn.commit()
+        message = (request.form.get("message") or "").strip()
+        if message:
+            chat.post(current_account()["id"], message)
+        else:
+            flash("Message is required.", "danger")
+        return redirect(url_for("publichat"))
 
-    cur.execute("SELECT * FROM messages ORDER BY id DESC LIMIT 20")
-    messages = cur.fetchall()
-    conn.close()
+    messages = chat.recent(20)  # from the ring buffer, see chat.py
+    last_id = messages[0]["id"] if messages else 0
+    return render_template("publichat.html", messages=messages, last_id=last_id)
+
+
+@app.route("/api/chat", methods=["POST"])
+@premium_required
+@rate_limited("chat")
+def api_chat():
+    data = request.get_json(silent=True) or {}
+    message = (data.get("message") or "").strip()
+    if not message:
+        return jsonify(error="Message is required."), 400
+    message_id = chat.post(current_account()["id"], message)
+    return jsonify(id=message_id, user=session["user"], message=message)
 
-    return render_template("publichat.html", messages=messages)
+
+@app.route("/publichat/stream")
+@premium_required
+def publichat_stream():
+    # EventSource sends Last-Event-ID when it reconnects
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None:
+        last_id = request.args.get("after", type=int)
+    return Response(chat.stream(last_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/search")
+@premium_required
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    results, has_next = search_videos(query, page)  # FTS5, see search.py
+    return render_template("search.html", query=query, results=results,
+                           page=page, has_next=has_next)
+
+
+@app.route("/api/search/suggest")
+@premium_required
+def api_search_suggest():
+    return jsonify(suggestions=suggest(request.args.get("q", "")))
 
 
 @app.route("/profile")
 @premium_required
 def profile():
-    conn = get_db()
+    user_id = current_account()["id"]
+    conn = get_reader()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM videos WHERE uploader=?", (session["user"],))
-    videos = cur.fetchall()
-    cur.execute("SELECT * FROM users WHERE username=?", (session["user"],))
-    user = cur.fetchone()
-    cur.execute("SELECT following FROM follows WHERE follower=?", (session["user"],))
-    subs = cur.fetchall()
+    cur.execute("SELECT id FROM videos WHERE uploader_id=?", (user_id,))  # covered by idx_videos_uploader
+    ids = [row["id"] for row in cur.fetchall()]
     conn.close()
+    # "users" for the names of the followed creators
+    found = versions(["users", user_version(user_id)] + [video_version(i) for i in ids])
+
+    def render():
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM videos WHERE uploader_id=?", (user_id,))
+        videos = cur.fetchall()
+        cur.execute("SELECT * FROM users WHERE id=?", (user_id,))
+        user = cur.fetchone()
+        cur.execute("SELECT following_id FROM follows WHERE follower_id=?", (user_id,))
+        followed = [row["following_id"] for row in cur.fetchall()]
+        conn.close()
+        names = usernames.get_many(followed)
+        subs = [{"creator": names[i]} for i in followed if names.get(i)]
+        return render_template("profile.html", user=user, videos=videos, subs=subs)
 
-    return render_template("profile.html", user=user, videos=videos, subs=subs)
+    return conditional(page_etag("profile", sorted(found.items())), render)
 
 
 
 @app.route("/settings", methods=["GET", "POST"])
 @premium_required
 def settings():
-    conn = get_db()
-    cur = conn.cursor()
-
     if request.method == "POST":
         new_username = request.form.get("username")
         new_password = request.form.get("password")
 
-        if new_username:
-            cur.execute("UPDATE users SET username=? WHERE username=?", 
-                        (new_username, session["user"]))
-            session["user"] = new_username
+        user_id = current_account()["id"]
 
-        if new_password:
-            cur.execute("UPDATE users SET password=? WHERE username=?", 
-                        (new_password, session["user"]))
+        def update(cur):
+            if new_username:
+                # one row: everything else refers to users.id; chat rings hold names
+                cur.execute("UPDATE users SET username=? WHERE id=?",
+                            (new_username, user_id))
+                bump_versions(cur, ["users", "messages", user_version(user_id)])
+            if new_password:
+                cur.execute("UPDATE users SET password=? WHERE id=?",
+                            (new_password, user_id))
 
-        conn.commit()
+        writer.write(update)
+        if new_username:
+            accounts.invalidate(session["user"], new_username)
+            usernames.invalidate(user_id)
+            session["user"] = new_username
         flash("Settings updated!", "success")
 
+    conn = get_reader()
+    cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE username=?", (session["user"],))
     user = cur.fetchone()
     conn.close()
@@ -428,233 +730,276 @@ def settings():
 
 @app.route("/like/<int:id>", methods=["POST"])
 @premium_required
+@rate_limited("like")
 def like_video(id):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM videos WHERE id=?", (id,))
-    video = cur.fetchone()
-    if not video:
-        conn.close()
-        flash("Video not found.", "danger")
-        return redirect(url_for("home"))
-
-    if video["uploader"] == session["user"]:
-        conn.close()
-        flash("You cannot like your own video.", "warning")
-        return redirect(url_for("video", id=id))
-
-    cur.execute("SELECT * FROM likes WHERE video_id=? AND user=?", (id, session["user"]))
-    existing = cur.fetchone()
-
-    if existing:
-        cur.execute("DELETE FROM likes WHERE video_id=? AND user=?", (id, session["user"]))
-        cur.execute("UPDATE videos SET likes = likes - 1 WHERE id=?", (id,))
+    # one INSERT (or DELETE) on likes; videos.likes is updated write-behind
+    delta = likes.toggle(id, current_account()["id"])
+    if delta > 0:
+        flash("You liked the video!", "success")
+    elif delta < 0:
         flash("You unliked the video.", "info")
     else:
-        cur.execute("INSERT INTO likes (video_id, user) VALUES (?, ?)", (id, session["user"]))
-        cur.execute("UPDATE videos SET likes = likes + 1 WHERE id=?", (id,))
-        flash("You liked the video!", "success")
-
-    conn.commit()
-    conn.close()
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM videos WHERE id=?", (id,))
+        video = cur.fetchone()
+        conn.close()
+        if not video:
+            flash("Video not found.", "danger")
+            return redirect(url_for("home"))
+        flash("You cannot like your own video.", "warning")
     return redirect(url_for("video", id=id))
 
 
 @app.route("/follow/<string:username>", methods=["POST"])
 @premium_required
+@rate_limited("follow")
 def follow_user(username):
-    conn = get_db()
-    cur = conn.cursor()
-
     if username == session["user"]:
-        conn.close()
         flash("You cannot follow yourself.", "warning")
         return redirect(url_for("profile"))
 
-    cur.execute("SELECT * FROM follows WHERE follower=? AND following=?", (session["user"], username))
-    existing = cur.fetchone()
-
-    if existing:
+    follower_id = current_account()["id"]
+
+    def follow(cur):
+        cur.execute("SELECT id FROM users WHERE username=?", (username,))
+        target = cur.fetchone()
+        if not target:
+            return None
+        # idx_follows_pair makes this a single indexed insert-or-skip
+        cur.execute("INSERT OR IGNORE INTO follows (follower_id, following_id) VALUES (?, ?)",
+                    (follower_id, target["id"]))
+        if cur.rowcount == 0:
+            return False
+        timeline.on_follow(cur, follower_id, target["id"])
+        bump_version(cur, user_version(follower_id))
+        return True
+
+    followed = writer.write(follow)
+    if followed is None:
+        flash(f"No user named {username}.", "danger")
+    elif not followed:
         flash(f"You already follow {username}.", "info")
     else:
-        cur.execute("INSERT INTO follows (follower, following) VALUES (?, ?)", (session["user"], username))
-        conn.commit()
         flash(f"You are now following {username}!", "success")
-
-    conn.close()
     return redirect(url_for("profile"))
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format, for admins and scrapers with the token. Not by
+    # address: behind a local reverse proxy every request comes from loopback.
+    if not (session.get("admin") or scrape_allowed(request)):
+        abort(403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/admin")
 def admin_dashboard():
     if not session.get("admin"):
         flash("Admin access required.", "danger")
         return redirect(url_for("home"))
+    # sections load themselves page by page from /admin/api/<section>
+    return render_template("admin.html", counters=admin_counters(), page_size=ADMIN_PAGE_SIZE)
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM videos")
-    videos = cur.fetchall()
-    cur.execute("SELECT * FROM comments")
-    comments = cur.fetchall()
-    cur.execute("SELECT * FROM users")
-    users = cur.fetchall()
-    cur.execute("SELECT * FROM reports")
-    reports = cur.fetchall()
-    cur.execute("SELECT * FROM messages")
-    messages = cur.fetchall()
-    cur.execute("SELECT * FROM blocked_ips")
-    blocked_ips = cur.fetchall()
-    cur.execute("SELECT * FROM premium_requests ORDER BY id DESC")
-    premium_requests = cur.fetchall()
-    conn.close()
 
-    return render_template("admin.html",
-                           videos=videos,
-                           comments=comments,
-                           users=users,
-                           reports=reports,
-                           messages=messages,
-                           blocked_ips=blocked_ips,
-                           premium_requests=premium_requests)
+@app.route("/admin/api/summary")
+def admin_api_summary():
+    if not session.get("admin"):
+        return jsonify(error="admin access required"), 403
+    return jsonify(counters=admin_counters())
+
+
+@app.route("/admin/api/<section>")
+def admin_api_section(section):
+    if not session.get("admin"):
+        return jsonify(error="admin access required"), 403
+    if section not in ADMIN_SECTIONS:
+        return jsonify(error=f"section must be one of {', '.join(ADMIN_SECTIONS)}"), 404
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", ADMIN_PAGE_SIZE, type=int)
+    rows, next_before = section_page(section, request.args, before, limit)
+    return jsonify(section=section, rows=rows, next_before=next_before)
+
+
+def wants_json():
+    return request.accept_mimetypes.best == "application/json"
+
+
+def admin_done(message, category, **changes):
+    """Answer a moderation action: JSON for the dashboard's fetch() calls,
+    flash + redirect for plain form posts."""
+    if wants_json():
+        return jsonify(message=message, category=category, counters=admin_counters(), **changes)
+    flash(message, category)
+    return redirect(url_for("admin_dashboard"))
+
+
+def admin_denied():
+    if wants_json():
+        return jsonify(error="admin access required"), 403
+    return redirect(url_for("home"))
 
 
 @app.route("/admin/delete_video/<int:id>", methods=["POST"])
 def admin_delete_video(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM videos WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("Video deleted.", "info")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def delete(cur):
+        cur.execute("DELETE FROM videos WHERE id=? RETURNING uploader_id", (id,))
+        row = cur.fetchone()
+        if row:
+            bump_versions(cur, [FEED_VERSION, video_version(id), user_version(row["uploader_id"])])
+        return row
+
+    if writer.write(delete):
+        schedule_job(cleanup_orphans)  # its likes, comments and inbox rows
+    return admin_done("Video deleted.", "info", removed=id)
 
 
 @app.route("/admin/delete_comment/<int:id>", methods=["POST"])
 def admin_delete_comment(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM comments WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("Comment deleted.", "info")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def delete(cur):
+        cur.execute("DELETE FROM comments WHERE id=? RETURNING video_id", (id,))
+        row = cur.fetchone()
+        if row:
+            bump_version(cur, video_version(row["video_id"]))
+
+    writer.write(delete)
+    return admin_done("Comment deleted.", "info", removed=id)
 
 
 @app.route("/admin/delete_message/<int:id>", methods=["POST"])
 def admin_delete_message(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM messages WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("Message deleted.", "info")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def delete(cur):
+        cur.execute("DELETE FROM messages WHERE id=?", (id,))
+        bump_version(cur, "messages")  # chat rings drop it on their next poll
+
+    writer.write(delete)
+    return admin_done("Message deleted.", "info", removed=id)
 
 
 @app.route("/admin/grant_premium/<int:id>", methods=["POST"])
 def admin_grant_premium(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET premium=1 WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("Premium granted.", "success")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def grant(cur):
+        cur.execute("UPDATE users SET premium=1 WHERE id=? RETURNING username", (id,))
+        user = cur.fetchone()
+        bump_version(cur, "users")
+        if user:
+            bump_version(cur, user_version(id))
+        return user
+
+    user = writer.write(grant)
+    if user:
+        accounts.invalidate(user["username"])
+    return admin_done("Premium granted.", "success", updated={"id": id, "premium": 1})
 
 
 @app.route("/admin/kick_user/<int:id>", methods=["POST"])
 def admin_kick_user(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("User kicked.", "info")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def kick(cur):
+        cur.execute("DELETE FROM users WHERE id=? RETURNING username", (id,))
+        user = cur.fetchone()
+        bump_versions(cur, ["users", FEED_VERSION])
+        if user:
+            bump_version(cur, user_version(id))
+        return user
+
+    user = writer.write(kick)
+    if user:
+        accounts.invalidate(user["username"])
+        usernames.invalidate(id)
+        schedule_job(cleanup_orphans)  # their videos, likes, comments and follows
+    return admin_done("User kicked.", "info", removed=id)
 
 
 @app.route("/admin/mark_report_reviewed/<int:id>", methods=["POST"])
 def admin_mark_report_reviewed(id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE reports SET status='reviewed' WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
-    flash("Report marked as reviewed.", "success")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    writer.write(lambda cur: cur.execute("UPDATE reports SET status='reviewed' WHERE id=?", (id,)))
+    return admin_done("Report marked as reviewed.", "success", updated={"id": id, "status": "reviewed"})
 
 
 # ✅ Block/Unblock IP routes
 @app.route("/admin/block_ip", methods=["POST"])
 def admin_block_ip():
     if not session.get("admin"):
-        return redirect(url_for("home"))
+        return admin_denied()
     ip = request.form.get("ip")
-    if ip:
-        conn = get_db()
-        cur = conn.cursor()
-        try:
-            cur.execute("INSERT INTO blocked_ips (ip_address) VALUES (?)", (ip,))
-            conn.commit()
-            flash(f"Blocked {ip}", "success")
-        except sqlite3.IntegrityError:
-            flash(f"{ip} is already blocked.", "warning")
-        conn.close()
-    return redirect(url_for("admin_dashboard"))
+    if not ip:
+        return admin_done("Enter an IP address or CIDR range.", "warning")
+    entry = parse_block_entry(ip)
+    if not entry:
+        return admin_done(f"{ip} is not a valid IP address or CIDR range.", "danger")
+
+    def block(cur):
+        cur.execute("INSERT INTO blocked_ips (ip_address) VALUES (?)", (entry,))
+        block_id = cur.lastrowid
+        bump_version(cur, "blocked_ips")
+        return block_id
+
+    try:
+        added = {"id": writer.write(block), "ip_address": entry}
+    except sqlite3.IntegrityError:
+        return admin_done(f"{entry} is already blocked.", "warning")
+    blocked_ips.refresh(force=True)
+    return admin_done(f"Blocked {entry}", "success", added=added)
 
 @app.route("/admin/unblock_ip", methods=["POST"])
 def admin_unblock_ip():
     if not session.get("admin"):
-        return redirect(url_for("home"))
+        return admin_denied()
     ip = request.form.get("ip")
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM blocked_ips WHERE ip_address=?", (ip,))
-    conn.commit()
-    conn.close()
-    flash(f"Unblocked {ip}", "info")
-    return redirect(url_for("admin_dashboard"))
+    entry = parse_block_entry(ip or "") or ip
+
+    def unblock(cur):
+        cur.execute("DELETE FROM blocked_ips WHERE ip_address=? RETURNING id", (entry,))
+        row = cur.fetchone()
+        bump_version(cur, "blocked_ips")
+        return row
+
+    row = writer.write(unblock)
+    blocked_ips.refresh(force=True)
+    return admin_done(f"Unblocked {entry}", "info", removed=row["id"] if row else None)
 
 
 # ✅ Premium request management
 @app.route("/admin/grant_premium_request/<int:request_id>", methods=["POST"])
 def admin_grant_premium_request(request_id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE premium_requests SET status='granted' WHERE id=?", (request_id,))
-    cur.execute("""
-        UPDATE users SET premium=1 
-        WHERE username=(SELECT username FROM premium_requests WHERE id=?)
-    """, (request_id,))
-    conn.commit()
-    conn.close()
-    flash("Premium request granted.", "success")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    def grant(cur):
+        cur.execute("UPDATE premium_requests SET status='granted' WHERE id=?", (request_id,))
+        cur.execute("""
+            UPDATE users SET premium=1
+            WHERE id = (SELECT user_id FROM premium_requests WHERE id=?)
+            RETURNING id, username
+        """, (request_id,))
+        user = cur.fetchone()
+        if user:
+            bump_versions(cur, ["users", user_version(user["id"])])
+        return user
+
+    user = writer.write(grant)
+    if user:
+        accounts.invalidate(user["username"])
+    return admin_done("Premium request granted.", "success",
+                      updated={"id": request_id, "status": "granted"})
 
 @app.route("/admin/reject_premium_request/<int:request_id>", methods=["POST"])
 def admin_reject_premium_request(request_id):
     if not session.get("admin"):
-        return redirect(url_for("home"))
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE premium_requests SET status='rejected' WHERE id=?", (request_id,))
-    conn.commit()
-    conn.close()
-    flash("Premium request rejected.", "info")
-    return redirect(url_for("admin_dashboard"))
+        return admin_denied()
+    writer.write(lambda cur: cur.execute("UPDATE premium_requests SET status='rejected' WHERE id=?",
+                                         (request_id,)))
+    return admin_done("Premium request rejected.", "info",
+                      updated={"id": request_id, "status": "rejected"})
 if __name__ == "__main__":
-    init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,192 @@
+"""Fingerprinted, precompressed CSS/JS bundles.
+
+`python assets.py build` (or a worker's first page, when the build is
+missing or older than its sources) concatenates and minifies the BUNDLES sources from static/, names each
+result after its content hash, writes a .gz next to it and records the
+names in static/dist/manifest.json. Templates link bundles with
+asset_url("base.css"); /assets/<name> serves them with a one-year
+immutable Cache-Control, so a repeat page load sends no asset bytes, and
+a changed bundle gets a new URL instead of a revalidation.
+"""
+import argparse, gzip, hashlib, json, mimetypes, os, re, threading
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+# next to this file, like Flask's own static/ and templates/: never the cwd
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_FOLDER = os.path.join(STATIC_FOLDER, "dist")
+MANIFEST = "manifest.json"
+MAX_AGE = 365 * 24 * 3600
+GZIP_LEVEL = 9
+
+# bundle name -> source files in static/, concatenated in order
+BUNDLES = {
+    "admin.js": ["admin.js"],
+    "base.css": ["base.css"],
+    "base.js": ["base.js"],
+    "home.css": ["home.css"],
+    "home.js": ["home.js"],
+    "leaderboard.css": ["leaderboard.css"],
+    "leaderboard.js": ["leaderboard.js"],
+    "publichat.js": ["publichat.js"],
+    "search.css": ["search.css"],
+    "search.js": ["search.js"],
+    "style.css": ["style.css"],
+    "upload.js": ["upload.js"],
+    "video.js": ["video.js"],
+}
+
+
+# --- Minifying ---
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+CSS_SPACE = re.compile(r"\s+")
+CSS_PUNCT = re.compile(r"\s*([{}:;,>])\s*")
+
+
+def minify_css(text):
+    text = CSS_COMMENT.sub("", text)
+    text = CSS_SPACE.sub(" ", text)
+    text = CSS_PUNCT.sub(r"\1", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    """Drop comment lines, indentation and blank lines; keep line breaks.
+
+    Deliberately conservative: code is never joined across lines (automatic
+    semicolon insertion stays intact) and nothing inside a line is touched,
+    so strings and regexes cannot be damaged. gzip takes care of the rest.
+    """
+    text = re.sub(r"^\s*/\*.*?\*/\s*$", "", text, flags=re.S | re.M)
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//")) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# --- Building ---
+def fingerprinted(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_manifest(dist=DIST_FOLDER):
+    try:
+        with open(os.path.join(dist, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def build(static=STATIC_FOLDER, dist=DIST_FOLDER, bundles=BUNDLES):
+    """Write every bundle and its .gz; returns the new manifest.
+
+    Files from the previous build are kept, so pages rendered before a
+    deploy can still load their bundles; anything older is removed.
+    Names are content hashes, so concurrent builds write identical files.
+    """
+    os.makedirs(dist, exist_ok=True)
+    previous = read_manifest(dist)
+    manifest = {}
+    for name, sources in bundles.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static, source), encoding="utf-8") as f:
+                parts.append(f.read())
+        minify = MINIFIERS.get(os.path.splitext(name)[1], lambda text: text)
+        data = minify("\n".join(parts)).encode("utf-8")
+        filename = fingerprinted(name, data)
+        path = os.path.join(dist, filename)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+            # mtime=0: the same bundle always compresses to the same bytes
+            write_atomic(path + ".gz", gzip.compress(data, GZIP_LEVEL, mtime=0))
+        manifest[name] = filename
+    write_atomic(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    keep = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(dist):
+        if filename != MANIFEST and filename.removesuffix(".gz") not in keep:
+            os.remove(os.path.join(dist, filename))
+    return manifest
+
+
+def stale(static=STATIC_FOLDER, dist=DIST_FOLDER, bundles=BUNDLES):
+    """True if the manifest is missing, incomplete or older than a source."""
+    try:
+        built = os.stat(os.path.join(dist, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        return True
+    if set(read_manifest(dist)) != set(bundles):
+        return True
+    return any(os.stat(os.path.join(static, source)).st_mtime_ns > built
+               for sources in bundles.values() for source in sources)
+
+
+class Assets:
+    """The manifest of the current build, loaded once per worker."""
+
+    def __init__(self, static=STATIC_FOLDER, dist=DIST_FOLDER):
+        self.static = static
+        self.dist = dist
+        self.manifest = None
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.manifest is None:
+                manifest = build(self.static, self.dist) if stale(self.static, self.dist) \
+                    else read_manifest(self.dist)
+                self.stamp = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:8]
+                self.manifest = manifest
+        return self.manifest
+
+    def url(self, name):
+        return url_for("asset", name=self.load()[name])
+
+    def version(self):
+        """Changes whenever any bundle does; part of every page ETag (see cache.py)."""
+        self.load()
+        return self.stamp
+
+    def send(self, name):
+        """Serve a built file, its .gz when the client accepts gzip."""
+        path = safe_join(self.dist, name)
+        if path is None or name == MANIFEST or name.endswith(".gz") or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        gzipped = request.accept_encodings["gzip"] > 0 and os.path.isfile(path + ".gz")
+        response = send_file(os.path.abspath(path + ".gz" if gzipped else path), mimetype=mimetype,
+                             max_age=MAX_AGE, etag=name + (".gz" if gzipped else ""), conditional=True)
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def init_app(app):
+    app.add_url_rule("/assets/<path:name>", "asset", assets.send)
+    app.jinja_env.globals["asset_url"] = assets.url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build BuzzTube's CSS/JS bundles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="minify, fingerprint and gzip every bundle")
+    args = parser.parse_args()
+    manifest = build()
+    print(f"✅ Built {len(manifest)} bundles in {os.path.relpath(DIST_FOLDER)}: {', '.join(manifest.values())}")
@@ -0,0 +1,352 @@
+"""Online backups and NDJSON export/import for buzz.db and the uploads.
+
+    python backup.py snapshot backups/                 # database + uploads, while the app runs
+    python backup.py restore backups/<stamp> --db buzz.db
+    python backup.py export dump/                      # one <table>.ndjson per table
+    python backup.py import dump/ --db restored.db     # into a fresh database
+
+A snapshot copies the database with SQLite's online backup API a few pages
+at a time, so writers only ever wait for one short step, and stores the
+uploads once per content hash under <backups>/objects/: each snapshot only
+copies files the previous ones did not already have.
+"""
+import argparse, hashlib, json, os, re, shutil, sqlite3, time
+import db
+from db import get_db
+from migrations import current_version, latest_version, migrate
+from timeline import timeline
+
+UPLOAD_FOLDER = "static/uploads"
+BACKUP_STEP_PAGES = 256        # pages copied per step (~1 MB at 4 KiB pages)
+BACKUP_STEP_PAUSE = 0.005      # seconds between steps, when writers get the lock
+MAX_RESTARTS = 20              # writes restart a stepped backup; then copy in one read
+IO_BLOCK = 1024 * 1024
+
+EXPORT_TABLES = ("users", "videos", "likes", "comments", "follows", "messages",
+                 "reports", "premium_requests")
+EXPORT_BATCH = 1000            # rows fetched per round trip
+IMPORT_BATCH = 5000            # rows per INSERT transaction
+OLDEST_IMPORTABLE = 12         # dumps before this store usernames, not user ids
+
+CONTENT_ADDRESSED = re.compile(r"[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?")
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+# --- Database ---
+def backup_database(dest, src_path=None, pages=BACKUP_STEP_PAGES, pause=BACKUP_STEP_PAUSE):
+    """Copy the live database to `dest`; returns the number of pages copied.
+
+    Between steps no lock is held, so writes and checkpoints carry on. A
+    write from another connection makes SQLite restart the copy; if that
+    keeps happening, the rest is copied under a single read transaction,
+    which in WAL mode still never blocks writers.
+    """
+    src = sqlite3.connect(src_path or db.DB_FILE)
+    tmp = dest + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    out = sqlite3.connect(tmp)
+    copied = {"total": 0, "remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if copied["remaining"] is not None and remaining >= copied["remaining"]:
+            copied["restarts"] += 1
+            if copied["restarts"] > MAX_RESTARTS:
+                raise _Restarted()
+        copied["total"], copied["remaining"] = total, remaining
+        if remaining:
+            time.sleep(pause)  # sqlite3's own sleep= only applies when a step is busy
+
+    try:
+        try:
+            src.backup(out, pages=pages, progress=progress)
+        except _Restarted:
+            src.backup(out)
+        if out.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise BackupError(f"backup of {src_path or db.DB_FILE} failed its integrity check")
+    finally:
+        out.close()
+        src.close()
+    os.replace(tmp, dest)
+    return copied["total"]
+
+
+# --- Uploads ---
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(IO_BLOCK):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def object_path(root, digest, ext):
+    return os.path.join(root, "objects", digest[:2], digest + ext)
+
+
+def snapshot_uploads(root, folder, previous=None):
+    """Store every upload under root/objects by SHA-256; returns (manifest, bytes copied).
+
+    Content-addressed uploads (<hh>/<sha256><ext>, see uploads.py) are
+    named by their hash already. Any other file is hashed, unless the
+    previous manifest saw it with the same size and mtime.
+    """
+    previous = previous or {}
+    manifest, copied = {}, 0
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [d for d in dirnames if d != ".partial"]  # uploads in progress
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, folder).replace(os.sep, "/")
+            st = os.stat(path)
+            ext = os.path.splitext(filename)[1]
+            match = CONTENT_ADDRESSED.fullmatch(name)
+            seen = previous.get(name)
+            if match:
+                digest = match.group(1)
+            elif seen and seen["size"] == st.st_size and seen["mtime"] == st.st_mtime:
+                digest = seen["sha256"]
+            else:
+                digest = file_digest(path)
+            target = object_path(root, digest, ext)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(path, target + ".tmp")
+                os.replace(target + ".tmp", target)
+                copied += st.st_size
+            manifest[name] = {"sha256": digest, "size": st.st_size, "mtime": st.st_mtime}
+    return manifest, copied
+
+
+def restore_uploads(snapshot, folder):
+    """Copy back every upload in the snapshot's manifest that `folder` lacks."""
+    root = os.path.dirname(os.path.abspath(snapshot))
+    with open(os.path.join(snapshot, "uploads.json")) as f:
+        manifest = json.load(f)
+    restored = 0
+    for name, entry in manifest.items():
+        dest = os.path.join(folder, *name.split("/"))
+        if os.path.exists(dest) and os.path.getsize(dest) == entry["size"]:
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(object_path(root, entry["sha256"], os.path.splitext(name)[1]), dest + ".tmp")
+        os.replace(dest + ".tmp", dest)
+        restored += 1
+    return restored
+
+
+# --- Snapshots ---
+def snapshots(root):
+    """Snapshot directories under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(os.path.join(root, name) for name in os.listdir(root)
+                  if os.path.exists(os.path.join(root, name, "uploads.json")))
+
+
+def snapshot(root, folder=UPLOAD_FOLDER):
+    """Back up the database and uploads into a new root/<stamp> directory."""
+    history = snapshots(root)
+    previous = {}
+    if history:
+        with open(os.path.join(history[-1], "uploads.json")) as f:
+            previous = json.load(f)
+    path = os.path.join(root, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(path)
+    pages = backup_database(os.path.join(path, "buzz.db"))
+    manifest, copied = snapshot_uploads(root, folder, previous)
+    # written last: a directory without uploads.json is an unfinished snapshot
+    with open(os.path.join(path, "uploads.json.tmp"), "w") as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(path, "uploads.json.tmp"), os.path.join(path, "uploads.json"))
+    return path, pages, len(manifest), copied
+
+
+def prune(root, keep):
+    """Delete all but the newest `keep` snapshots and the objects only they used."""
+    history = snapshots(root)
+    for path in history[:-keep] if keep else []:
+        shutil.rmtree(path)
+    wanted = set()
+    for path in snapshots(root):
+        with open(os.path.join(path, "uploads.json")) as f:
+            wanted.update(entry["sha256"] for entry in json.load(f).values())
+    removed = 0
+    for dirpath, _, filenames in os.walk(os.path.join(root, "objects")):
+        for filename in filenames:
+            if filename.split(".", 1)[0] not in wanted:
+                os.remove(os.path.join(dirpath, filename))
+                removed += 1
+    return removed
+
+
+# --- NDJSON export / import ---
+def export(out_dir, tables=EXPORT_TABLES):
+    """Write each table to out_dir/<table>.ndjson, one JSON object per row.
+
+    All tables are read in one read transaction, so the dump is consistent;
+    rows are streamed EXPORT_BATCH at a time, so memory stays constant.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    conn = get_db()
+    counts = {}
+    try:
+        conn.execute("BEGIN")
+        for table in tables:
+            cur = conn.execute(f"SELECT * FROM {table} ORDER BY rowid")
+            columns = [d[0] for d in cur.description]
+            path = os.path.join(out_dir, f"{table}.ndjson")
+            counts[table] = 0
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                while rows := cur.fetchmany(EXPORT_BATCH):
+                    for row in rows:
+                        f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                    counts[table] += len(rows)
+            os.replace(path + ".tmp", path)
+        version = current_version(conn)
+        conn.rollback()
+    finally:
+        conn.close()
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump({"schema_version": version, "exported": int(time.time()), "rows": counts}, f, indent=2)
+    return counts
+
+
+def read_batches(path, size=IMPORT_BATCH):
+    """(columns, rows) batches from an NDJSON file, `size` rows at a time."""
+    columns, rows = None, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if columns is None:
+                columns = list(record)
+            rows.append(tuple(record.get(column) for column in columns))
+            if len(rows) >= size:
+                yield columns, rows
+                rows = []
+    if rows:
+        yield columns, rows
+
+
+def import_dump(in_dir, tables=EXPORT_TABLES):
+    """Load an export into db.DB_FILE, which must have none of its rows yet.
+
+    Rows go in with executemany, IMPORT_BATCH per transaction. The search
+    index and admin counters follow through their triggers; per-video
+    comment counts are recounted, and the like buckets and timeline
+    inboxes, which are not exported, are rebuilt.
+    """
+    with open(os.path.join(in_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest["schema_version"] > latest_version():
+        raise BackupError(f"the dump has schema version {manifest['schema_version']}, "
+                          f"this code only knows up to {latest_version()}")
+    if manifest["schema_version"] < OLDEST_IMPORTABLE:
+        raise BackupError(f"the dump has schema version {manifest['schema_version']}, from before user ids; "
+                          f"import it with the code that wrote it, then migrate and export again")
+    migrate()
+    conn = get_db()
+    counts = {}
+    try:
+        for table in tables:
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                raise BackupError(f"{db.DB_FILE} already has {table}; import into a fresh database")
+        # a half-imported fresh file is thrown away anyway
+        conn.execute("PRAGMA synchronous=OFF")
+        for table in tables:
+            path = os.path.join(in_dir, f"{table}.ndjson")
+            counts[table] = 0
+            if not os.path.exists(path):
+                continue
+            for columns, rows in read_batches(path):
+                names = ", ".join(f'"{column}"' for column in columns)
+                conn.executemany(f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))})",
+                                 rows)
+                conn.commit()
+                counts[table] += len(rows)
+
+        cur = conn.cursor()
+        # the comment triggers counted on top of the exported counts
+        cur.execute("UPDATE videos SET comments = (SELECT COUNT(*) FROM comments WHERE comments.video_id = videos.id)")
+        cur.execute("DELETE FROM like_buckets")
+        cur.execute("""
+            INSERT INTO like_buckets (video_id, hour, likes)
+            SELECT video_id, created_at / 3600, COUNT(*) FROM likes
+            WHERE created_at IS NOT NULL GROUP BY video_id, created_at / 3600
+        """)
+        timeline.rebuild(cur)
+        conn.commit()
+        conn.execute(f"PRAGMA synchronous={db.SQLITE_PRAGMAS['synchronous']}")
+    finally:
+        conn.close()
+    return counts
+
+
+def _restore(snapshot_dir, db_path, folder, force):
+    if os.path.exists(db_path) and not force:
+        raise BackupError(f"{db_path} exists; stop the app and pass --force to replace it")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    shutil.copyfile(os.path.join(snapshot_dir, "buzz.db"), db_path + ".tmp")
+    os.replace(db_path + ".tmp", db_path)
+    return restore_uploads(snapshot_dir, folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up, restore, export and import BuzzTube data.")
+    parser.add_argument("--db", default=db.DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--uploads", default=UPLOAD_FOLDER, help="uploads folder (default: %(default)s)")
+    # the same options after the command; SUPPRESS keeps a value given before it
+    paths = argparse.ArgumentParser(add_help=False)
+    paths.add_argument("--db", default=argparse.SUPPRESS, help="database file (default: %s)" % db.DB_FILE)
+    paths.add_argument("--uploads", default=argparse.SUPPRESS,
+                       help="uploads folder (default: %s)" % UPLOAD_FOLDER)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, **kwargs):
+        return commands.add_parser(name, parents=[paths], **kwargs)
+
+    p = add_command("snapshot", help="online backup of the database and uploads")
+    p.add_argument("root", help="backup directory; objects/ in it is shared by all snapshots")
+    p.add_argument("--keep", type=int, help="then delete all but the newest KEEP snapshots")
+    p = add_command("restore", help="put a snapshot back (the app must be stopped)")
+    p.add_argument("snapshot", help="a <root>/<stamp> directory written by snapshot")
+    p.add_argument("--force", action="store_true", help="replace an existing database")
+    p = add_command("export", help="stream tables to NDJSON files")
+    p.add_argument("out", help="output directory")
+    p.add_argument("--tables", nargs="+", choices=EXPORT_TABLES, default=EXPORT_TABLES)
+    p = add_command("import", help="load an NDJSON export into a fresh database")
+    p.add_argument("dump", help="directory written by export")
+    p.add_argument("--tables", nargs="+", choices=EXPORT_TABLES, default=EXPORT_TABLES)
+    args = parser.parse_args()
+    db.DB_FILE = args.db
+
+    try:
+        if args.command == "snapshot":
+            started = time.time()
+            path, pages, files, copied = snapshot(args.root, args.uploads)
+            print(f"✅ Snapshot {path}: {pages} database pages, {files} uploads "
+                  f"({copied / 1024 ** 2:.1f} MB new) in {time.time() - started:.1f}s")
+            if args.keep:
+                print(f"✅ Pruned to {args.keep} snapshots, {prune(args.root, args.keep)} objects removed")
+        elif args.command == "restore":
+            restored = _restore(args.snapshot, args.db, args.uploads, args.force)
+            print(f"✅ Restored {args.db} and {restored} uploads from {args.snapshot}")
+        elif args.command == "export":
+            counts = export(args.out, args.tables)
+            print(f"✅ Exported {sum(counts.values())} rows to {args.out}: {counts}")
+        else:
+            counts = import_dump(args.dump, args.tables)
+            print(f"✅ Imported {sum(counts.values())} rows into {args.db}: {counts}")
+    except BackupError as e:
+        parser.exit(1, f"❌ {e}\n")
@@ -0,0 +1,78 @@
+"""BuzzTube benchmarks.
+
+    python -m bench.seed --out bench/seed.db          # synthetic database
+    python -m bench.micro --db bench/seed.db          # routes via the Flask test client
+    python -m bench.load --db bench/seed.db           # gunicorn + multi-process clients
+    python -m bench.compare OLD.json NEW.json         # diff two saved runs
+
+Every run writes a JSON file to bench/results/ so runs can be compared
+before a change is deployed.
+"""
+import json, os, platform, subprocess, sys, time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO, "bench", "results")
+
+# the benchmarks chdir into a scratch copy of the database
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies_ms, elapsed, errors=0):
+    values = sorted(latencies_ms)
+    return {
+        "n": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p90_ms": percentile(values, 90),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else None,
+        "rps": round(len(values) / elapsed, 1) if elapsed else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(kind, params, results, out=None):
+    """Write a run to bench/results/<kind>-<time>-<rev>.json; returns the path."""
+    revision = git_revision()
+    run = {
+        "kind": kind,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{revision or 'nogit'}.json")
+    with open(out, "w") as f:
+        json.dump(run, f, indent=2)
+    return out
+
+
+def print_table(results):
+    print(f"{'benchmark':<22}{'n':>7}{'err':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['n']:>7}{r['errors']:>5}"
+              f"{fmt_ms(r['p50_ms']):>10}{fmt_ms(r['p90_ms']):>10}{fmt_ms(r['p99_ms']):>10}{r['rps'] or 0:>10}")
+
+
+def fmt_ms(value):
+    return "-" if value is None else f"{value:.2f}"
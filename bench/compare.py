@@ -0,0 +1,37 @@
+"""Compare two saved benchmark runs, benchmark by benchmark."""
+import argparse, json
+import bench
+
+METRICS = ("p50_ms", "p99_ms", "rps")
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old, new):
+    names = list(old["results"]) + [n for n in new["results"] if n not in old["results"]]
+    print(f"old: {old['kind']} {old['started']} {old.get('revision')}")
+    print(f"new: {new['kind']} {new['started']} {new.get('revision')}")
+    print(f"{'benchmark':<22}" + "".join(f"{metric:>26}" for metric in METRICS))
+    for name in names:
+        a, b = old["results"].get(name, {}), new["results"].get(name, {})
+        cells = []
+        for metric in METRICS:
+            x, y = a.get(metric), b.get(metric)
+            cells.append(f"{bench.fmt_ms(x)} → {bench.fmt_ms(y)} ({change(x, y)})")
+        print(f"{name:<22}" + "".join(f"{cell:>26}" for cell in cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old", help="baseline results JSON")
+    parser.add_argument("new", help="results JSON to compare against it")
+    args = parser.parse_args()
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    compare(old, new)
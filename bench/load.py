@@ -0,0 +1,203 @@
+"""Closed-loop load test against gunicorn.
+
+Starts gunicorn (gthread, as in the Procfile) on a scratch copy of the
+seeded database and logs each client process in as its own seeded user.
+Every client sends requests from a weighted route mix back to back for
+--duration seconds. Clients revalidate pages with If-None-Match like a
+browser does; --no-etag turns that off. All clients share 127.0.0.1, so
+429s from the per-IP rate limits are counted apart from errors.
+"""
+import argparse, http.client, multiprocessing, os, random, shutil, sqlite3, subprocess, sys
+import tempfile, time, urllib.parse
+from http.cookies import SimpleCookie
+import bench
+
+MIX = {
+    "home": 30,
+    "video": 30,
+    "like_video": 10,
+    "leaderboard": 10,
+    "publichat": 5,
+    "search": 5,
+    "following": 5,
+    "api_feed": 5,
+}
+
+
+def request_for(route, rng, max_video):
+    """(method, path) for one request to `route`."""
+    if route == "home":
+        return "GET", "/"
+    if route == "video":
+        # skewed towards low ids so some pages are hot, like real traffic
+        return "GET", f"/video/{min(max_video, int(rng.paretovariate(1.2)))}"
+    if route == "like_video":
+        return "POST", f"/like/{rng.randint(1, max_video)}"
+    if route == "leaderboard":
+        return "GET", "/leaderboard?window=" + rng.choice(("all", "24h", "7d"))
+    if route == "publichat":
+        return "GET", "/publichat"
+    if route == "search":
+        return "GET", "/search?q=" + urllib.parse.quote(rng.choice(("neon", "synth par", "robot city")))
+    if route == "following":
+        return "GET", "/following"
+    if route == "api_feed":
+        return "GET", f"/api/feed?before={rng.randint(1, max_video + 1)}"
+    raise ValueError(route)
+
+
+def login(conn, username):
+    body = urllib.parse.urlencode({"email": f"{username}@example.com", "username": username, "password": "pw"})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookie = SimpleCookie(response.getheader("Set-Cookie") or "")
+    if "session" not in cookie:
+        raise RuntimeError(f"could not log in as {username} (HTTP {response.status})")
+    return f"session={cookie['session'].value}"
+
+
+def client(task):
+    """One client process: log in, wait for the start, loop until the deadline."""
+    index, host, port, username, max_video, start_at, duration, use_etags, seed = task
+    rng = random.Random(seed + index)
+    routes, weights = list(MIX), list(MIX.values())
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    # the login cookie is kept for the whole run; later Set-Cookies only
+    # carry flash messages
+    cookie = login(conn, username)
+    latencies = {route: [] for route in routes}
+    errors = dict.fromkeys(routes, 0)
+    not_modified = dict.fromkeys(routes, 0)
+    limited = dict.fromkeys(routes, 0)
+    etags = {}
+
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        route = rng.choices(routes, weights)[0]
+        method, path = request_for(route, rng, max_video)
+        headers = {"Cookie": cookie}
+        if use_etags and method == "GET" and path in etags:
+            headers["If-None-Match"] = etags[path]
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors[route] += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies[route].append((time.perf_counter() - t0) * 1000)
+        if response.status == 429:
+            limited[route] += 1
+        elif response.status >= 400:
+            errors[route] += 1
+        elif response.status == 304:
+            not_modified[route] += 1
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    return latencies, errors, not_modified, limited
+
+
+def start_server(workdir, port, workers, threads):
+    command = [sys.executable, "-m", "gunicorn", "app:app",
+               "--chdir", workdir, "--pythonpath", bench.REPO,
+               "--bind", f"127.0.0.1:{port}", "--worker-class", "gthread",
+               "--workers", str(workers), "--threads", str(threads), "--log-level", "warning"]
+    return subprocess.Popen(command)
+
+
+def wait_ready(host, port, server=None, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not come up within {timeout}s")
+
+
+def run(host, port, db_path, clients, duration, use_etags, seed):
+    conn = sqlite3.connect(db_path)
+    max_video = conn.execute("SELECT MAX(id) FROM videos").fetchone()[0] or 1
+    users = [row[0] for row in conn.execute(
+        "SELECT username FROM users WHERE username LIKE 'user%' ORDER BY id LIMIT ?", (clients,))]
+    conn.close()
+    if len(users) < clients:
+        raise SystemExit(f"the database has only {len(users)} seeded users for {clients} clients")
+
+    start_at = time.time() + 2 + clients * 0.05  # everyone logs in first
+    tasks = [(i, host, port, users[i], max_video, start_at, duration, use_etags, seed)
+             for i in range(clients)]
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        outcomes = pool.map(client, tasks)
+
+    results, everything = {}, []
+    total_errors = 0
+    for route in MIX:
+        latencies = [ms for lat, _, _, _ in outcomes for ms in lat[route]]
+        errors = sum(err[route] for _, err, _, _ in outcomes)
+        results[route] = bench.summarize(latencies, duration, errors)
+        results[route]["not_modified"] = sum(nm[route] for _, _, nm, _ in outcomes)
+        results[route]["rate_limited"] = sum(rl[route] for _, _, _, rl in outcomes)
+        everything.extend(latencies)
+        total_errors += errors
+    totals = {key: sum(r[key] for r in results.values()) for key in ("not_modified", "rate_limited")}
+    results["all"] = bench.summarize(everything, duration, total_errors)
+    results["all"].update(totals)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test BuzzTube under gunicorn.")
+    parser.add_argument("--db", default=os.path.join(bench.REPO, "bench", "seed.db"),
+                        help="seeded database, see bench.seed (default: %(default)s)")
+    parser.add_argument("--url", help="test an already running server instead, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--port", type=int, default=8123, help="port for the spawned gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client processes")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--no-etag", action="store_true", help="never send If-None-Match")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request mix")
+    parser.add_argument("--out", help="results file (default: bench/results/load-<time>-<rev>.json)")
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.db)
+    if not os.path.exists(source):
+        parser.error(f"{args.db} does not exist; create it with: python -m bench.seed --out {args.db}")
+
+    server, workdir = None, None
+    if args.url:
+        target = urllib.parse.urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        workdir = tempfile.mkdtemp(prefix="buzz-load-")
+        shutil.copy(source, os.path.join(workdir, "buzz.db"))
+        host, port = "127.0.0.1", args.port
+        server = start_server(workdir, port, args.workers, args.threads)
+    try:
+        wait_ready(host, port, server)
+        results = run(host, port, source, args.clients, args.duration, not args.no_etag, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    bench.print_table(results)
+    params = {"db": source, "url": args.url, "workers": args.workers, "threads": args.threads,
+              "clients": args.clients, "duration": args.duration, "etags": not args.no_etag,
+              "seed": args.seed}
+    print(f"✅ Saved {bench.save_results('load', params, results, args.out)}")
@@ -0,0 +1,161 @@
+"""Per-route microbenchmarks through the Flask test client.
+
+Each run works on a scratch copy of the seeded database, so write routes
+(likes, uploads) never touch the original and runs stay comparable.
+"""
+import argparse, os, random, shutil, sqlite3, tempfile, time
+import bench
+
+BENCHMARKS = {}
+UPLOAD_SIZE = 64 * 1024
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class Context:
+    def __init__(self, app, db_path, seed):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(db_path)
+        self.max_video = conn.execute("SELECT MAX(id) FROM videos").fetchone()[0] or 1
+        conn.close()
+        self.user = app.test_client()
+        self.admin = app.test_client()
+        self.etags = {}
+        with self.user.session_transaction() as s:
+            s["user"], s["login_time"] = "user1", int(time.time())
+        with self.admin.session_transaction() as s:
+            s["user"], s["admin"], s["login_time"] = "admin", True, int(time.time())
+
+    def video_id(self):
+        return self.rng.randint(1, self.max_video)
+
+    def revalidate(self, client, path):
+        """GET with the ETag from the previous response to `path`."""
+        headers = {"If-None-Match": self.etags[path]} if path in self.etags else {}
+        response = client.get(path, headers=headers)
+        if response.headers.get("ETag"):
+            self.etags[path] = response.headers["ETag"]
+        return response
+
+
+@benchmark("home")
+def home(ctx):
+    return ctx.user.get("/")
+
+
+@benchmark("home_304")
+def home_304(ctx):
+    return ctx.revalidate(ctx.user, "/")
+
+
+@benchmark("video")
+def video(ctx):
+    return ctx.user.get(f"/video/{ctx.video_id()}")
+
+
+@benchmark("video_304")
+def video_304(ctx):
+    return ctx.revalidate(ctx.user, f"/video/{ctx.rng.randint(1, min(ctx.max_video, 20))}")
+
+
+@benchmark("like_video")
+def like_video(ctx):
+    return ctx.user.post(f"/like/{ctx.video_id()}")
+
+
+@benchmark("publichat")
+def publichat(ctx):
+    return ctx.user.get("/publichat")
+
+
+@benchmark("leaderboard")
+def leaderboard(ctx):
+    return ctx.user.get("/leaderboard?window=" + ctx.rng.choice(("all", "24h", "7d")))
+
+
+@benchmark("search")
+def search(ctx):
+    return ctx.user.get("/search?q=" + ctx.rng.choice(("neon", "synth par", "robot city")))
+
+
+@benchmark("admin_dashboard")
+def admin_dashboard(ctx):
+    return ctx.admin.get("/admin")
+
+
+@benchmark("admin_api")
+def admin_api(ctx):
+    return ctx.admin.get("/admin/api/" + ctx.rng.choice(("videos", "comments", "users", "reports")))
+
+
+@benchmark("upload")
+def upload(ctx):
+    # the chunked protocol upload.html uses; fresh bytes so nothing dedups
+    data = ctx.rng.randbytes(UPLOAD_SIZE)
+    response = ctx.user.post("/upload/init", json={"title": "bench upload", "filename": "bench.mp4",
+                                                   "size": len(data)})
+    upload_id = response.json["upload_id"]
+    ctx.user.put(f"/upload/{upload_id}/0", data=data)
+    return ctx.user.post(f"/upload/{upload_id}/finalize")
+
+
+def run(app, db_path, names, iterations, warmup, seed):
+    ctx = Context(app, db_path, seed)
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]
+        for _ in range(warmup):
+            fn(ctx)
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            response = fn(ctx)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = bench.summarize(latencies, time.perf_counter() - started, errors)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark BuzzTube routes through the Flask test client.")
+    parser.add_argument("--db", default=os.path.join(bench.REPO, "bench", "seed.db"),
+                        help="seeded database, see bench.seed (default: %(default)s)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed requests per benchmark")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per benchmark")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run just these benchmarks")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for ids and payloads")
+    parser.add_argument("--out", help="results file (default: bench/results/micro-<time>-<rev>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep rate limiting on (off by default: one client hammers each route)")
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.db)
+    if not os.path.exists(source):
+        parser.error(f"{args.db} does not exist; create it with: python -m bench.seed --out {args.db}")
+    out = os.path.abspath(args.out) if args.out else None
+
+    workdir = tempfile.mkdtemp(prefix="buzz-bench-")
+    shutil.copy(source, os.path.join(workdir, "buzz.db"))
+    os.chdir(workdir)  # buzz.db and static/uploads are relative to the cwd
+    from app import app
+    from ratelimit import limiter
+    limiter.enabled = args.rate_limits
+
+    names = args.only or list(BENCHMARKS)
+    results = run(app, "buzz.db", names, args.iterations, args.warmup, args.seed)
+    bench.print_table(results)
+    params = {"db": source, "iterations": args.iterations, "warmup": args.warmup, "seed": args.seed,
+              "rate_limits": args.rate_limits}
+    print(f"✅ Saved {bench.save_results('micro', params, results, out)}")
+    if args.keep:
+        print(f"Scratch directory: {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
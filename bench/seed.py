@@ -0,0 +1,162 @@
+"""Generate a synthetic buzz.db for the benchmarks.
+
+The same --seed always produces the same database. Every user's password
+is "pw" and their email is <username>@example.com; "admin" / "admin" is the
+admin account. Derived columns (likes, followers, like_buckets, inbox) are
+filled in the way the app would have left them.
+"""
+import argparse, os, random, time
+import bench
+import db
+from db import get_db
+from migrations import migrate
+from timeline import FANOUT_THRESHOLD
+
+DEFAULTS = {
+    "users": 1000,
+    "videos": 5000,
+    "likes": 50000,
+    "comments": 20000,
+    "follows": 10000,
+    "messages": 2000,
+    "blocked_ips": 100,
+    "reports": 500,
+    "premium_requests": 200,
+}
+PASSWORD = "pw"
+LIKE_SPREAD = 30 * 24 * 3600   # likes are spread over the last 30 days
+
+WORDS = ("neon", "buzz", "cat", "skate", "retro", "synth", "lan", "party", "glitch", "drone",
+         "speedrun", "tutorial", "remix", "vlog", "sunset", "arcade", "pixel", "robot", "night", "city")
+
+
+def username(i):
+    return f"user{i}"
+
+
+def user_id(i):
+    return i + 1  # "admin" is inserted first
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def unique_pairs(rng, count, make):
+    """Up to `count` distinct pairs from make(); gives up after many repeats."""
+    pairs, misses = set(), 0
+    while len(pairs) < count and misses < count * 10 + 100:
+        pair = make()
+        if pair is None or pair in pairs:
+            misses += 1
+            continue
+        pairs.add(pair)
+    return sorted(pairs)
+
+
+def seed(path, seed=42, **counts):
+    """Create a fresh database at `path` with the given row counts."""
+    counts = {**DEFAULTS, **{k: v for k, v in counts.items() if v is not None}}
+    rng = random.Random(seed)
+    now = int(time.time())
+    n_users, n_videos = max(2, counts["users"]), counts["videos"]
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.DB_FILE = path
+    migrate()
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    cur.execute("INSERT INTO users (email, username, password, premium, ip_address) VALUES (?, ?, ?, 1, ?)",
+                ("admin@example.com", "admin", "admin", "127.0.0.1"))
+    cur.executemany("INSERT INTO users (email, username, password, premium, ip_address) VALUES (?, ?, ?, ?, ?)",
+                    [(f"{username(i)}@example.com", username(i), PASSWORD, 1, f"10.0.{i // 256 % 256}.{i % 256}")
+                     for i in range(1, n_users + 1)])
+
+    uploaders = [rng.randint(1, n_users) for _ in range(n_videos)]
+    cur.executemany("""
+        INSERT INTO videos (title, uploader_id, filepath, duration, width, height, views, unique_views)
+        VALUES (?, ?, ?, ?, 1280, 720, ?, ?)
+    """, [(f"{sentence(rng, 3)} {i}", user_id(uploader), f"/media/seed/{i}.mp4", rng.randint(5, 900),
+           views, int(views * 0.6))
+          for i, uploader in enumerate(uploaders, 1)
+          for views in [rng.randint(0, 5000)]])
+
+    likes = unique_pairs(rng, counts["likes"], lambda: _like(rng, n_videos, n_users, uploaders))
+    cur.executemany("INSERT INTO likes (video_id, user_id, created_at) VALUES (?, ?, ?)",
+                    [(video_id, user_id(user), now - rng.randint(0, LIKE_SPREAD)) for video_id, user in likes])
+
+    follows = unique_pairs(rng, counts["follows"], lambda: _follow(rng, n_users))
+    cur.executemany("INSERT INTO follows (follower_id, following_id) VALUES (?, ?)",
+                    [(user_id(a), user_id(b)) for a, b in follows])
+
+    if n_videos:
+        cur.executemany("INSERT INTO comments (video_id, user_id, text) VALUES (?, ?, ?)",
+                        [(rng.randint(1, n_videos), user_id(rng.randint(1, n_users)), sentence(rng, 8))
+                         for _ in range(counts["comments"])])
+    cur.executemany("INSERT INTO messages (user_id, message) VALUES (?, ?)",
+                    [(user_id(rng.randint(1, n_users)), sentence(rng, 6)) for _ in range(counts["messages"])])
+    # 198.18.0.0/15 is reserved for benchmarking, so no real client is blocked
+    cur.executemany("INSERT INTO blocked_ips (ip_address) VALUES (?)",
+                    [(f"198.{18 + i // 65536 % 2}.{i // 256 % 256}.{i % 256}",)
+                     for i in range(counts["blocked_ips"])])
+    cur.executemany("INSERT INTO reports (reporter, reported_user, reason, status) VALUES (?, ?, ?, ?)",
+                    [(username(rng.randint(1, n_users)), username(rng.randint(1, n_users)), sentence(rng, 4),
+                      rng.choice(("pending", "reviewed"))) for _ in range(counts["reports"])])
+    cur.executemany("INSERT INTO premium_requests (user_id, status) VALUES (?, ?)",
+                    [(user_id(rng.randint(1, n_users)), rng.choice(("pending", "granted", "rejected")))
+                     for _ in range(counts["premium_requests"])])
+
+    # denormalised columns, as the flushers and timeline would have left them
+    cur.execute("UPDATE videos SET likes = (SELECT COUNT(*) FROM likes WHERE likes.video_id = videos.id)")
+    cur.execute("""
+        INSERT INTO like_buckets (video_id, hour, likes)
+        SELECT video_id, created_at / 3600, COUNT(*) FROM likes GROUP BY video_id, created_at / 3600
+    """)
+    cur.execute("UPDATE users SET followers = (SELECT COUNT(*) FROM follows WHERE following_id = users.id)")
+    cur.execute("""
+        INSERT OR IGNORE INTO inbox (user_id, video_id)
+        SELECT follows.follower_id, videos.id
+        FROM follows
+        JOIN users ON users.id = follows.following_id
+        JOIN videos ON videos.uploader_id = follows.following_id
+        WHERE users.followers < ?
+    """, (FANOUT_THRESHOLD,))
+    conn.commit()
+    # fold the WAL into the main file so copying buzz.db alone is enough
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    db.close_pool()
+    return counts
+
+
+def _like(rng, n_videos, n_users, uploaders):
+    if not n_videos:
+        return None
+    video_id, user = rng.randint(1, n_videos), rng.randint(1, n_users)
+    return None if uploaders[video_id - 1] == user else (video_id, user)
+
+
+def _follow(rng, n_users):
+    a, b = rng.randint(1, n_users), rng.randint(1, n_users)
+    return None if a == b else (a, b)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic BuzzTube database.")
+    parser.add_argument("--out", default=os.path.join(bench.REPO, "bench", "seed.db"),
+                        help="database file to create, replaced if it exists (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default: %(default)s)")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name,
+                            help=f"number of {name.replace('_', ' ')} (default: {default})")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = seed(os.path.abspath(args.out), args.seed,
+                  **{name: getattr(args, name) for name in DEFAULTS})
+    print(f"✅ Seeded {args.out} in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{n} {name}" for name, n in counts.items()))
@@ -0,0 +1,118 @@
+import hashlib, os, threading, time
+from collections import OrderedDict
+from flask import Response, make_response, request, session
+from db import get_reader, read_versions
+from assets import assets
+
+FRAGMENT_CACHE_SIZE = 4096
+VIEW_COUNT_TTL = 60        # seconds a cached page or card may show old view counts
+
+# data_versions rows behind the read routes. Writers bump them in the same
+# transaction as the change; readers turn them into cache keys and ETags.
+FEED_VERSION = "videos"    # which videos exist (uploads, deletes, renames)
+
+
+def video_version(video_id):
+    """A video's row, like and comment counts, and comments (views: views_epoch())."""
+    return f"video:{video_id}"
+
+
+def user_version(user_id):
+    """A user's name, premium flag, uploads and follows."""
+    return f"user:{user_id}"
+
+
+def views_epoch():
+    """Part of the key of HTML that shows view counts.
+
+    Views are flushed every few seconds on a watched video (see views.py), so
+    they do not bump video_version; pages and cards show them as of this
+    epoch, which moves every VIEW_COUNT_TTL seconds.
+    """
+    return int(time.time()) // VIEW_COUNT_TTL
+
+
+def versions(names):
+    conn = get_reader()
+    found = read_versions(conn.cursor(), names)
+    conn.close()
+    return found
+
+
+def _template_stamp():
+    # ETags must change when a deploy changes the templates
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(folder)):
+        st = os.stat(os.path.join(folder, name))
+        digest.update(f"{name}:{st.st_mtime_ns}:{st.st_size};".encode())
+    return digest.hexdigest()[:8]
+
+
+BUILD = _template_stamp()
+
+
+class FragmentCache:
+    """Bounded LRU of rendered HTML fragments.
+
+    Keys carry the data versions the fragment was rendered from, so a bump
+    makes the old entry unreachable and it ages out; nothing is ever
+    invalidated explicitly, and workers never serve each other's stale HTML.
+    """
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        return self.get_many([key], lambda keys: {key: render()})[key]
+
+    def get_many(self, keys, render_missing):
+        """{key: fragment}; render_missing(keys) renders all misses in one go."""
+        found, missing = {}, []
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+                else:
+                    missing.append(key)
+        if missing:
+            rendered = render_missing(missing)
+            with self.lock:
+                for key, value in rendered.items():
+                    self.entries[key] = value
+                    self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            found.update(rendered)
+        return found
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+fragments = FragmentCache()
+
+
+def etag(*parts):
+    # pages link fingerprinted bundles, so a rebuilt bundle is a new page too
+    return hashlib.sha1(repr((BUILD, assets.version()) + parts).encode()).hexdigest()
+
+
+def page_etag(*parts):
+    """ETag for a page that extends base.html, which shows who is logged in."""
+    return etag(session.get("user"), session.get("admin"), *parts)
+
+
+def conditional(tag, render):
+    """304 if the client already has `tag`, else render() with the ETag set."""
+    if request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(tag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
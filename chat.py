@@ -0,0 +1,175 @@
+import json, logging, os, random, threading, time
+from collections import deque
+from db import get_reader, VersionWatcher
+from writer import writer, busy
+from accounts import usernames
+
+RING_SIZE = 200          # recent messages kept in memory per worker
+POLL_INTERVAL = 0.5      # seconds between checks for other workers' messages
+KEEPALIVE = 15           # seconds between SSE comments on an idle stream
+# Each open stream holds one gunicorn thread (Procfile: --threads 8), so a
+# worker serves at most MAX_STREAMS of them and ends each after
+# STREAM_LIFETIME; EventSource reconnects on its own with Last-Event-ID.
+MAX_STREAMS = 4
+STREAM_LIFETIME = 120    # seconds
+BUSY_RETRY = (5, 15)     # seconds a refused client waits before reconnecting
+
+log = logging.getLogger("buzz.chat")
+
+
+class ChatHub:
+    """Recent public chat messages in a ring buffer, pushed to subscribers.
+
+    Messages are written to the messages table; every worker picks up new
+    rows (its own and other workers') with one indexed `id > last_id` query
+    per POLL_INTERVAL while anyone is subscribed, appends them to the ring
+    and wakes its streams. Because ids are assigned under SQLite's single
+    writer lock, the ring is always in id order, which is what Last-Event-ID
+    resume relies on. Deleting a message bumps the "messages" data version,
+    which makes every worker rebuild its ring; so does a rename, because
+    ring entries carry the poster's name (see accounts.Usernames).
+    """
+
+    def __init__(self, size=RING_SIZE, interval=POLL_INTERVAL, max_streams=MAX_STREAMS,
+                 lifetime=STREAM_LIFETIME):
+        self.ring = deque(maxlen=size)
+        self.max_streams = max_streams
+        self.lifetime = lifetime
+        self.last_id = None
+        self.interval = interval
+        self.polled_at = 0.0
+        self.cond = threading.Condition()
+        self.poll_lock = threading.Lock()
+        self.subscribers = 0
+        self.wakeup = threading.Event()
+        self.watcher = VersionWatcher("messages")
+        self.pid = None
+
+    # --- Reading from SQLite ---
+    def poll(self):
+        """Append rows newer than last_id to the ring and wake subscribers."""
+        with self.poll_lock:
+            self.polled_at = time.monotonic()
+            reload = self.watcher.changed() or self.last_id is None
+            conn = get_reader()
+            cur = conn.cursor()
+            if reload:
+                cur.execute("SELECT id, user_id, message FROM messages ORDER BY id DESC LIMIT ?",
+                            (self.ring.maxlen,))
+                rows = cur.fetchall()[::-1]
+            else:
+                cur.execute("SELECT id, user_id, message FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                            (self.last_id, self.ring.maxlen))
+                rows = cur.fetchall()
+            conn.close()
+            rows = with_names(rows)
+            if not rows and not reload:
+                return
+            with self.cond:
+                if reload:
+                    self.ring.clear()
+                    self.last_id = 0
+                for row in rows:
+                    self.ring.append(row)
+                    self.last_id = row["id"]
+                self.cond.notify_all()
+
+    def fresh(self):
+        self._ensure_poller()
+        if time.monotonic() - self.polled_at >= self.interval:
+            self.poll()
+
+    def _ensure_poller(self):
+        if self.pid == os.getpid():
+            return
+        with self.poll_lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name="chat-poller", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if not self.subscribers:
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                if not busy(e):  # a busy database is retried quietly next tick
+                    log.exception("chat poll failed")
+
+    # --- API ---
+    def post(self, user_id, message):
+        message_id = writer.write(lambda cur: cur.execute(
+            "INSERT INTO messages (user_id, message, created_at) VALUES (?, ?, ?)",
+            (user_id, message, int(time.time()))).lastrowid)
+        self._ensure_poller()
+        self.wakeup.set()  # deliver to this worker's streams right away
+        return message_id
+
+    def recent(self, limit=20):
+        """Newest-first list of the last `limit` messages."""
+        self.fresh()
+        with self.cond:
+            return list(self.ring)[-limit:][::-1]
+
+    def since(self, last_id):
+        """Messages after `last_id`, from the ring or (if it fell out) SQLite."""
+        with self.cond:
+            if self.ring and self.ring[0]["id"] <= last_id + 1:
+                return [m for m in self.ring if m["id"] > last_id]
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("SELECT id, user_id, message FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.ring.maxlen))
+        rows = cur.fetchall()
+        conn.close()
+        return with_names(rows)
+
+    def stream(self, last_id=None):
+        """Server-Sent Events for every message after `last_id`, for up to `lifetime` seconds.
+
+        Past max_streams open streams the client is only told to come back
+        later (a non-200 answer would make EventSource give up for good).
+        """
+        with self.cond:
+            full = self.subscribers >= self.max_streams
+            if not full:
+                self.subscribers += 1
+        if full:
+            yield f"retry: {round(random.uniform(*BUSY_RETRY) * 1000)}\n\n"
+            return
+        try:
+            self.fresh()
+            if last_id is None:
+                last_id = self.last_id or 0
+            yield "retry: 3000\n\n"
+            ends_at = time.monotonic() + self.lifetime
+            while True:
+                for m in self.since(last_id):
+                    last_id = m["id"]
+                    yield f"id: {m['id']}\ndata: {json.dumps(m)}\n\n"
+                left = ends_at - time.monotonic()
+                if left <= 0:
+                    return  # frees the thread; the browser reconnects after `retry`
+                with self.cond:
+                    if (self.last_id or 0) <= last_id:
+                        self.cond.wait(min(KEEPALIVE, left))
+                    idle = (self.last_id or 0) <= last_id
+                if idle:
+                    yield ": keepalive\n\n"
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+
+
+def with_names(rows):
+    """Message dicts as the templates and the stream expect them: id, user, message."""
+    names = usernames.get_many([row["user_id"] for row in rows])
+    return [{"id": row["id"], "user": names.get(row["user_id"]), "message": row["message"]}
+            for row in rows]
+
+
+chat = ChatHub()
@@ -0,0 +1,297 @@
+import sqlite3, os, threading, time
+from flask import g
+
+# --- Database settings ---
+DB_FILE = "buzz.db"
+
+# Per-connection tuning. cache_size is negative => KiB, mmap_size is bytes.
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",      # safe with WAL, avoids an fsync per commit
+    "cache_size": -16000,         # ~16 MB page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,         # wait for the write lock instead of failing
+    "foreign_keys": "ON",
+}
+STATEMENT_CACHE_SIZE = 256        # prepared statements kept per connection
+MAX_IDLE_PER_THREAD = 4
+
+
+# Called as hook(sql, params, seconds, conn) once per statement; see metrics.py.
+# params is None for executemany(). With no hooks, statements run untimed.
+statement_hooks = []
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's execute + fetch time to statement_hooks.
+
+    A statement is reported once its rows are fetched (fetchone/fetchmany/
+    fetchall, or iteration runs out), when the cursor runs the next
+    statement or is closed, or right away if it returns no rows.
+    """
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        if not statement_hooks:
+            return super().execute(sql, parameters)
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, parameters, time.perf_counter() - started]
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        if not statement_hooks:
+            return super().executemany(sql, seq_of_parameters)
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, None, time.perf_counter() - started]
+            self._finish()
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        pending = self._pending
+        if pending is None:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            pending[2] += time.perf_counter() - started
+            self._finish()
+            raise
+        pending[2] += time.perf_counter() - started
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _fetch(self, fetch, *args):
+        if self._pending is None:
+            return fetch(*args)
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._pending[2] += time.perf_counter() - started
+            self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            for hook in statement_hooks:
+                hook(pending[0], pending[1], pending[2], self.connection)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the thread's pool.
+
+    Routes keep calling conn.close() as before; the underlying handle (and its
+    prepared-statement cache) stays open for the next get_db() on this thread.
+    """
+    _path = None
+    _readonly = False
+    _released = True
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() would bypass cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._released:
+            return
+        if self.in_transaction:
+            self.rollback()
+        self._released = True
+        _release(self)
+
+    def really_close(self):
+        self._released = True
+        sqlite3.Connection.close(self)
+
+
+_local = threading.local()
+_wal_lock = threading.Lock()
+_wal_ready = set()
+
+
+def _idle_connections(readonly=False):
+    # A forked gunicorn worker must never reuse the master's handles.
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.idle = []
+        _local.idle_readonly = []
+    return _local.idle_readonly if readonly else _local.idle
+
+
+def _connect(path, readonly=False):
+    with _wal_lock:
+        if path not in _wal_ready:
+            conn = sqlite3.connect(path)
+            # only takes effect on a new, empty file, so it must come before
+            # WAL initialises it; an older file needs one offline VACUUM
+            # (python maintenance.py --enable-incremental-vacuum)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # journal_mode is stored in the database file, once is enough
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.close()
+            _wal_ready.add(path)
+    if readonly:
+        # mode=ro: SQLite refuses every write, so the connection never takes the write lock
+        conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, factory=PooledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(path, factory=PooledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    conn._path = path
+    conn._readonly = readonly
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def _release(conn):
+    tracked = _tracked()
+    if tracked is not None and conn in tracked:
+        tracked.remove(conn)
+    idle = _idle_connections(conn._readonly)
+    if conn._path == DB_FILE and len(idle) < MAX_IDLE_PER_THREAD:
+        idle.append(conn)
+    else:
+        conn.really_close()
+
+
+def _tracked():
+    try:
+        return g.setdefault("_db_conns", [])
+    except RuntimeError:  # outside an app context
+        return None
+
+
+def get_db(readonly=False):
+    """Return a connection from this thread's pool (or open a new one).
+
+    Request handlers write through writer.write() (see writer.py) and read
+    with get_reader(); a read-write get_db() is for the writer thread,
+    background jobs and scripts.
+    """
+    idle = _idle_connections(readonly)
+    conn = None
+    while idle and conn is None:
+        conn = idle.pop()
+        if conn._path != DB_FILE:  # DB_FILE was repointed (scripts, benchmarks)
+            conn.really_close()
+            conn = None
+    if conn is None:
+        conn = _connect(DB_FILE, readonly)
+    conn._released = False
+    tracked = _tracked()
+    if tracked is not None:
+        tracked.append(conn)
+    return conn
+
+
+def get_reader():
+    """A pooled read-only (mode=ro) connection: never blocks or is blocked by writers."""
+    return get_db(readonly=True)
+
+
+def close_pool():
+    """Close every idle connection held by the current thread."""
+    for readonly in (False, True):
+        idle = _idle_connections(readonly)
+        while idle:
+            idle.pop().really_close()
+
+
+def init_app(app):
+    # Connections a route forgot to close (e.g. on an exception) go back
+    # to the pool when the request ends.
+    @app.teardown_appcontext
+    def release_db(exc):
+        for conn in list(g.pop("_db_conns", [])):
+            conn.close()
+
+
+# --- Data versions ---
+def bump_version(cur, name):
+    """Increment a row in data_versions inside the caller's transaction."""
+    cur.execute("""
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
+
+
+def bump_versions(cur, names):
+    """bump_version() for many rows in one executemany."""
+    cur.executemany("""
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, [(name,) for name in names])
+
+
+def read_version(cur, name):
+    cur.execute("SELECT version FROM data_versions WHERE name=?", (name,))
+    row = cur.fetchone()
+    return row["version"] if row else 0
+
+
+def read_versions(cur, names):
+    """{name: version} for many rows; missing rows read as 0."""
+    names = list(dict.fromkeys(names))
+    versions = dict.fromkeys(names, 0)
+    for i in range(0, len(names), 500):  # stay under SQLITE_MAX_VARIABLE_NUMBER
+        chunk = names[i:i + 500]
+        cur.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join('?' * len(chunk))})",
+                    chunk)
+        versions.update((row["name"], row["version"]) for row in cur.fetchall())
+    return versions
+
+
+class VersionWatcher:
+    """Polls one data_versions row at most every `interval` seconds.
+
+    changed() is True on the first call and whenever another worker (or this
+    one) bumped the version since the last poll; between polls it is free.
+    """
+
+    def __init__(self, name, interval=1.0):
+        self.name = name
+        self.interval = interval
+        self.version = None
+        self.checked_at = 0.0
+
+    def changed(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.interval:
+            return False
+        self.checked_at = now
+        conn = get_reader()
+        version = read_version(conn.cursor(), self.name)
+        conn.close()
+        if version != self.version:
+            self.version = version
+            return True
+        return False
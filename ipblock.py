@@ -0,0 +1,93 @@
+import ipaddress, bisect
+from db import get_reader, VersionWatcher
+
+# How often (seconds) a worker checks whether another worker changed the list.
+CHECK_INTERVAL = 1.0
+
+
+def parse_block_entry(text):
+    """Normalise an admin-entered IP or CIDR range, or return None if invalid."""
+    try:
+        net = ipaddress.ip_network(text.strip(), strict=False)
+    except ValueError:
+        return None
+    if net.num_addresses == 1:
+        return str(net.network_address)
+    return str(net)
+
+
+class BlockedIPIndex:
+    """In-process copy of blocked_ips.
+
+    Exact addresses live in a set; CIDR ranges are merged into sorted,
+    non-overlapping [start, end] integer intervals per IP version and looked
+    up with bisect, so a check costs O(1) + O(log ranges) and never touches
+    SQLite on the request path.
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.ranges = {4: ([], []), 6: ([], [])}
+        self.watcher = VersionWatcher("blocked_ips", CHECK_INTERVAL)
+
+    def load(self, entries):
+        exact, spans = set(), {4: [], 6: []}
+        for entry in entries:
+            try:
+                net = ipaddress.ip_network(entry, strict=False)
+            except (ValueError, TypeError):
+                continue
+            if net.num_addresses == 1:
+                exact.add(str(net.network_address))
+            else:
+                spans[net.version].append(
+                    (int(net.network_address), int(net.broadcast_address)))
+
+        ranges = {}
+        for version, items in spans.items():
+            starts, ends = [], []
+            for start, end in sorted(items):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            ranges[version] = (starts, ends)
+
+        self.exact, self.ranges = exact, ranges
+
+    def contains(self, ip):
+        if not ip:
+            return False
+        if ip in self.exact:
+            return True
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if getattr(addr, "ipv4_mapped", None):
+            addr = addr.ipv4_mapped
+        if str(addr) in self.exact:
+            return True
+        starts, ends = self.ranges[addr.version]
+        if not starts:
+            return False
+        value = int(addr)
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def refresh(self, force=False):
+        if not self.watcher.changed(force):
+            return
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("SELECT ip_address FROM blocked_ips")
+        self.load(row["ip_address"] for row in cur.fetchall())
+        conn.close()
+
+    def is_blocked(self, ip):
+        self.refresh()
+        return self.contains(ip)
+
+
+blocked_ips = BlockedIPIndex()
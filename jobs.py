@@ -0,0 +1,122 @@
+import json, time, os, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import db
+from db import get_db
+from writer import writer
+
+JOB_WORKERS = 2
+JOB_TIMEOUT = 3600   # a job still "running" after this long is assumed lost
+
+HANDLERS = {}
+
+
+def job(fn):
+    """Register `fn` as a background job handler under its name."""
+    HANDLERS[fn.__name__] = fn
+    return fn
+
+
+class JobQueue:
+    """Runs registered handlers in a local process pool.
+
+    Every job is a row in the jobs table (queued -> running -> done/failed),
+    so a job whose worker died can be picked up again by resume(). The pool
+    is per gunicorn worker and created lazily; handlers travel to the pool
+    by import path, so they must live at module level.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.max_workers = max_workers
+        self.executor = None
+        self.pid = None
+        self.resumed = None  # pid that ran start()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """resume() once per worker; called on its first request, like maintenance.start().
+
+        Never at import time: pool processes re-import the app's main
+        module while they bootstrap and must not submit jobs themselves.
+        """
+        if self.resumed == os.getpid():
+            return
+        with self.lock:
+            if self.resumed == os.getpid():
+                return
+            self.resumed = os.getpid()
+        self.resume()
+
+    def pool(self):
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                # forkserver: never fork a threaded gunicorn worker
+                self.executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("forkserver"))
+                self.pid = os.getpid()
+            return self.executor
+
+    def enqueue(self, handler, **payload):
+        job_id = writer.write(lambda cur: self.insert(cur, handler, payload))
+        self.submit(job_id, handler)
+        return job_id
+
+    def insert(self, cur, handler, payload):
+        """Add the job row inside the caller's write (see writer.py); submit() it after the commit."""
+        now = int(time.time())
+        cur.execute("""
+            INSERT INTO jobs (kind, payload, state, created_at, updated_at)
+            VALUES (?, ?, 'queued', ?, ?)
+        """, (handler.__name__, json.dumps(payload), now, now))
+        return cur.lastrowid
+
+    def submit(self, job_id, handler):
+        self.pool().submit(run_job, job_id, handler, db.DB_FILE)
+
+    def resume(self):
+        """Requeue lost jobs and submit everything still queued."""
+        def requeue(cur):
+            cur.execute("""
+                UPDATE jobs SET state='queued'
+                WHERE state='running' AND updated_at < ?
+            """, (int(time.time()) - JOB_TIMEOUT,))
+            cur.execute("SELECT id, kind FROM jobs WHERE state='queued' ORDER BY id")
+            return cur.fetchall()
+
+        pending = writer.write(requeue)
+        for row in pending:
+            handler = HANDLERS.get(row["kind"])
+            if handler:
+                self.submit(row["id"], handler)
+
+
+def run_job(job_id, handler, db_file):
+    """Pool side: claim the job row, run the handler, record the outcome."""
+    db.DB_FILE = db_file
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE jobs SET state='running', attempts=attempts + 1, updated_at=?
+        WHERE id=? AND state='queued'
+    """, (int(time.time()), job_id))
+    conn.commit()
+    if not cur.rowcount:  # another worker claimed it
+        conn.close()
+        return
+    cur.execute("SELECT payload FROM jobs WHERE id=?", (job_id,))
+    payload = json.loads(cur.fetchone()["payload"])
+    conn.close()
+
+    state, error = "done", None
+    try:
+        handler(**payload)
+    except Exception as e:
+        state, error = "failed", f"{type(e).__name__}: {e}"
+
+    conn = get_db()
+    conn.execute("UPDATE jobs SET state=?, error=?, updated_at=? WHERE id=?",
+                 (state, error, int(time.time()), job_id))
+    conn.commit()
+    conn.close()
+
+
+queue = JobQueue()
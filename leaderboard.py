@@ -0,0 +1,215 @@
+import heapq, threading, time
+from db import get_reader, read_version, VersionWatcher
+from cache import FEED_VERSION
+from likes import likes
+
+LEADERBOARD_SIZE = 5     # default N
+MAX_SIZE = 50            # largest N a caller may ask for
+# window name -> hours covered (None = all-time, from videos.likes)
+WINDOWS = {"all": None, "24h": 24, "7d": 7 * 24}
+SPAN = max(hours for hours in WINDOWS.values() if hours)
+ALL_TIME_INTERVAL = 5    # seconds between all-time reloads while likes keep changing
+
+
+def current_hour():
+    return int(time.time()) // 3600
+
+
+class Leaderboard:
+    """Top-N videos for all-time, the last 24 hours and the last 7 days.
+
+    Windowed rankings are kept in memory as per-hour like counts plus running
+    per-window totals; when the hour rolls over, the hours leaving a window
+    are subtracted from its total. Every flush (by any worker) stamps the
+    like_buckets rows it writes with the new "likes" data version, so a new
+    version only re-reads the rows stamped since the one already loaded
+    (idx_like_buckets_changed) and folds in the difference. The last 7 days
+    are read whole only on first use and when which videos exist changes
+    (FEED_VERSION: uploads, deletes, kicks). Nothing here reads the likes
+    table, and the all-time top comes straight off idx_videos_likes (LIMIT N,
+    re-read at most every ALL_TIME_INTERVAL seconds while likes change).
+
+    Titles are cached for the ids in the current rankings only; a FEED_VERSION
+    change drops them, and ids whose video or uploader is gone are cached as
+    None and skipped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watcher = VersionWatcher("likes")
+        self.videos_watcher = VersionWatcher(FEED_VERSION)
+        self.version = 0          # "likes" version the buckets reflect
+        self.flushed = False      # this worker flushed since the last read
+        self.stale = True         # read the whole window on next top()
+        self.all_time_stale = True
+        self.all_time_at = 0.0    # monotonic time of the last all-time load
+        self.hours = {}           # hour -> {video_id: likes}
+        self.totals = {name: {} for name, span in WINDOWS.items() if span}
+        self.hour = None
+        self.all_time = []        # [(video_id, likes)], MAX_SIZE long
+        self.titles = {}          # video_id -> title, None if deleted
+        self.cache = {}           # window -> top MAX_SIZE [(video_id, likes)]
+
+    # --- Loading ---
+    def load(self):
+        hour = current_hour()
+        conn = get_reader()
+        cur = conn.cursor()
+        version = read_version(cur, "likes")
+        cur.execute("SELECT video_id, hour, likes FROM like_buckets WHERE hour > ?",
+                    (hour - SPAN,))
+        rows = cur.fetchall()
+        conn.close()
+
+        with self.lock:
+            self.watcher.version = self.version = version
+            self.hour = hour
+            self.hours = {}
+            self.totals = {name: {} for name in self.totals}
+            for row in rows:
+                self._add(row["video_id"], row["hour"], row["likes"])
+            self.cache = {}
+            self.stale = False
+        self.load_all_time()
+
+    def refresh(self):
+        """Fold in the buckets written since self.version, by this worker or another."""
+        conn = get_reader()
+        cur = conn.cursor()
+        version = read_version(cur, "likes")
+        # no hour bound: it would steer SQLite onto idx_like_buckets_hour, and
+        # _add() skips hours outside the windows anyway
+        cur.execute("SELECT video_id, hour, likes FROM like_buckets WHERE changed > ?", (self.version,))
+        rows = cur.fetchall()
+        conn.close()
+
+        with self.lock:
+            self._advance(current_hour())
+            # rows hold totals, not deltas, so a row read twice is harmless
+            for row in rows:
+                known = self.hours.get(row["hour"], {}).get(row["video_id"], 0)
+                if row["likes"] != known:
+                    self._add(row["video_id"], row["hour"], row["likes"] - known)
+            self.version = max(self.version, version)
+            for name in self.totals:
+                self.cache.pop(name, None)
+            self.all_time_stale = True
+
+    def load_all_time(self):
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT videos.id, videos.title, videos.likes
+            FROM videos JOIN users ON users.id = videos.uploader_id
+            ORDER BY videos.likes DESC LIMIT ?
+        """, (MAX_SIZE,))
+        top = cur.fetchall()
+        conn.close()
+        with self.lock:
+            self.all_time = [(row["id"], row["likes"]) for row in top]
+            self._set_titles({row["id"]: row["title"] for row in top})
+            self.cache.pop("all", None)
+            self.all_time_stale = False
+            self.all_time_at = time.monotonic()
+
+    def on_flush(self, events, version):
+        """LikeEngine subscriber: pick up this worker's flush on the next read, without waiting for the poll."""
+        self.flushed = True
+
+    # --- Incremental maintenance (call with self.lock held) ---
+    def _add(self, video_id, hour, delta):
+        if self.hour - hour >= SPAN:
+            return
+        counts = self.hours.setdefault(hour, {})
+        counts[video_id] = counts.get(video_id, 0) + delta
+        for name, span in WINDOWS.items():
+            if span and self.hour - hour < span:
+                self._bump(self.totals[name], video_id, delta)
+
+    def _advance(self, hour):
+        """Slide every window forward to `hour`."""
+        if hour - self.hour >= SPAN:  # idle for a week: nothing left in any window
+            self.hour, self.hours = hour, {}
+            self.totals = {name: {} for name in self.totals}
+            self.cache = {}
+        while self.hour < hour:
+            self.hour += 1
+            for name, span in WINDOWS.items():
+                if not span:
+                    continue
+                leaving = self.hours.get(self.hour - span, {})
+                for video_id, count in leaving.items():
+                    self._bump(self.totals[name], video_id, -count)
+            self.hours.pop(self.hour - SPAN, None)
+            self.cache = {}
+
+    @staticmethod
+    def _bump(totals, video_id, delta):
+        value = totals.get(video_id, 0) + delta
+        if value > 0:
+            totals[video_id] = value
+        else:
+            totals.pop(video_id, None)
+
+    # --- Reads ---
+    def top(self, window="all", n=LEADERBOARD_SIZE):
+        """[{"id", "title", "likes"}] for the top n videos in `window`."""
+        if window not in WINDOWS:
+            raise KeyError(window)
+        n = max(1, min(n, MAX_SIZE))
+        if self.videos_watcher.changed():
+            with self.lock:
+                self.titles = {}
+                self.stale = True
+        flushed, self.flushed = self.flushed, False
+        if self.stale:
+            self.load()
+        elif self.watcher.changed(force=flushed):
+            self.refresh()
+        if self.all_time_stale and time.monotonic() - self.all_time_at >= ALL_TIME_INTERVAL:
+            self.load_all_time()
+
+        with self.lock:
+            self._advance(current_hour())
+            ranked = self.cache.get(window)
+            if ranked is None:
+                if WINDOWS[window] is None:
+                    ranked = self.all_time
+                else:
+                    totals = self.totals[window]
+                    ranked = heapq.nlargest(MAX_SIZE, totals.items(), key=lambda item: (item[1], -item[0]))
+                self.cache[window] = ranked
+            missing = [video_id for video_id, _ in ranked if video_id not in self.titles]
+
+        if missing:
+            self._load_titles(missing)
+        titles = self.titles
+        return [{"id": video_id, "title": titles[video_id], "likes": count}
+                for video_id, count in ranked if titles.get(video_id) is not None][:n]
+
+    def _load_titles(self, ids):
+        conn = get_reader()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT videos.id, videos.title
+            FROM videos JOIN users ON users.id = videos.uploader_id
+            WHERE videos.id IN ({','.join('?' * len(ids))})
+        """, ids)
+        found = dict.fromkeys(ids)  # deleted videos stay None
+        found.update((row["id"], row["title"]) for row in cur.fetchall())
+        conn.close()
+        with self.lock:
+            self._set_titles(found)
+
+    def _set_titles(self, found):
+        """Add `found` and forget ids no ranking shows, so titles stays bounded (lock held)."""
+        ranked = {video_id for video_id, _ in self.all_time}
+        for name in self.totals:
+            ranked.update(video_id for video_id, _ in self.cache.get(name, ()))
+        titles = {video_id: title for video_id, title in self.titles.items() if video_id in ranked}
+        titles.update(found)
+        self.titles = titles
+
+
+leaderboard = Leaderboard()
+likes.subscribe(leaderboard.on_flush)
@@ -0,0 +1,207 @@
+import logging, threading, time, os, atexit
+from db import get_reader, bump_version, bump_versions, read_version, read_versions
+from writer import writer, busy
+from cache import video_version
+from jobs import job, queue as job_queue
+
+FLUSH_INTERVAL = 1.0          # seconds between counter flushes
+RECONCILE_INTERVAL = 6 * 3600  # how often a worker queues a recount
+RECONCILE_BATCH = 1000         # videos per recount transaction
+RECONCILE_SETTLE = 10 * FLUSH_INTERVAL  # wait before fixing a drift, so in-flight deltas land
+
+log = logging.getLogger("buzz.likes")
+
+
+class LikeEngine:
+    """Toggles likes against UNIQUE(video_id, user_id) and batches the counters.
+
+    The likes table is the source of truth and is written synchronously
+    (through the worker's write queue, see writer.py).
+    videos.likes is a denormalised counter: per-video deltas collect in
+    memory and a background thread applies them every FLUSH_INTERVAL in one
+    short transaction, so a viral video costs one counter write per second
+    instead of one per click. reconcile_likes() repairs any drift.
+
+    The same flush adds the deltas to per-hour like_buckets (by the hour the
+    like was made, stamped with the new "likes" data version) and bumps that
+    version and each video's (see cache.py); subscribers get the flushed
+    (video_id, hour, delta) events, see leaderboard.py.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.deltas = {}
+        self.buckets = {}             # (video_id, hour) -> delta
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.reconciled_at = time.monotonic()
+
+    def toggle(self, video_id, user_id):
+        """Like or unlike; returns +1, -1, or 0 if the video is missing or the user's own."""
+        now = int(time.time())
+
+        # a like (the common case) is one INSERT; only an unlike adds the DELETE,
+        # in the same write transaction, so it costs an index probe, not a lock
+        def toggle(cur):
+            cur.execute("""
+                INSERT INTO likes (video_id, user_id, created_at)
+                SELECT id, ?, ? FROM videos WHERE id=? AND uploader_id IS NOT ?
+                ON CONFLICT(video_id, user_id) DO NOTHING
+            """, (user_id, now, video_id, user_id))
+            if cur.rowcount:
+                delta, liked_at = 1, now
+            else:
+                # unliking takes the like out of the hour it was made in
+                cur.execute("DELETE FROM likes WHERE video_id=? AND user_id=? RETURNING created_at",
+                            (video_id, user_id))
+                row = cur.fetchone()
+                delta, liked_at = (-1, row["created_at"]) if row else (0, None)
+            if delta:
+                bump_version(cur, video_version(video_id))  # the liker sees their own like
+            return delta, liked_at
+
+        delta, liked_at = writer.write(toggle)
+        if delta:
+            self.add(video_id, delta, liked_at)
+        return delta
+
+    def add(self, video_id, delta, liked_at=None):
+        self._ensure_flusher()
+        with self.lock:
+            self.deltas[video_id] = self.deltas.get(video_id, 0) + delta
+            if liked_at is not None:  # likes from before bucketing only count all-time
+                key = (video_id, liked_at // 3600)
+                self.buckets[key] = self.buckets.get(key, 0) + delta
+
+    def subscribe(self, fn):
+        """Call fn(events, version) after each flush, events = [(video_id, hour, delta)]."""
+        self.subscribers.append(fn)
+
+    def pending(self, video_id):
+        """Delta not yet flushed to videos.likes by this worker."""
+        with self.lock:
+            return self.deltas.get(video_id, 0)
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+            buckets, self.buckets = self.buckets, {}
+        items = [(delta, video_id) for video_id, delta in deltas.items() if delta]
+        events = [(video_id, hour, delta) for (video_id, hour), delta in buckets.items() if delta]
+        if not items and not events:
+            return
+
+        def apply(cur):
+            bump_versions(cur, ["likes"] + [video_version(video_id) for _, video_id in items])
+            version = read_version(cur, "likes")
+            cur.executemany("UPDATE videos SET likes = likes + ? WHERE id=?", items)
+            # stamped with the version, so other workers re-read only these rows
+            cur.executemany("""
+                INSERT INTO like_buckets (video_id, hour, likes, changed) VALUES (?, ?, ?, ?)
+                ON CONFLICT(video_id, hour) DO UPDATE SET likes = likes + excluded.likes, changed = excluded.changed
+            """, [event + (version,) for event in events])
+            return version
+
+        try:
+            version = writer.write(apply)
+        except Exception:
+            with self.lock:  # keep them for the next round
+                for video_id, delta in deltas.items():
+                    self.deltas[video_id] = self.deltas.get(video_id, 0) + delta
+                for key, delta in buckets.items():
+                    self.buckets[key] = self.buckets.get(key, 0) + delta
+            raise
+        for fn in self.subscribers:
+            fn(events, version)
+
+    def _ensure_flusher(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # a forked child must not replay the parent's deltas
+            self.deltas, self.buckets = {}, {}
+            writer.start()
+            threading.Thread(target=self._run, name="like-flusher", daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+                if time.monotonic() - self.reconciled_at > RECONCILE_INTERVAL:
+                    self.reconciled_at = time.monotonic()
+                    schedule_reconcile()
+            except Exception as e:
+                # deltas were kept; a busy database is retried quietly next tick
+                if not busy(e):
+                    log.exception("like flush failed")
+
+
+def schedule_reconcile():
+    """Queue a recount unless one is already waiting or running."""
+    conn = get_reader()
+    busy = conn.execute("""
+        SELECT 1 FROM jobs WHERE kind='reconcile_likes' AND state IN ('queued', 'running') LIMIT 1
+    """).fetchone()
+    conn.close()
+    if not busy:
+        job_queue.enqueue(reconcile_likes)
+
+
+@job
+def reconcile_likes(batch=RECONCILE_BATCH, settle=RECONCILE_SETTLE):
+    """Recount videos.likes from the likes table; returns the number of videos fixed.
+
+    A like another worker has not flushed yet is already in `likes` but not
+    in the counter, so a plain recount would have it counted twice once that
+    flush lands. Drifted videos are therefore found first, then re-checked
+    after `settle` seconds (long enough for every worker to flush) and fixed
+    only if their data version did not move in between: every toggle and
+    every flush bumps it, so an unchanged version means nothing was pending.
+    A video liked the whole time waits for a quieter run.
+    """
+    conn = get_reader()
+    seen, last_id = {}, 0  # drifted video_id -> its version when found
+    while True:
+        rows = conn.execute("""
+            SELECT id, likes, (SELECT COUNT(*) FROM likes WHERE likes.video_id = videos.id) AS counted
+            FROM videos WHERE id > ? ORDER BY id LIMIT ?
+        """, (last_id, batch)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        drifted = [row["id"] for row in rows if row["likes"] != row["counted"]]
+        if drifted:
+            found = read_versions(conn.cursor(), [video_version(video_id) for video_id in drifted])
+            seen.update((video_id, found[video_version(video_id)]) for video_id in drifted)
+    conn.close()
+    if not seen:
+        return 0
+    time.sleep(settle)
+
+    def repair(cur, ids):
+        found = read_versions(cur, [video_version(video_id) for video_id in ids])
+        quiet = [video_id for video_id in ids if found[video_version(video_id)] == seen[video_id]]
+        if not quiet:
+            return 0
+        cur.execute(f"""
+            UPDATE videos SET likes = (SELECT COUNT(*) FROM likes WHERE likes.video_id = videos.id)
+            WHERE id IN ({','.join('?' * len(quiet))})
+              AND likes IS NOT (SELECT COUNT(*) FROM likes WHERE likes.video_id = videos.id)
+            RETURNING id
+        """, quiet)
+        fixed = [row["id"] for row in cur.fetchall()]
+        if fixed:
+            bump_versions(cur, ["likes"] + [video_version(video_id) for video_id in fixed])
+        return len(fixed)
+
+    ids = sorted(seen)
+    return sum(writer.write(repair, ids[i:i + batch]) for i in range(0, len(ids), batch))
+
+
+likes = LikeEngine()
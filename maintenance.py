@@ -0,0 +1,343 @@
+"""Background maintenance: chat retention, orphan cleanup, upload files, vacuum.
+
+Each task is a job (see jobs.py), so it runs in the job pool, never in a
+request thread, and writes in transactions of at most CLEANUP_BATCH rows so
+the write lock is only ever held briefly.
+
+    python maintenance.py                      # run every task now
+    python maintenance.py --only archive_chat
+    python maintenance.py --enable-incremental-vacuum   # once, app stopped
+"""
+import argparse, logging, os, sqlite3, threading, time
+import db
+from db import get_db, get_reader, bump_versions
+from cache import FEED_VERSION, video_version, user_version
+from chat import RING_SIZE
+from jobs import job, queue as job_queue
+from media import MEDIA_PREFIX
+from migrations import migrate
+from writer import busy
+
+CHAT_RETENTION = 30 * 24 * 3600   # chat older than this moves to the archive
+CHAT_KEEP = RING_SIZE             # newest messages never archived (chat rings, resumes)
+ARCHIVE_DB_FILE = "archive.db"
+CLEANUP_BATCH = 500               # rows per write transaction
+JOB_RETENTION = 7 * 24 * 3600     # finished jobs rows kept this long
+UPLOAD_GRACE = 3600               # files this new may not have their row yet
+VACUUM_STEP_PAGES = 1000          # pages released per incremental_vacuum
+CHECK_INTERVAL = 60               # seconds between scheduler checks
+
+log = logging.getLogger("buzz.maintenance")
+
+
+# --- Chat retention ---
+def connect_archive(path=ARCHIVE_DB_FILE):
+    conn = sqlite3.connect(path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # its own file: archived chat never grows buzz.db or its backups
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages_archive (
+            id INTEGER PRIMARY KEY,
+            user TEXT,
+            message TEXT,
+            created_at INTEGER,
+            archived_at INTEGER NOT NULL
+        )
+    """)
+    return conn
+
+
+@job
+def archive_chat(retention=CHAT_RETENTION, keep=CHAT_KEEP, batch=CLEANUP_BATCH, archive_file=ARCHIVE_DB_FILE):
+    """Move chat older than `retention` into the archive database, oldest first.
+
+    Messages from before created_at existed count as older than any other.
+    Each batch is copied first and deleted second, so a crash in between
+    only repeats the copy.
+    """
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM messages ORDER BY id DESC LIMIT 1 OFFSET ?", (keep - 1,))
+    row = cur.fetchone()
+    if row is None:
+        conn.close()
+        return 0
+    boundary = row["id"]
+    cur.execute("SELECT id FROM messages WHERE created_at >= ? ORDER BY created_at LIMIT 1",
+                (int(time.time()) - retention,))
+    row = cur.fetchone()
+    if row:
+        boundary = min(boundary, row["id"])
+
+    archive = connect_archive(archive_file)
+    moved = 0
+    try:
+        while True:
+            # archived under the name, which outlives a kicked user's id
+            cur.execute("""
+                SELECT messages.id, users.username AS user, message, created_at
+                FROM messages LEFT JOIN users ON users.id = messages.user_id
+                WHERE messages.id < ? ORDER BY messages.id LIMIT ?
+            """, (boundary, batch))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            now = int(time.time())
+            archive.executemany("""
+                INSERT OR IGNORE INTO messages_archive (id, user, message, created_at, archived_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(r["id"], r["user"], r["message"], r["created_at"], now) for r in rows])
+            archive.commit()
+            # older than every chat ring, so no "messages" version bump
+            cur.execute("DELETE FROM messages WHERE id >= ? AND id <= ?", (rows[0]["id"], rows[-1]["id"]))
+            conn.commit()
+            moved += len(rows)
+    finally:
+        archive.close()
+        conn.close()
+    return moved
+
+
+# --- Orphans ---
+def sweep(table, key, condition, returning="1", apply=None, params=(), batch=CLEANUP_BATCH):
+    """Delete the rows of `table` matching `condition`, one key range per transaction.
+
+    The table is walked in `key` order, `batch` rows at a time; `apply(cur,
+    deleted_rows)` runs in the same transaction to fix counters and bump
+    data versions. Returns the number of rows deleted.
+    """
+    marks = ", ".join("?" * len(key.split(",")))
+    conn = get_db()
+    cur = conn.cursor()
+    last, deleted = None, 0
+    try:
+        while True:
+            bounds, args = [], []
+            if last:
+                bounds.append(f"({key}) > ({marks})")
+                args += last
+            cur.execute(f"SELECT {key} FROM {table} {'WHERE ' + bounds[0] if bounds else ''} "
+                        f"ORDER BY {key} LIMIT 1 OFFSET ?", args + [batch - 1])
+            upper = cur.fetchone()
+            if upper:
+                bounds.append(f"({key}) <= ({marks})")
+                args += list(upper)
+            cur.execute(f"DELETE FROM {table} WHERE {' AND '.join(bounds + [f'({condition})'])} "
+                        f"RETURNING {returning}", args + list(params))
+            rows = cur.fetchall()
+            if rows and apply:
+                apply(cur, rows)
+            conn.commit()
+            deleted += len(rows)
+            if not upper:
+                break
+            last = list(upper)
+    finally:
+        conn.close()
+    return deleted
+
+
+def _bump_videos(cur, rows, extra=()):
+    bump_versions(cur, list(extra) + [video_version(video_id) for video_id in {r[0] for r in rows}])
+
+
+def _uncount_likes(cur, rows):
+    counts = {}
+    for row in rows:
+        counts[row[0]] = counts.get(row[0], 0) + 1
+    cur.executemany("UPDATE videos SET likes = likes - ? WHERE id=?",
+                    [(n, video_id) for video_id, n in counts.items()])
+    _bump_videos(cur, rows, ["likes"])
+
+
+def _uncount_followers(cur, rows):
+    counts = {}
+    for row in rows:
+        counts[row[0]] = counts.get(row[0], 0) + 1
+    cur.executemany("UPDATE users SET followers = followers - ? WHERE id=?",
+                    [(n, user_id) for user_id, n in counts.items()])
+    bump_versions(cur, [user_version(user_id) for user_id in counts])
+
+
+NO_USER = "NOT EXISTS (SELECT 1 FROM users WHERE users.id = {})"
+NO_VIDEO = "NOT EXISTS (SELECT 1 FROM videos WHERE videos.id = {})"
+
+
+@job
+def cleanup_orphans(batch=CLEANUP_BATCH):
+    """Delete rows left behind by kicked users and deleted videos.
+
+    Parents go first, so one run also clears what they leave behind:
+    videos of missing users, then everything pointing at a missing video
+    or user. Finished job rows older than JOB_RETENTION go too.
+    """
+    removed = {
+        "videos": sweep("videos", "id", NO_USER.format("videos.uploader_id"), "id",
+                        lambda cur, rows: _bump_videos(cur, rows, [FEED_VERSION, "likes"]), batch=batch),
+        "comments": sweep("comments", "id",
+                          NO_VIDEO.format("comments.video_id") + " OR " + NO_USER.format("comments.user_id"),
+                          "video_id", _bump_videos, batch=batch),
+        "likes": sweep("likes", "id", NO_VIDEO.format("likes.video_id") + " OR " + NO_USER.format("likes.user_id"),
+                       "video_id", _uncount_likes, batch=batch),
+        "follows": sweep("follows", "id",
+                         NO_USER.format("follows.follower_id") + " OR " + NO_USER.format("follows.following_id"),
+                         "following_id", _uncount_followers, batch=batch),
+        "inbox": sweep("inbox", "user_id, video_id",
+                       NO_USER.format("inbox.user_id") + " OR " + NO_VIDEO.format("inbox.video_id"), batch=batch),
+        "like_buckets": sweep("like_buckets", "video_id, hour", NO_VIDEO.format("like_buckets.video_id"),
+                              apply=lambda cur, rows: bump_versions(cur, ["likes"]), batch=batch),
+        "view_sketches": sweep("view_sketches", "video_id", NO_VIDEO.format("view_sketches.video_id"),
+                               batch=batch),
+        "jobs": sweep("jobs", "id", "state = 'done' AND updated_at < ?",
+                      params=(int(time.time()) - JOB_RETENTION,), batch=batch),
+    }
+    return removed
+
+
+# --- Files and pages ---
+@job
+def cleanup_uploads(folder, grace=UPLOAD_GRACE):
+    """Delete files in `folder` that no video row points at any more.
+
+    Files modified in the last `grace` seconds are kept: an upload is
+    stored before its row is inserted, and a dedup'd upload touches the
+    file it reuses (see uploads.py).
+    """
+    cutoff = time.time() - grace
+    conn = get_db()
+    removed = 0
+    try:
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames[:] = [d for d in dirnames if d != ".partial"]  # expired by uploads.py
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                name = os.path.relpath(path, folder).replace(os.sep, "/")
+                if conn.execute("SELECT 1 FROM videos WHERE filepath=? LIMIT 1",
+                                (MEDIA_PREFIX + name,)).fetchone():
+                    continue
+                os.remove(path)
+                removed += 1
+    finally:
+        conn.close()
+    return removed
+
+
+@job
+def incremental_vacuum(step=VACUUM_STEP_PAGES):
+    """Give free pages back to the filesystem, `step` pages per write."""
+    conn = get_db()
+    released = 0
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # not INCREMENTAL
+            return 0
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while free:
+            # one page per step: fetchall() runs it to the end
+            conn.execute(f"PRAGMA incremental_vacuum({int(step)})").fetchall()
+            left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if left >= free:
+                break
+            released += free - left
+            free = left
+    finally:
+        conn.close()
+    return released
+
+
+def enable_incremental_vacuum():
+    """Switch an existing database to auto_vacuum=INCREMENTAL with a full VACUUM."""
+    conn = sqlite3.connect(db.DB_FILE, isolation_level=None)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+# --- Scheduling ---
+def schedule(handler, every=0, **payload):
+    """Queue `handler` unless one is waiting or running, or one finished under `every` seconds ago.
+
+    Two workers may both queue it in a rare race; every task is idempotent.
+    """
+    conn = get_reader()
+    busy = conn.execute("""
+        SELECT 1 FROM jobs
+        WHERE kind=? AND (state IN ('queued', 'running') OR (state='done' AND updated_at > ?))
+        LIMIT 1
+    """, (handler.__name__, int(time.time()) - every)).fetchone()
+    conn.close()
+    if not busy:
+        job_queue.enqueue(handler, **payload)
+
+
+# handler -> seconds between runs
+TASKS = (
+    (archive_chat, 3600),
+    (cleanup_orphans, 3600),
+    (cleanup_uploads, 6 * 3600),
+    (incremental_vacuum, 3600),
+)
+
+
+class Maintenance:
+    """Queues each task in TASKS when it is due.
+
+    Every worker runs a scheduler thread; the jobs table decides whether a
+    task is due, so between them the workers queue each one once per
+    interval.
+    """
+
+    def __init__(self, interval=CHECK_INTERVAL):
+        self.interval = interval
+        self.folder = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self, folder):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.folder = folder
+            threading.Thread(target=self._run, name="maintenance", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            for handler, every in TASKS:
+                payload = {"folder": self.folder} if handler is cleanup_uploads else {}
+                try:
+                    schedule(handler, every, **payload)
+                except Exception as e:
+                    if not busy(e):  # a busy database is retried quietly next check
+                        log.exception("scheduling %s failed", handler.__name__)
+
+
+maintenance = Maintenance()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run BuzzTube maintenance tasks now.")
+    parser.add_argument("--db", default=db.DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--uploads", default="static/uploads", help="uploads folder (default: %(default)s)")
+    parser.add_argument("--only", nargs="+", choices=[handler.__name__ for handler, _ in TASKS],
+                        help="run just these tasks")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="one-off full VACUUM so incremental_vacuum can work (stop the app first)")
+    args = parser.parse_args()
+    db.DB_FILE = args.db
+
+    migrate()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+        print(f"✅ {args.db} now uses auto_vacuum=INCREMENTAL")
+    for handler, _ in TASKS:
+        if args.only and handler.__name__ not in args.only:
+            continue
+        result = handler(args.uploads) if handler is cleanup_uploads else handler()
+        print(f"✅ {handler.__name__}: {result}")
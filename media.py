@@ -0,0 +1,175 @@
+import contextlib, os, re, mimetypes, hashlib, uuid
+from datetime import datetime, timezone
+from flask import Response, abort
+from werkzeug.security import safe_join
+import mp4
+from db import get_db, bump_versions
+from cache import video_version
+from jobs import job
+from uploads import ChunkedUploads
+
+IO_BLOCK = 256 * 1024
+MEDIA_PREFIX = "/media/"
+# Content-addressed uploads (<sha256><ext>, see uploads.py) never change.
+IMMUTABLE_NAME = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+
+
+def media_etag(name, st):
+    stem = os.path.basename(name)
+    if IMMUTABLE_NAME.match(stem):
+        return stem.split(".")[0]
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def _file_body(environ, f, length):
+    """Response body for the next `length` bytes of the open file `f`.
+
+    Under gunicorn, wsgi.file_wrapper is sent with sendfile() from the
+    file's current offset for Content-Length bytes, so the data never goes
+    through Python. Servers without one get a bounded read loop.
+    """
+    wrapper = environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        return wrapper(f, IO_BLOCK)
+
+    def read_range():
+        remaining = length
+        with f:
+            while remaining > 0:
+                block = f.read(min(IO_BLOCK, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+    return read_range()
+
+
+def send_media(folder, name, request, max_age=31536000):
+    """Serve `folder`/`name` with Range, If-Range, ETag and Last-Modified.
+
+    Only single byte ranges are honoured; a multi-range request gets the
+    whole file with 200, which RFC 9110 allows.
+    """
+    path = safe_join(folder, name)
+    # .partial/ holds uploads in progress
+    if path is None or any(part.startswith(".") for part in name.split("/")):
+        abort(404)
+    try:
+        f = open(path, "rb")
+    except (FileNotFoundError, IsADirectoryError):
+        abort(404)
+    st = os.fstat(f.fileno())
+    size = st.st_size
+    etag = media_etag(name, st)
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+
+    headers = {"Accept-Ranges": "bytes"}
+    if IMMUTABLE_NAME.match(os.path.basename(name)):
+        headers["Cache-Control"] = f"public, max-age={max_age}, immutable"
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    def respond(status, body=None, length=0):
+        rv = Response(body, status=status, headers=headers,
+                      mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                      direct_passthrough=True)
+        rv.set_etag(etag)
+        rv.last_modified = last_modified
+        if status != 304:
+            rv.content_length = length
+        return rv
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and last_modified <= since
+    if not_modified:
+        f.close()
+        return respond(304)
+
+    start, stop = 0, size
+    rng = request.range
+    if rng is not None and len(rng.ranges) == 1 and _if_range_ok(request, etag, last_modified):
+        span = rng.range_for_length(size)
+        if span is None:
+            f.close()
+            headers["Content-Range"] = f"bytes */{size}"
+            return respond(416)
+        start, stop = span
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    if request.method == "HEAD":
+        f.close()
+        return respond(206 if start or stop != size else 200, length=stop - start)
+
+    f.seek(start)
+    return respond(206 if "Content-Range" in headers else 200,
+                   _file_body(request.environ, f, stop - start), stop - start)
+
+
+def _if_range_ok(request, etag, last_modified):
+    """True when the Range header applies (no If-Range, or it still matches)."""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        # If-Range needs a strong comparison
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
+
+
+# --- Background processing ---
+@job
+def process_video(video_id, folder):
+    """Move moov in front of mdat and record duration/size/codec.
+
+    The rewritten file gets a new content address; every video row that
+    pointed at the old file is repointed, and cleanup_uploads() removes
+    the old file once nothing uses it.
+    """
+    conn = get_db()
+    row = conn.execute("SELECT filepath FROM videos WHERE id=?", (video_id,)).fetchone()
+    conn.close()
+    if not row or not (row["filepath"] or "").startswith(MEDIA_PREFIX):
+        return
+    filepath = row["filepath"]
+    name = filepath[len(MEDIA_PREFIX):]
+    path = safe_join(folder, name)
+
+    try:
+        info = mp4.probe(path)
+    except mp4.MP4Error:
+        info = {"size": os.path.getsize(path)}  # not an MP4 we understand
+
+    if info.get("faststart") is False:
+        store = ChunkedUploads(folder)
+        tmp = store.partial_path(uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        hasher = hashlib.sha256()
+        try:
+            mp4.faststart(path, tmp, hasher)
+        except mp4.MP4Error:
+            with contextlib.suppress(FileNotFoundError):  # it may fail before creating tmp
+                os.remove(tmp)
+        else:
+            new_path = MEDIA_PREFIX + store.store(tmp, hasher.hexdigest(), name)
+            conn = get_db()
+            conn.execute("UPDATE videos SET filepath=? WHERE filepath=?", (new_path, filepath))
+            conn.commit()
+            conn.close()
+            # the old file is left to cleanup_uploads() and its grace period:
+            # a dedup'd upload of the same bytes may be finishing right now
+            filepath = new_path
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE videos SET duration=?, width=?, height=?, codec=?, filesize=?
+        WHERE filepath=? RETURNING id
+    """, (info.get("duration"), info.get("width"), info.get("height"),
+          info.get("codec"), info["size"], filepath))
+    bump_versions(cur, [video_version(row["id"]) for row in cur.fetchall()])
+    conn.commit()
+    conn.close()
@@ -0,0 +1,284 @@
+import hmac, json, logging, os, re, sqlite3, threading, time
+from flask import g, has_request_context, request, before_render_template, template_rendered
+import db
+
+METRICS_DIR = "metrics"        # one snapshot file per worker, merged by /metrics
+SNAPSHOT_INTERVAL = 5.0        # seconds between snapshot writes
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG = "slow_queries.log"
+# Scrapers send "Authorization: Bearer <token>"; unset means admins only.
+METRICS_TOKEN = os.environ.get("BUZZ_METRICS_TOKEN")
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+slow_log = logging.getLogger("buzz.slow_sql")
+
+
+def labels(**values):
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(values.items()))
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Counters and histograms in Prometheus text format, per worker.
+
+    Every worker writes a JSON snapshot of its own series to METRICS_DIR
+    every SNAPSHOT_INTERVAL; render() sums the snapshots of all live
+    workers, so a scrape shows the whole server whichever worker answers.
+    """
+
+    def __init__(self, folder=METRICS_DIR, interval=SNAPSHOT_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counters = {}      # "name{labels}" -> value
+        self.histograms = {}    # "name|{labels}" -> [bucket counts..., sum, count]
+        self.buckets = {}       # histogram name -> bounds
+        self.help = {}
+        self.pid = None
+
+    def describe(self, name, kind, text, buckets=None):
+        self.help[name] = (kind, text)
+        if buckets:
+            self.buckets[name] = buckets
+
+    def inc(self, name, label_text="", value=1):
+        self._ensure_writer()
+        key = name + label_text
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, label_text, value):
+        self._ensure_writer()
+        bounds = self.buckets[name]
+        key = f"{name}|{label_text}"
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * len(bounds) + [0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    # --- Cross-worker snapshots ---
+    def snapshot_path(self, pid):
+        return os.path.join(self.folder, f"{pid}.json")
+
+    def write_snapshot(self):
+        with self.lock:
+            data = {"counters": dict(self.counters),
+                    "histograms": {key: list(series) for key, series in self.histograms.items()}}
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = self.snapshot_path(os.getpid()) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.snapshot_path(os.getpid()))
+
+    def merged(self):
+        """Counters and histograms summed over every live worker's snapshot."""
+        self.write_snapshot()
+        counters, histograms = {}, {}
+        for name in os.listdir(self.folder):
+            match = re.fullmatch(r"(\d+)\.json", name)
+            if not match:
+                continue
+            pid = int(match.group(1))
+            if not _alive(pid):
+                os.remove(os.path.join(self.folder, name))
+                continue
+            try:
+                with open(os.path.join(self.folder, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced right now
+            for key, value in data["counters"].items():
+                counters[key] = counters.get(key, 0) + value
+            for key, series in data["histograms"].items():
+                total = histograms.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.merged()
+        lines, seen = [], set()
+
+        def header(name):
+            if name not in seen and name in self.help:
+                seen.add(name)
+                kind, text = self.help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for key in sorted(counters):
+            header(key.split("{", 1)[0])
+            lines.append(f"{key} {counters[key]}")
+        for key in sorted(histograms):
+            name, label_text = key.split("|", 1)
+            header(name)
+            series, inner = histograms[key], label_text[1:-1]
+            sep = "," if inner else ""
+            for bound, count in zip(self.buckets.get(name, ()), series):
+                lines.append(f'{name}_bucket{{{inner}{sep}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{inner}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{name}_sum{label_text} {series[-2]}")
+            lines.append(f"{name}_count{label_text} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def _ensure_writer(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # a forked worker starts from zero, not from its parent's counts
+            self.counters, self.histograms = {}, {}
+            threading.Thread(target=self._run, name="metrics-writer", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = Metrics()
+metrics.describe("buzz_http_requests_total", "counter", "Requests by endpoint, method and status.")
+metrics.describe("buzz_http_request_duration_seconds", "histogram", "Request latency by endpoint.",
+                 REQUEST_BUCKETS)
+metrics.describe("buzz_http_request_sql_statements", "histogram", "SQL statements run per request.",
+                 COUNT_BUCKETS)
+metrics.describe("buzz_http_request_sql_seconds_total", "counter", "Time spent in SQL by endpoint.")
+metrics.describe("buzz_http_request_template_seconds_total", "counter",
+                 "Time spent rendering templates by endpoint.")
+metrics.describe("buzz_template_render_seconds", "histogram", "Render time by template.", REQUEST_BUCKETS)
+metrics.describe("buzz_sql_statement_seconds", "histogram",
+                 "SQL statement time (execute + fetch) by endpoint; background threads are \"-\".",
+                 SQL_BUCKETS)
+metrics.describe("buzz_sql_slow_statements_total", "counter",
+                 f"Statements slower than {SLOW_QUERY_SECONDS}s by endpoint.")
+
+
+# --- SQL ---
+def endpoint():
+    if not has_request_context():
+        return "-"
+    return request.endpoint or "unmatched"
+
+
+def params_shape(params):
+    """Parameter types without the values, e.g. "(int, str)"."""
+    if params is None:
+        return "executemany"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in params) + ")"
+
+
+def query_plan(conn, sql, params):
+    if params is None or not re.match(r"\s*(SELECT|WITH|UPDATE|DELETE|INSERT)", sql, re.I):
+        return None
+    try:
+        cur = sqlite3.Cursor(conn)  # a plain cursor, so this is not timed itself
+        cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plan = [row[3] for row in cur.fetchall()]
+        cur.close()
+        return plan
+    except sqlite3.Error:
+        return None
+
+
+def on_statement(sql, params, seconds, conn):
+    name = endpoint()
+    metrics.observe("buzz_sql_statement_seconds", labels(endpoint=name), seconds)
+    if has_request_context() and "metrics_started" in g:
+        g.sql_statements += 1
+        g.sql_seconds += seconds
+    if seconds >= SLOW_QUERY_SECONDS:
+        metrics.inc("buzz_sql_slow_statements_total", labels(endpoint=name))
+        slow_log.warning(json.dumps({
+            "endpoint": name,
+            "ms": round(seconds * 1000, 1),
+            "sql": " ".join(sql.split()),
+            "params": params_shape(params),
+            "plan": query_plan(conn, sql, params),
+        }))
+
+
+def scrape_allowed(req):
+    """True if the request carries METRICS_TOKEN as a bearer token."""
+    header = req.headers.get("Authorization", "")
+    return bool(METRICS_TOKEN) and header.startswith("Bearer ") and \
+        hmac.compare_digest(header[len("Bearer "):].encode(), METRICS_TOKEN.encode())
+
+
+# --- Requests and templates ---
+def init_app(app):
+    """Time every request, its SQL and its templates; log slow statements."""
+    if not slow_log.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.propagate = False
+    if on_statement not in db.statement_hooks:
+        db.statement_hooks.append(on_statement)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.sql_statements, g.sql_seconds, g.template_seconds = 0, 0.0, 0.0
+        g.template_starts = []
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        if "metrics_started" not in g:
+            return
+        name = endpoint()
+        by_endpoint = labels(endpoint=name)
+        metrics.observe("buzz_http_request_duration_seconds", by_endpoint,
+                        time.perf_counter() - g.metrics_started)
+        metrics.inc("buzz_http_requests_total",
+                    labels(endpoint=name, method=request.method, status=g.get("metrics_status", 500)))
+        metrics.observe("buzz_http_request_sql_statements", by_endpoint, g.sql_statements)
+        metrics.inc("buzz_http_request_sql_seconds_total", by_endpoint, g.sql_seconds)
+        metrics.inc("buzz_http_request_template_seconds_total", by_endpoint, g.template_seconds)
+
+    def template_started(sender, template, context, **extra):
+        if has_request_context() and "metrics_started" in g:
+            g.template_starts.append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        if has_request_context() and g.get("template_starts"):
+            seconds = time.perf_counter() - g.template_starts.pop()
+            if not g.template_starts:  # nested renders are inside the outer one
+                g.template_seconds += seconds
+            metrics.observe("buzz_template_render_seconds", labels(template=template.name or "-"), seconds)
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
@@ -0,0 +1,602 @@
+"""Versioned schema migrations for buzz.db, tracked with PRAGMA user_version.
+
+Each step runs once, in order, inside a BEGIN IMMEDIATE transaction that also
+bumps user_version, so concurrent gunicorn workers starting up cannot apply
+the same step twice. On an up-to-date database startup costs one PRAGMA read.
+
+    python migrations.py            # apply pending migrations to buzz.db
+    python migrations.py --status   # show current / latest version
+"""
+import argparse
+import db
+from db import get_db
+
+MIGRATIONS = []
+
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """Apply every pending migration; returns the list of versions applied."""
+    conn = get_db()
+    applied = []
+    try:
+        if current_version(conn) >= latest_version():
+            return applied
+        for version, fn in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            # re-check under the write lock: another worker may have won
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn.cursor())
+            conn.execute(f"PRAGMA user_version={int(version)}")
+            conn.commit()
+            applied.append(version)
+    finally:
+        conn.close()
+    return applied
+
+
+# --- Migrations ---
+@migration(1)
+def baseline_schema(cur):
+    # Tables previously created by app.init_db() (and init_db.py, which
+    # wrote premium_requests to a separate database.db nobody read).
+    # Users table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            premium INTEGER DEFAULT 0,
+            ip_address TEXT
+        )
+    """)
+
+    # Videos
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            uploader TEXT NOT NULL,
+            filepath TEXT,
+            likes INTEGER DEFAULT 0
+        )
+    """)
+
+    # Likes
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS likes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id INTEGER,
+            user TEXT,
+            UNIQUE(video_id, user)
+        )
+    """)
+
+    # Comments
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id INTEGER,
+            user TEXT,
+            text TEXT
+        )
+    """)
+
+    # Messages (Public Chat)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT,
+            message TEXT
+        )
+    """)
+
+    # Reports
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reporter TEXT,
+            reported_user TEXT,
+            reason TEXT,
+            status TEXT DEFAULT 'pending'
+        )
+    """)
+
+    # Follows
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS follows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            follower TEXT,
+            following TEXT
+        )
+    """)
+
+    # Blocked IPs
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS blocked_ips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT UNIQUE
+        )
+    """)
+
+    # Premium Requests
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS premium_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            status TEXT CHECK(status IN ('pending','granted','rejected')) NOT NULL DEFAULT 'pending'
+        )
+    """)
+
+    # Data versions (bumped on writes so other workers can drop stale caches)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+@migration(2)
+def add_indexes(cur):
+    # comments for a video page, newest-first pagination
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_video ON comments (video_id, id)")
+    # profile(): videos by uploader
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_uploader ON videos (uploader, id)")
+    # leaderboard(): covering index for ORDER BY likes DESC
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_likes ON videos (likes, title)")
+    # follow_user(): duplicate check, and "who follows X"
+    cur.execute("""
+        DELETE FROM follows WHERE id NOT IN (
+            SELECT MIN(id) FROM follows GROUP BY follower, following
+        )
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_follows_pair ON follows (follower, following)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_follows_following ON follows (following)")
+    # admin premium request queue
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_premium_requests_status ON premium_requests (status, id)")
+
+
+@migration(3)
+def add_upload_sessions(cur):
+    # chunked uploads in progress (see uploads.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            uploader TEXT NOT NULL,
+            title TEXT NOT NULL,
+            filename TEXT,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_created ON upload_sessions (created_at)")
+
+
+@migration(4)
+def media_paths(cur):
+    # uploads are served by /media/<name> instead of the static handler
+    cur.execute("""
+        UPDATE videos SET filepath = '/media/' || substr(filepath, length('/static/uploads/') + 1)
+        WHERE filepath LIKE '/static/uploads/%'
+    """)
+
+
+@migration(5)
+def add_jobs_and_video_metadata(cur):
+    # background jobs (see jobs.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            state TEXT CHECK(state IN ('queued','running','done','failed')) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id)")
+    # filled in by media.process_video
+    cur.execute("ALTER TABLE videos ADD COLUMN duration REAL")
+    cur.execute("ALTER TABLE videos ADD COLUMN width INTEGER")
+    cur.execute("ALTER TABLE videos ADD COLUMN height INTEGER")
+    cur.execute("ALTER TABLE videos ADD COLUMN codec TEXT")
+    cur.execute("ALTER TABLE videos ADD COLUMN filesize INTEGER")
+
+
+@migration(6)
+def add_like_buckets(cur):
+    # per-hour like counts for the windowed leaderboards (see leaderboard.py)
+    cur.execute("ALTER TABLE likes ADD COLUMN created_at INTEGER")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS like_buckets (
+            video_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            likes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (video_id, hour)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_like_buckets_hour ON like_buckets (hour)")
+
+
+@migration(7)
+def add_search_index(cur):
+    # FTS5 indexes for /search (see search.py), kept in sync by triggers
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+            title, uploader,
+            content='videos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+            text,
+            content='comments', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    # Only title/uploader changes touch the index, not the likes counter
+    # (one execute per trigger: executescript() would commit mid-migration)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+            INSERT INTO videos_fts (rowid, title, uploader) VALUES (new.id, new.title, new.uploader);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+            INSERT INTO videos_fts (videos_fts, rowid, title, uploader)
+            VALUES ('delete', old.id, old.title, old.uploader);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE OF title, uploader ON videos BEGIN
+            INSERT INTO videos_fts (videos_fts, rowid, title, uploader)
+            VALUES ('delete', old.id, old.title, old.uploader);
+            INSERT INTO videos_fts (rowid, title, uploader) VALUES (new.id, new.title, new.uploader);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+            INSERT INTO comments_fts (rowid, text) VALUES (new.id, new.text);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF text ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO comments_fts (rowid, text) VALUES (new.id, new.text);
+        END
+    """)
+    cur.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+    cur.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+
+
+@migration(8)
+def add_timeline_inbox(cur):
+    # per-follower inboxes for the following feed (see timeline.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS inbox (
+            user TEXT NOT NULL,
+            video_id INTEGER NOT NULL,
+            PRIMARY KEY (user, video_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("ALTER TABLE users ADD COLUMN followers INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""
+        UPDATE users SET followers = (SELECT COUNT(*) FROM follows WHERE follows.following = users.username)
+    """)
+
+
+@migration(9)
+def add_view_counts(cur):
+    # page views, flushed in batches by views.py
+    cur.execute("ALTER TABLE videos ADD COLUMN views INTEGER NOT NULL DEFAULT 0")
+    cur.execute("ALTER TABLE videos ADD COLUMN unique_views INTEGER NOT NULL DEFAULT 0")
+    # HyperLogLog registers of viewers, kept out of videos so SELECT * stays small
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS view_sketches (
+            video_id INTEGER PRIMARY KEY,
+            hll BLOB NOT NULL
+        )
+    """)
+
+
+@migration(10)
+def add_counters(cur):
+    # row counts for the admin summary, maintained by triggers (see admin.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in ("videos", "comments", "users", "reports", "messages",
+                  "blocked_ips", "premium_requests"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = '{table}';
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = '{table}';
+            END
+        """)
+        cur.execute(f"INSERT OR REPLACE INTO counters (name, value) SELECT '{table}', COUNT(*) FROM {table}")
+    # pending moderation queues
+    for table in ("reports", "premium_requests"):
+        name = f"{table}_pending"
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table}
+            WHEN new.status = 'pending' BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = '{name}';
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
+            WHEN old.status = 'pending' BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = '{name}';
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF status ON {table}
+            WHEN (old.status = 'pending') != (new.status = 'pending') BEGIN
+                UPDATE counters
+                SET value = value + (CASE WHEN new.status = 'pending' THEN 1 ELSE -1 END)
+                WHERE name = '{name}';
+            END
+        """)
+        cur.execute(f"""
+            INSERT OR REPLACE INTO counters (name, value)
+            SELECT '{name}', COUNT(*) FROM {table} WHERE status = 'pending'
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reports_status ON reports (status, id)")
+
+
+@migration(11)
+def add_retention(cur):
+    # chat retention (see maintenance.py); older rows stay NULL and are
+    # archived before any timestamped one
+    cur.execute("ALTER TABLE messages ADD COLUMN created_at INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)")
+    # unreferenced upload files, and process_video()'s repointing
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_filepath ON videos (filepath)")
+    # "is one queued / when did it last run" checks before enqueueing
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind ON jobs (kind, state, updated_at)")
+
+
+def rebuild_table(cur, table, columns, select, indexes=()):
+    """Give `table` a new column layout the way SQLite documents it.
+
+    Rows are copied with `select` into a new table that then takes the old
+    one's name. The table's triggers are re-created unchanged and its
+    AUTOINCREMENT counter is kept, so ids of deleted rows are never reused.
+    """
+    cur.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND tbl_name=?", (table,))
+    triggers = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,))
+    row = cur.fetchone()
+    seq = row[0] if row else 0
+    cur.execute(f"CREATE TABLE {table}_new ({columns})")
+    cur.execute(f"INSERT INTO {table}_new {select}")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,))
+    row = cur.fetchone()
+    if row or seq:
+        cur.execute("DELETE FROM sqlite_sequence WHERE name=?", (table,))
+        cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                    (table, max(seq, row[0] if row else 0)))
+    for sql in indexes:
+        cur.execute(sql)
+    for sql in triggers:
+        cur.execute(sql)
+
+
+@migration(12)
+def user_ids(cur):
+    # Content references users by integer id instead of username, so a
+    # rename only touches users. No REFERENCES clauses: kicking a user stays
+    # a one-row delete and maintenance.cleanup_orphans() removes the rest in
+    # batches. Usernames for display come from a JOIN or accounts.usernames.
+    user_id = "(SELECT id FROM users WHERE users.username = {})"
+
+    # the search index keeps its own copy of the uploader's name (see below)
+    cur.execute("DROP TABLE IF EXISTS videos_fts")
+    for name in ("insert", "delete", "update"):
+        cur.execute(f"DROP TRIGGER IF EXISTS videos_fts_{name}")
+    rebuild_table(cur, "videos", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        uploader_id INTEGER,
+        filepath TEXT,
+        likes INTEGER DEFAULT 0,
+        duration REAL,
+        width INTEGER,
+        height INTEGER,
+        codec TEXT,
+        filesize INTEGER,
+        views INTEGER NOT NULL DEFAULT 0,
+        unique_views INTEGER NOT NULL DEFAULT 0
+    """, f"""
+        SELECT id, title, {user_id.format("videos.uploader")}, filepath, likes, duration, width, height,
+               codec, filesize, views, unique_views
+        FROM videos
+    """, [
+        "CREATE INDEX idx_videos_uploader ON videos (uploader_id, id)",
+        "CREATE INDEX idx_videos_likes ON videos (likes, title)",
+        "CREATE INDEX idx_videos_filepath ON videos (filepath)",
+    ])
+    rebuild_table(cur, "likes", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id INTEGER,
+        user_id INTEGER,
+        created_at INTEGER,
+        UNIQUE(video_id, user_id)
+    """, f"SELECT id, video_id, {user_id.format('likes.user')}, created_at FROM likes")
+    rebuild_table(cur, "comments", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        video_id INTEGER,
+        user_id INTEGER,
+        text TEXT
+    """, f"SELECT id, video_id, {user_id.format('comments.user')}, text FROM comments",
+        ["CREATE INDEX idx_comments_video ON comments (video_id, id)"])
+    rebuild_table(cur, "messages", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        message TEXT,
+        created_at INTEGER
+    """, f"SELECT id, {user_id.format('messages.user')}, message, created_at FROM messages",
+        ["CREATE INDEX idx_messages_created ON messages (created_at)"])
+    rebuild_table(cur, "follows", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        follower_id INTEGER,
+        following_id INTEGER
+    """, f"""
+        SELECT id, {user_id.format("follows.follower")}, {user_id.format("follows.following")}
+        FROM follows
+    """, [
+        "CREATE UNIQUE INDEX idx_follows_pair ON follows (follower_id, following_id)",
+        "CREATE INDEX idx_follows_following ON follows (following_id)",
+    ])
+    rebuild_table(cur, "premium_requests", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        status TEXT CHECK(status IN ('pending','granted','rejected')) NOT NULL DEFAULT 'pending'
+    """, f"SELECT id, {user_id.format('premium_requests.username')}, status FROM premium_requests",
+        ["CREATE INDEX idx_premium_requests_status ON premium_requests (status, id)"])
+    rebuild_table(cur, "upload_sessions", """
+        id TEXT PRIMARY KEY,
+        uploader_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        filename TEXT,
+        size INTEGER NOT NULL,
+        received INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL
+    """, """
+        SELECT upload_sessions.id, users.id, title, filename, size, received, created_at
+        FROM upload_sessions JOIN users ON users.username = upload_sessions.uploader
+    """, ["CREATE INDEX idx_upload_sessions_created ON upload_sessions (created_at)"])
+    cur.execute("""
+        CREATE TABLE inbox_new (
+            user_id INTEGER NOT NULL,
+            video_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, video_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO inbox_new (user_id, video_id)
+        SELECT users.id, inbox.video_id FROM inbox JOIN users ON users.username = inbox.user
+    """)
+    cur.execute("DROP TABLE inbox")
+    cur.execute("ALTER TABLE inbox_new RENAME TO inbox")
+
+    # Self-contained FTS5 table: deletes need no old values, and a rename
+    # re-indexes the user's videos (the only per-video cost of a rename).
+    cur.execute("""
+        CREATE VIRTUAL TABLE videos_fts USING fts5(
+            title, uploader,
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER videos_fts_insert AFTER INSERT ON videos BEGIN
+            INSERT INTO videos_fts (rowid, title, uploader)
+            VALUES (new.id, new.title, (SELECT username FROM users WHERE id = new.uploader_id));
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER videos_fts_delete AFTER DELETE ON videos BEGIN
+            DELETE FROM videos_fts WHERE rowid = old.id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER videos_fts_update AFTER UPDATE OF title, uploader_id ON videos BEGIN
+            UPDATE videos_fts
+            SET title = new.title, uploader = (SELECT username FROM users WHERE id = new.uploader_id)
+            WHERE rowid = new.id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER users_fts_rename AFTER UPDATE OF username ON users BEGIN
+            UPDATE videos_fts SET uploader = new.username
+            WHERE rowid IN (SELECT id FROM videos WHERE uploader_id = new.id);
+        END
+    """)
+    cur.execute("""
+        INSERT INTO videos_fts (rowid, title, uploader)
+        SELECT videos.id, videos.title, users.username
+        FROM videos LEFT JOIN users ON users.id = videos.uploader_id
+    """)
+
+
+
+@migration(13)
+def add_comment_counts(cur):
+    # per-video comment count for feed cards, kept by triggers like counters
+    cur.execute("ALTER TABLE videos ADD COLUMN comments INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_video_insert AFTER INSERT ON comments BEGIN
+            UPDATE videos SET comments = comments + 1 WHERE id = new.video_id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_video_delete AFTER DELETE ON comments BEGIN
+            UPDATE videos SET comments = comments - 1 WHERE id = old.video_id;
+        END
+    """)
+    cur.execute("""
+        UPDATE videos SET comments = (SELECT COUNT(*) FROM comments WHERE comments.video_id = videos.id)
+    """)
+
+
+@migration(14)
+def add_like_bucket_versions(cur):
+    # "likes" version of each bucket's last flush, so a worker re-reads only
+    # what changed since its last look (see leaderboard.py)
+    cur.execute("ALTER TABLE like_buckets ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_like_buckets_changed ON like_buckets (changed)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply BuzzTube schema migrations.")
+    parser.add_argument("--db", default=db.DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--status", action="store_true", help="only print the schema version")
+    args = parser.parse_args()
+    db.DB_FILE = args.db
+
+    if args.status:
+        conn = get_db()
+        print(f"{args.db}: version {current_version(conn)} (latest {latest_version()})")
+        conn.close()
+    else:
+        applied = migrate()
+        if applied:
+            print(f"✅ Applied migrations {applied} to {args.db}")
+        else:
+            print(f"✅ {args.db} is up to date (version {latest_version()})")
@@ -0,0 +1,182 @@
+"""Minimal pure-Python MP4 (ISO BMFF) reader: metadata probe and faststart.
+
+Only the boxes we need are parsed. The moov box is read into memory (it is
+small next to mdat); media data is only ever copied in IO_BLOCK pieces.
+"""
+import os, struct
+from contextlib import contextmanager
+
+IO_BLOCK = 1024 * 1024
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf", b"mvex", b"udta"}
+
+
+class MP4Error(Exception):
+    pass
+
+
+@contextmanager
+def malformed():
+    """Report a file cut short inside a box as MP4Error, like any other corrupt box."""
+    try:
+        yield
+    except (struct.error, EOFError, IndexError) as e:
+        raise MP4Error(f"truncated box: {e}") from e
+
+
+def top_level_boxes(f, size):
+    """Yield (type, offset, box_size, header_size) for each top-level box."""
+    offset = 0
+    while offset + 8 <= size:
+        f.seek(offset)
+        box_size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = size - offset
+        if box_size < header or offset + box_size > size:
+            raise MP4Error(f"corrupt {box_type!r} box at {offset}")
+        yield box_type, offset, box_size, header
+        offset += box_size
+
+
+def child_boxes(data, start=0, end=None):
+    """Yield (type, offset, box_size, header_size) for boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        box_size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header or offset + box_size > end:
+            raise MP4Error(f"corrupt {box_type!r} box in moov")
+        yield box_type, offset, box_size, header
+        offset += box_size
+
+
+def find(data, path, start=0, end=None):
+    """First box matching the type path, e.g. (b"mdia", b"hdlr"), or None."""
+    for box_type, offset, box_size, header in child_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return offset + header, offset + box_size
+            found = find(data, path[1:], offset + header, offset + box_size)
+            if found:
+                return found
+    return None
+
+
+def parse_moov(moov):
+    """duration (seconds), width, height and codec of the first video track."""
+    info = {"duration": None, "width": None, "height": None, "codec": None}
+    mvhd = find(moov, (b"mvhd",))
+    if mvhd:
+        start = mvhd[0]
+        if moov[start] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, start + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, start + 12)
+        if timescale:
+            info["duration"] = duration / timescale
+
+    for box_type, offset, box_size, header in child_boxes(moov):
+        if box_type != b"trak":
+            continue
+        body, end = offset + header, offset + box_size
+        hdlr = find(moov, (b"mdia", b"hdlr"), body, end)
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+            continue
+        tkhd = find(moov, (b"tkhd",), body, end)
+        if tkhd:
+            start = tkhd[0]
+            dims = start + (88 if moov[start] == 1 else 76)
+            width, height = struct.unpack_from(">II", moov, dims)
+            info["width"], info["height"] = width >> 16, height >> 16
+        stsd = find(moov, (b"mdia", b"minf", b"stbl", b"stsd"), body, end)
+        if stsd:
+            info["codec"] = moov[stsd[0] + 12:stsd[0] + 16].decode("latin-1").strip()
+        break
+    return info
+
+
+def read_layout(f):
+    size = os.fstat(f.fileno()).st_size
+    boxes = list(top_level_boxes(f, size))
+    moov = next((b for b in boxes if b[0] == b"moov"), None)
+    mdat = next((b for b in boxes if b[0] == b"mdat"), None)
+    if moov is None:
+        raise MP4Error("no moov box")
+    return size, boxes, moov, mdat
+
+
+def probe(path):
+    """Metadata dict plus `size` and `faststart` (moov already before mdat)."""
+    with open(path, "rb") as f, malformed():
+        size, boxes, moov, mdat = read_layout(f)
+        f.seek(moov[1] + moov[3])
+        info = parse_moov(f.read(moov[2] - moov[3]))
+    info["size"] = size
+    info["faststart"] = mdat is None or moov[1] < mdat[1]
+    return info
+
+
+def _shift_chunk_offsets(moov, start, end, delta, lo, hi):
+    """Add delta to every stco/co64 entry pointing into [lo, hi)."""
+    for box_type, offset, box_size, header in child_boxes(moov, start, end):
+        body = offset + header
+        if box_type in CONTAINERS:
+            _shift_chunk_offsets(moov, body, offset + box_size, delta, lo, hi)
+        elif box_type in (b"stco", b"co64"):
+            count = struct.unpack_from(">I", moov, body + 4)[0]
+            fmt, width = (">I", 4) if box_type == b"stco" else (">Q", 8)
+            for i in range(count):
+                pos = body + 8 + i * width
+                value = struct.unpack_from(fmt, moov, pos)[0]
+                if lo <= value < hi:
+                    value += delta
+                    if box_type == b"stco" and value > 0xFFFFFFFF:
+                        raise MP4Error("chunk offset overflows stco")
+                    struct.pack_into(fmt, moov, pos, value)
+
+
+def faststart(src, dst, hasher=None):
+    """Write `src` to `dst` with moov moved in front of the first mdat.
+
+    Returns False (and writes nothing) when `src` is already faststart.
+    `hasher`, if given, is updated with every byte written.
+    """
+    with open(src, "rb") as f, malformed():
+        size, boxes, moov, mdat = read_layout(f)
+        if mdat is None or moov[1] < mdat[1]:
+            return False
+        f.seek(moov[1])
+        moov_data = bytearray(f.read(moov[2]))
+        insert_at = mdat[1]
+        # everything between the new and the old moov position moves up
+        _shift_chunk_offsets(moov_data, moov[3], moov[2], moov[2], insert_at, moov[1])
+
+        with open(dst, "wb") as out:
+            def write(data):
+                out.write(data)
+                if hasher is not None:
+                    hasher.update(data)
+
+            def copy(offset, length):
+                f.seek(offset)
+                while length > 0:
+                    block = f.read(min(IO_BLOCK, length))
+                    if not block:
+                        raise MP4Error("unexpected end of file")
+                    write(block)
+                    length -= len(block)
+
+            copy(0, insert_at)
+            write(moov_data)
+            copy(insert_at, moov[1] - insert_at)
+            copy(moov[1] + moov[2], size - moov[1] - moov[2])
+    return True
@@ -0,0 +1,168 @@
+import math, os, sqlite3, threading, time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import request, session
+from werkzeug.exceptions import TooManyRequests
+
+# rate is tokens per second; a client may spend `burst` tokens at once
+Policy = namedtuple("Policy", "rate burst")
+
+POLICIES = {
+    "comment": Policy(rate=10 / 60, burst=5),
+    "chat": Policy(rate=30 / 60, burst=10),
+    "like": Policy(rate=60 / 60, burst=20),
+    "follow": Policy(rate=30 / 60, burst=10),
+    "upload": Policy(rate=20 / 3600, burst=5),
+}
+LIMITED_METHODS = ("POST", "PUT", "DELETE")
+IP_FACTOR = 5               # an address may carry several users (NAT, LAN)
+MAX_KEYS = 100_000          # buckets kept per worker before the oldest go
+
+# Shared mode keeps the buckets in their own SQLite file, so limits hold
+# across gunicorn workers without competing for buzz.db's write lock.
+RATE_LIMIT_SHARED = False
+SHARED_DB_FILE = "ratelimit.db"
+SHARED_PURGE_EVERY = 1000   # takes between deletes of refilled rows
+
+
+def shortfall(entries, levels):
+    """Seconds until every bucket holds a whole token again."""
+    return max(((1 - tokens) / policy.rate for (_, policy), tokens in zip(entries, levels) if tokens < 1),
+               default=0)
+
+
+class TokenBuckets:
+    """In-process token buckets in an LRU, one per (policy, client) key.
+
+    A bucket that has refilled completely is the same as no bucket, so it is
+    dropped when it reaches the cold end of the LRU; checks are O(1)
+    amortised and memory stays bounded by MAX_KEYS.
+    """
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()   # key -> [tokens, updated, full_at]
+        self.lock = threading.Lock()
+
+    def take(self, entries, now):
+        """Spend one token from each (key, policy) bucket, all or none.
+
+        Returns the seconds to wait, 0 if the tokens were spent.
+        """
+        with self.lock:
+            levels = [self._level(key, policy, now) for key, policy in entries]
+            wait = shortfall(entries, levels)
+            if not wait:
+                for (key, policy), tokens in zip(entries, levels):
+                    tokens -= 1
+                    self.buckets[key] = [tokens, now, now + (policy.burst - tokens) / policy.rate]
+                    self.buckets.move_to_end(key)
+            self._evict(now)
+            return wait
+
+    def _level(self, key, policy, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return policy.burst
+        tokens, updated, _ = bucket
+        return min(policy.burst, tokens + (now - updated) * policy.rate)
+
+    def _evict(self, now):
+        while self.buckets:
+            key, (_, _, full_at) = next(iter(self.buckets.items()))
+            if full_at > now and len(self.buckets) <= self.max_keys:
+                break
+            del self.buckets[key]
+
+
+class SharedTokenBuckets:
+    """The same buckets in a SQLite table, shared by every worker on the host."""
+
+    def __init__(self, path=SHARED_DB_FILE, purge_every=SHARED_PURGE_EVERY):
+        self.path = path
+        self.purge_every = purge_every
+        self.local = threading.local()
+        self.takes = 0
+
+    def connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing limiter state in a crash is harmless
+            # scratch state, not app data, so it lives outside migrations.py
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    full_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_buckets_full ON rate_buckets (full_at)")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return self.local.conn
+
+    def take(self, entries, now):
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [key for key, _ in entries]
+            stored = {row[0]: (row[1], row[2]) for row in conn.execute(
+                f"SELECT key, tokens, updated FROM rate_buckets WHERE key IN ({','.join('?' * len(keys))})",
+                keys)}
+            levels = [min(policy.burst, stored[key][0] + (now - stored[key][1]) * policy.rate)
+                      if key in stored else policy.burst for key, policy in entries]
+            wait = shortfall(entries, levels)
+            if not wait:
+                conn.executemany("INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?, ?)",
+                                 [(key, tokens - 1, now, now + (policy.burst - tokens + 1) / policy.rate)
+                                  for (key, policy), tokens in zip(entries, levels)])
+            self.takes += 1
+            if self.takes % self.purge_every == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, policies=POLICIES, shared=RATE_LIMIT_SHARED):
+        self.policies = policies
+        self.buckets = SharedTokenBuckets() if shared else TokenBuckets()
+        self.rejected = []   # callbacks fn(policy_name), see metrics
+        self.enabled = True
+
+    def check(self, name, ip, user=None):
+        """Seconds until this client may write again under `name`, 0 if now."""
+        policy = self.policies[name]
+        entries = [(f"{name}:ip:{ip}", Policy(policy.rate * IP_FACTOR, policy.burst * IP_FACTOR))]
+        if user:
+            entries.append((f"{name}:user:{user}", policy))
+        wait = self.buckets.take(entries, time.time())
+        if wait:
+            for fn in self.rejected:
+                fn(name)
+        return wait
+
+    def limit(self, name):
+        """Route decorator: 429 with Retry-After once the client's bucket is empty.
+
+        Only writes count; a GET on the same route is never limited.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if self.enabled and request.method in LIMITED_METHODS:
+                    wait = self.check(name, request.remote_addr, session.get("user"))
+                    if wait:
+                        raise TooManyRequests(f"Slow down: too many {name} requests.",
+                                              retry_after=math.ceil(wait))
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+
+limiter = RateLimiter()
+rate_limited = limiter.limit
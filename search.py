@@ -0,0 +1,102 @@
+import re
+from markupsafe import Markup, escape
+from db import get_reader
+
+PAGE_SIZE = 10
+SUGGEST_LIMIT = 8
+# bm25 column weights for videos_fts (title, uploader); comment hits count half
+TITLE_WEIGHT, UPLOADER_WEIGHT, COMMENT_FACTOR = 10.0, 5.0, 0.5
+# highlight()/snippet() markers, swapped for <mark> after HTML-escaping
+OPEN, CLOSE = "\x02", "\x03"
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query; the last word matches as a prefix.
+
+    Every term is quoted, so user input can never use FTS5 operators.
+    Returns None when there is nothing to search for.
+    """
+    terms = re.findall(r"\w+", text or "")
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def marked(text):
+    if text is None:
+        return None
+    return Markup(str(escape(text)).replace(OPEN, "<mark>").replace(CLOSE, "</mark>"))
+
+
+def search_videos(text, page=1, per_page=PAGE_SIZE):
+    """(results, has_next) for videos whose title, uploader or comments match.
+
+    Video and comment hits are ranked together by bm25; each result carries
+    the highlighted title and, for comment hits, a snippet.
+    """
+    query = fts_query(text)
+    if query is None:
+        return [], False
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH hits AS (
+            SELECT rowid AS video_id,
+                   bm25(videos_fts, {TITLE_WEIGHT}, {UPLOADER_WEIGHT}) AS score,
+                   highlight(videos_fts, 0, ?, ?) AS title_hl,
+                   NULL AS snippet
+            FROM videos_fts WHERE videos_fts MATCH ?
+            UNION ALL
+            SELECT comments.video_id,
+                   bm25(comments_fts) * {COMMENT_FACTOR},
+                   NULL,
+                   snippet(comments_fts, 0, ?, ?, '…', 12)
+            FROM comments_fts JOIN comments ON comments.id = comments_fts.rowid
+            WHERE comments_fts MATCH ?
+        )
+        , page AS (
+            SELECT videos.id, videos.title, videos.uploader_id, videos.duration,
+                   MIN(hits.score) AS score, MAX(hits.title_hl) AS title_hl,
+                   MAX(hits.snippet) AS snippet
+            FROM hits JOIN videos ON videos.id = hits.video_id
+            GROUP BY videos.id
+            ORDER BY score, videos.id DESC
+            LIMIT ? OFFSET ?
+        )
+        -- names for the page only, not for every hit
+        SELECT page.*, users.username AS uploader
+        FROM page LEFT JOIN users ON users.id = page.uploader_id
+        ORDER BY page.score, page.id DESC
+    """, (OPEN, CLOSE, query, OPEN, CLOSE, query, per_page + 1, (page - 1) * per_page))
+    rows = cur.fetchall()
+    conn.close()
+
+    results = [{
+        "id": row["id"],
+        "title": row["title"],
+        "uploader": row["uploader"],
+        "duration": row["duration"],
+        "title_html": marked(row["title_hl"]) or escape(row["title"]),
+        "snippet_html": marked(row["snippet"]),
+    } for row in rows[:per_page]]
+    return results, len(rows) > per_page
+
+
+def suggest(text, limit=SUGGEST_LIMIT):
+    """Typeahead: best-matching video titles for a partial query."""
+    query = fts_query(text)
+    if query is None:
+        return []
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT rowid AS id, title FROM videos_fts
+        WHERE videos_fts MATCH ?
+        ORDER BY bm25(videos_fts, {TITLE_WEIGHT}, {UPLOADER_WEIGHT})
+        LIMIT ?
+    """, (query, limit))
+    rows = [dict(row) for row in cur.fetchall()]
+    conn.close()
+    return rows
@@ -0,0 +1,186 @@
+// Admin dashboard (admin.html): sections load lazily, one keyset page at a time; actions update in place
+const root = document.getElementById("admin");
+const PAGE_SIZE = Number(root.dataset.pageSize);
+const API = root.dataset.api;
+// action URLs for id 0, from the data-* attributes (data-delete-video -> deleteVideo)
+const actionUrl = (name, id) => root.dataset[name].replace(/0$/, id);
+const status = document.getElementById("admin-status");
+
+function el(tag, text, className) {
+  const node = document.createElement(tag);
+  if (text !== undefined) node.textContent = text;
+  if (className) node.className = className;
+  return node;
+}
+
+function showCounters(counters) {
+  document.querySelectorAll("[data-counter]").forEach(span => {
+    span.textContent = counters[span.dataset.counter] ?? 0;
+  });
+}
+
+function post(url, body) {
+  return fetch(url, {
+    method: "POST",
+    headers: { "Accept": "application/json" },
+    body: body,
+  }).then(response => response.json()).then(result => {
+    status.textContent = result.message || result.error || "";
+    if (result.counters) showCounters(result.counters);
+    return result;
+  });
+}
+
+function button(label, className, url, onDone) {
+  const btn = el("button", label, "btn " + className);
+  btn.type = "button";
+  btn.addEventListener("click", () => {
+    btn.disabled = true;
+    post(url).then(onDone).finally(() => { btn.disabled = false; });
+  });
+  return btn;
+}
+
+// one renderer per section: a list item, plus a User Files row for users
+const RENDER = {
+  videos(v, item) {
+    item.append(el("strong", v.title), " by " + v.uploader + " ",
+      el("span", `Video #${v.id} • Likes: ${v.likes} • Views: ${v.views}`, "meta"),
+      button("Delete", "danger", actionUrl("deleteVideo", v.id), () => item.remove()));
+  },
+  comments(c, item) {
+    item.append(el("strong", c.user), ": " + c.text + " ",
+      el("span", `Comment #${c.id} on Video #${c.video_id}`, "meta"),
+      button("Delete", "danger", actionUrl("deleteComment", c.id), () => item.remove()));
+  },
+  users(u, item, section) {
+    const meta = el("span", `User #${u.id}${u.premium ? " • Premium" : ""}`, "meta");
+    const row = document.createElement("tr");
+    row.style.cssText = "background:#0a0a0a; box-shadow:0 0 10px #ff33aa;";
+    const premiumCell = el("td", u.premium);
+    row.append(el("td", u.id), el("td", u.email), el("td", u.username), el("td", u.password),
+               premiumCell, el("td", u.ip_address));
+    section.querySelector("#user-files").append(row);
+
+    item.append(el("strong", u.username), " ", meta);
+    if (u.username === "admin") {
+      item.append(el("span", "Protected", "meta"));
+      return;
+    }
+    const grant = button("Grant Premium", "", actionUrl("grantPremium", u.id), () => {
+      meta.textContent = `User #${u.id} • Premium`;
+      premiumCell.textContent = 1;
+    });
+    item.append(grant, button("Kick", "danger", actionUrl("kickUser", u.id), () => {
+      item.remove();
+      row.remove();
+    }));
+  },
+  reports(r, item) {
+    const meta = el("span", `Reason: ${r.reason} • Status: ${r.status}`, "meta");
+    item.append(el("strong", r.reporter), " reported ", el("strong", r.reported_user), " ", meta);
+    if (r.status === "pending") {
+      const review = button("Mark Reviewed", "", actionUrl("reviewReport", r.id), result => {
+        meta.textContent = `Reason: ${r.reason} • Status: ${result.updated.status}`;
+        review.remove();
+      });
+      item.append(review);
+    }
+  },
+  messages(m, item) {
+    item.append(el("strong", m.user), ": " + m.message + " ",
+      el("span", `Message #${m.id}`, "meta"),
+      button("Delete", "danger", actionUrl("deleteMessage", m.id), () => item.remove()));
+  },
+  blocked_ips(ip, item) {
+    item.append(ip.ip_address);
+  },
+  premium_requests(req, item) {
+    const meta = el("span", `Request #${req.id} • Status: ${req.status}`, "meta");
+    item.append(el("strong", req.username), " ", meta);
+    const done = { granted: "✅ Granted", rejected: "❌ Rejected" };
+    if (req.status !== "pending") {
+      item.append(el("span", done[req.status], "meta"));
+      return;
+    }
+    const decide = result => {
+      meta.textContent = `Request #${req.id} • Status: ${result.updated.status}`;
+      grant.remove();
+      reject.remove();
+      item.append(el("span", done[result.updated.status], "meta"));
+    };
+    const grant = button("Grant", "premium-btn", actionUrl("grantRequest", req.id), decide);
+    const reject = button("Reject", "danger", actionUrl("rejectRequest", req.id), decide);
+    item.append(grant, reject);
+  },
+};
+
+function loadPage(section, reset) {
+  const name = section.dataset.section;
+  const list = section.querySelector("ul");
+  const more = section.querySelector("button.more");
+  if (reset) {
+    list.replaceChildren();
+    const files = section.querySelector("#user-files");
+    if (files) files.replaceChildren();
+    delete section.dataset.before;
+  }
+  const params = new URLSearchParams({ limit: PAGE_SIZE });
+  if (section.dataset.before) params.set("before", section.dataset.before);
+  section.querySelectorAll("[data-filter]").forEach(input => {
+    if (input.value) params.set(input.dataset.filter, input.value);
+  });
+  more.disabled = true;
+  fetch(API.replace("__section__", name) + "?" + params).then(r => r.json()).then(page => {
+    page.rows.forEach(row => {
+      const item = el("li");
+      item.dataset.id = row.id;
+      RENDER[name](row, item, section);
+      list.append(item);
+    });
+    if (!list.children.length) list.append(el("li", "Nothing found.", "meta"));
+    section.dataset.before = page.next_before ?? "";
+    more.hidden = page.next_before === null;
+    more.disabled = false;
+  });
+}
+
+// load each section once it scrolls into view
+const observer = new IntersectionObserver(entries => {
+  entries.forEach(entry => {
+    if (!entry.isIntersecting) return;
+    observer.unobserve(entry.target);
+    loadPage(entry.target, true);
+  });
+});
+
+document.querySelectorAll(".admin-section").forEach(section => {
+  observer.observe(section);
+  section.querySelector("button.more").addEventListener("click", () => loadPage(section, false));
+  section.querySelectorAll("[data-filter]").forEach(input => {
+    input.addEventListener("change", () => loadPage(section, true));
+  });
+});
+
+// block/unblock without leaving the page
+document.querySelectorAll(".admin-form").forEach(form => {
+  form.addEventListener("submit", event => {
+    event.preventDefault();
+    const section = form.closest(".admin-section");
+    const list = section.querySelector("ul");
+    post(form.action, new FormData(form)).then(result => {
+      if (result.added) {
+        const item = el("li");
+        item.dataset.id = result.added.id;
+        RENDER.blocked_ips(result.added, item);
+        list.querySelectorAll("li.meta").forEach(empty => empty.remove());
+        list.prepend(item);
+      }
+      if (result.removed) {
+        const item = list.querySelector(`li[data-id="${result.removed}"]`);
+        if (item) item.remove();
+      }
+      form.reset();
+    });
+  });
+});
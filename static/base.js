@@ -0,0 +1,19 @@
+// Premium popup in the navigation bar (base.html)
+function openPremium() {
+  document.getElementById("premium-popup").style.display = "flex";
+}
+function closePremium() {
+  document.getElementById("premium-popup").style.display = "none";
+}
+function requestPremium() {
+  const url = document.getElementById("premium-popup").dataset.requestUrl;
+  fetch(url, { method: "POST" })
+    .then(response => {
+      if (response.ok) {
+        alert("Your Premium request has been sent to the admin!");
+        closePremium();
+      } else {
+        alert("Error sending request.");
+      }
+    });
+}
@@ -0,0 +1,45 @@
+// Splash overlay and infinite scroll for / and /following (home.html)
+function showSplash(callback) {
+  const splash = document.getElementById("splash");
+  const main = document.getElementById("main-content");
+  splash.style.display = "flex";
+  splash.style.opacity = 1;
+  main.style.display = "none";
+  setTimeout(() => {
+    splash.style.opacity = 0;
+    splash.style.transition = "opacity 1.2s ease";
+    setTimeout(() => {
+      splash.style.display = "none";
+      main.style.display = "block";
+      if (callback) callback();
+    }, 1200);
+  }, 1800);
+}
+if (document.getElementById("splash")) {
+  window.addEventListener("load", () => { showSplash(); });
+}
+
+// Load older videos when the sentinel scrolls into view
+const sentinel = document.getElementById("feed-sentinel");
+if (sentinel) {
+  const list = document.querySelector(".video-list");
+  let loading = false;
+  const observer = new IntersectionObserver(entries => {
+    if (!entries[0].isIntersecting || loading) return;
+    loading = true;
+    fetch(sentinel.dataset.url + "?before=" + sentinel.dataset.before)
+      .then(response => response.json())
+      .then(page => {
+        list.insertAdjacentHTML("beforeend", page.html);
+        if (page.next_before) {
+          sentinel.dataset.before = page.next_before;
+        } else {
+          observer.disconnect();
+          sentinel.remove();
+        }
+        loading = false;
+      })
+      .catch(() => { loading = false; });
+  }, { rootMargin: "600px" });
+  observer.observe(sentinel);
+}
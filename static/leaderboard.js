@@ -0,0 +1,46 @@
+// Likes bar chart for /leaderboard (leaderboard.html); Chart.js loads first from the CDN
+const canvas = document.getElementById('leaderboardChart');
+const ctx = canvas.getContext('2d');
+const leaderboardChart = new Chart(ctx, {
+    type: 'bar',
+    data: {
+        labels: JSON.parse(canvas.dataset.titles),
+        datasets: [{
+            label: 'Likes',
+            data: JSON.parse(canvas.dataset.likes),
+            backgroundColor: 'rgba(255, 0, 204, 0.6)',
+            borderColor: 'rgba(255, 0, 204, 1)',
+            borderWidth: 1
+        }]
+    },
+    options: {
+        plugins: {
+            legend: { display: false },
+            title: {
+                display: true,
+                text: canvas.dataset.heading,
+                color: '#ff00cc',
+                font: { size: 18 }
+            }
+        },
+        scales: {
+            y: {
+                beginAtZero: true,
+                ticks: { color: '#fff' },
+                title: {
+                    display: true,
+                    text: 'Likes',
+                    color: '#ff00cc'
+                }
+            },
+            x: {
+                ticks: { color: '#fff' },
+                title: {
+                    display: true,
+                    text: 'Video Title',
+                    color: '#ff00cc'
+                }
+            }
+        }
+    }
+});
@@ -0,0 +1,30 @@
+// Live updates for /publichat (publichat.html): new messages are pushed over Server-Sent Events
+const list = document.getElementById("chat-list");
+const form = document.getElementById("chat-form");
+
+function addMessage(m) {
+  const item = document.createElement("li");
+  item.className = "chat-item";
+  const user = document.createElement("strong");
+  user.textContent = m.user;
+  item.append(user, ": " + m.message);
+  list.prepend(item);
+  const empty = document.getElementById("chat-empty");
+  if (empty) empty.remove();
+}
+
+if (window.EventSource) {
+  // the browser resumes with Last-Event-ID after a dropped connection
+  const events = new EventSource(list.dataset.streamUrl);
+  events.onmessage = event => addMessage(JSON.parse(event.data));
+
+  form.addEventListener("submit", event => {
+    event.preventDefault();
+    const box = form.querySelector("textarea");
+    fetch(form.dataset.url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ message: box.value }),
+    }).then(response => { if (response.ok) box.value = ""; });
+  });
+}
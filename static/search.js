@@ -0,0 +1,19 @@
+// Typeahead for the search box (search.html)
+const box = document.getElementById("search-q");
+const suggestions = document.getElementById("search-suggestions");
+let timer = null;
+box.addEventListener("input", () => {
+  clearTimeout(timer);
+  timer = setTimeout(() => {
+    fetch(box.dataset.url + "?q=" + encodeURIComponent(box.value))
+      .then(response => response.json())
+      .then(data => {
+        suggestions.innerHTML = "";
+        data.suggestions.forEach(s => {
+          const option = document.createElement("option");
+          option.value = s.title;
+          suggestions.append(option);
+        });
+      });
+  }, 150);
+});
@@ -0,0 +1,73 @@
+// Chunked, resumable upload for upload.html (falls back to the plain form without JS)
+const form = document.getElementById("upload-form");
+const progress = document.getElementById("upload-progress");
+
+function sleep(ms) { return new Promise(resolve => setTimeout(resolve, ms)); }
+
+async function send(url, options) {
+  // retry network errors and 5xx with backoff so flaky links don't lose the upload
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, options);
+      if (response.status < 500) return response;
+    } catch (e) {}
+    if (attempt >= 8) throw new Error("server unreachable");
+    progress.textContent = "Connection lost, retrying…";
+    await sleep(Math.min(30000, 1000 * 2 ** attempt));
+  }
+}
+
+async function startOrResume(file, title) {
+  // uploads are resumable across page reloads, keyed by the file identity
+  const key = "upload:" + [file.name, file.size, file.lastModified].join(":");
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    const response = await send(form.dataset.base + "/" + saved);
+    if (response.ok) return [key, await response.json()];
+  }
+  const response = await send(form.dataset.initUrl, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ title: title, filename: file.name, size: file.size }),
+  });
+  const status = await response.json();
+  if (!response.ok) throw new Error(status.error);
+  localStorage.setItem(key, status.upload_id);
+  return [key, status];
+}
+
+form.addEventListener("submit", async event => {
+  const file = document.getElementById("file").files[0];
+  if (!file || !window.fetch) return;
+  event.preventDefault();
+  form.querySelector("button").disabled = true;
+  progress.style.display = "block";
+
+  try {
+    let [key, status] = await startOrResume(file, document.getElementById("title").value);
+    const base = form.dataset.base + "/" + status.upload_id;
+    while (status.received < status.size) {
+      const start = status.next_chunk * status.chunk_size;
+      const chunk = file.slice(start, start + status.chunk_size);
+      const response = await send(base + "/" + status.next_chunk, { method: "PUT", body: chunk });
+      const body = await response.json();
+      if (response.ok) {
+        status = body;
+      } else if (response.status === 409) {
+        status = await (await send(base)).json();  // resync with the server
+      } else {
+        throw new Error(body.error);
+      }
+      progress.textContent = "Uploaded " + Math.floor(100 * status.received / status.size) + "%";
+    }
+    progress.textContent = "Finishing…";
+    const response = await send(base + "/finalize", { method: "POST" });
+    const done = await response.json();
+    if (!response.ok) throw new Error(done.error);
+    localStorage.removeItem(key);
+    window.location = done.url;
+  } catch (e) {
+    progress.textContent = "Upload failed: " + e.message + " (submit again to resume)";
+    form.querySelector("button").disabled = false;
+  }
+});
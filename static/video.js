@@ -0,0 +1,67 @@
+// Player controls, comment posting and comment paging for /video/<id> (video.html)
+const video = document.getElementById("videoPlayer");
+if (video) {
+  document.getElementById("startBtn").addEventListener("click", () => {
+    video.play();
+  });
+  document.getElementById("stopBtn").addEventListener("click", () => {
+    video.pause();
+    video.currentTime = 0; // reset to beginning
+  });
+}
+
+// Post without reloading the page; the new comment goes on top
+const commentForm = document.getElementById("comment-form");
+const commentList = document.getElementById("comment-list");
+if (commentForm && commentList) {
+  commentForm.addEventListener("submit", event => {
+    event.preventDefault();
+    const textarea = commentForm.querySelector("textarea");
+    const button = commentForm.querySelector("button");
+    button.disabled = true;
+    fetch(commentForm.dataset.url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ text: textarea.value }),
+    })
+      .then(response => response.json().then(body => ({ ok: response.ok, body })))
+      .then(({ ok, body }) => {
+        if (!ok) {
+          alert(body.error || "Could not post your comment.");
+          return;
+        }
+        const empty = document.getElementById("no-comments");
+        if (empty) empty.remove();
+        commentList.insertAdjacentHTML("afterbegin", body.html);
+        const count = document.getElementById("comment-count");
+        if (count) count.textContent = Number(count.textContent) + 1;
+        textarea.value = "";
+      })
+      .catch(() => alert("Could not post your comment."))
+      .finally(() => { button.disabled = false; });
+  });
+}
+
+// Load older comments when the sentinel scrolls into view
+const commentSentinel = document.getElementById("comments-sentinel");
+if (commentSentinel && commentList) {
+  let loading = false;
+  const observer = new IntersectionObserver(entries => {
+    if (!entries[0].isIntersecting || loading) return;
+    loading = true;
+    fetch(commentSentinel.dataset.url + "?before=" + commentSentinel.dataset.before)
+      .then(response => response.json())
+      .then(page => {
+        commentList.insertAdjacentHTML("beforeend", page.html);
+        if (page.next_before) {
+          commentSentinel.dataset.before = page.next_before;
+        } else {
+          observer.disconnect();
+          commentSentinel.remove();
+        }
+        loading = false;
+      })
+      .catch(() => { loading = false; });
+  }, { rootMargin: "400px" });
+  observer.observe(commentSentinel);
+}
@@ -0,0 +1,123 @@
+import heapq
+from db import get_reader
+
+# "push": fan out on write into inbox rows; "pull": merge followees' videos
+# on read; "hybrid": push, except for uploaders with FANOUT_THRESHOLD or
+# more followers, whose videos are pulled.
+STRATEGIES = ("push", "pull", "hybrid")
+DEFAULT_STRATEGY = "hybrid"
+FANOUT_THRESHOLD = 1000
+BACKFILL = 50          # recent videos copied into an inbox on follow
+PAGE_SIZE = 12
+NO_CURSOR = 2**63 - 1
+
+
+class Timeline:
+    """Following feed with a selectable fan-out strategy.
+
+    Every read is bounded by the page size: the inbox is a (user_id, video_id)
+    primary-key range scan, and each pulled uploader is one seek on
+    idx_videos_uploader, merged k-way with heapq.merge. Cursors are video
+    ids, so pages are stable while new videos arrive.
+    """
+
+    def __init__(self, strategy=DEFAULT_STRATEGY, threshold=FANOUT_THRESHOLD):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown timeline strategy {strategy!r}")
+        self.strategy = strategy
+        self.threshold = threshold
+
+    def pushes(self, followers):
+        return self.strategy == "push" or (self.strategy == "hybrid" and followers < self.threshold)
+
+    # --- Writes ---
+    def on_upload(self, cur, video_id, uploader_id):
+        """Fan a new video out to the uploader's followers' inboxes."""
+        cur.execute("SELECT followers FROM users WHERE id=?", (uploader_id,))
+        row = cur.fetchone()
+        if row and self.pushes(row["followers"]):
+            cur.execute("""
+                INSERT OR IGNORE INTO inbox (user_id, video_id)
+                SELECT follower_id, ? FROM follows WHERE following_id=?
+            """, (video_id, uploader_id))
+
+    def on_follow(self, cur, follower_id, following_id):
+        """Count the new follower and backfill their inbox."""
+        cur.execute("UPDATE users SET followers = followers + 1 WHERE id=? RETURNING followers",
+                    (following_id,))
+        row = cur.fetchone()
+        if row and self.pushes(row["followers"]):
+            cur.execute("""
+                INSERT OR IGNORE INTO inbox (user_id, video_id)
+                SELECT ?, id FROM videos WHERE uploader_id=? ORDER BY id DESC LIMIT ?
+            """, (follower_id, following_id, BACKFILL))
+
+    def rebuild(self, cur):
+        """Refill every inbox from follows, e.g. after an import (see backup.py)."""
+        cur.execute("DELETE FROM inbox")
+        if self.strategy == "pull":
+            return
+        cur.execute(f"""
+            INSERT OR IGNORE INTO inbox (user_id, video_id)
+            SELECT follows.follower_id, videos.id
+            FROM follows
+            JOIN users ON users.id = follows.following_id
+            JOIN videos ON videos.uploader_id = follows.following_id
+            {"" if self.strategy == "push" else "WHERE users.followers < ?"}
+        """, () if self.strategy == "push" else (self.threshold,))
+
+    # --- Reads ---
+    def page(self, user_id, before=None, limit=PAGE_SIZE):
+        """(videos, next_before) for the page of the feed older than `before`."""
+        before = before if before is not None else NO_CURSOR
+        conn = get_reader()
+        cur = conn.cursor()
+        sources = []
+
+        if self.strategy != "pull":
+            cur.execute("""
+                SELECT video_id FROM inbox WHERE user_id=? AND video_id < ?
+                ORDER BY video_id DESC LIMIT ?
+            """, (user_id, before, limit + 1))
+            sources.append([row["video_id"] for row in cur.fetchall()])
+
+        cur.execute("""
+            SELECT follows.following_id, users.followers
+            FROM follows JOIN users ON users.id = follows.following_id
+            WHERE follows.follower_id=?
+        """, (user_id,))
+        for row in cur.fetchall():
+            if self.strategy != "pull" and self.pushes(row["followers"]):
+                continue
+            cur.execute("""
+                SELECT id FROM videos WHERE uploader_id=? AND id < ?
+                ORDER BY id DESC LIMIT ?
+            """, (row["following_id"], before, limit + 1))
+            sources.append([r["id"] for r in cur.fetchall()])
+
+        ids = []
+        for video_id in heapq.merge(*sources, reverse=True):
+            if not ids or ids[-1] != video_id:  # pushed before the uploader crossed the threshold
+                ids.append(video_id)
+            if len(ids) > limit:
+                break
+
+        next_before = None
+        if len(ids) > limit:
+            ids = ids[:limit]
+            next_before = ids[-1]
+
+        videos = []
+        if ids:
+            cur.execute(f"""
+                SELECT videos.*, users.username AS uploader, users.premium
+                FROM videos JOIN users ON users.id = videos.uploader_id
+                WHERE videos.id IN ({','.join('?' * len(ids))})
+                ORDER BY videos.id DESC
+            """, ids)
+            videos = cur.fetchall()
+        conn.close()
+        return videos, next_before
+
+
+timeline = Timeline()
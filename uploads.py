@@ -0,0 +1,194 @@
+import os, hashlib, threading, time, uuid
+import werkzeug
+from db import get_reader
+from writer import writer
+
+# Chunked uploads: POST init -> PUT chunk 0..n-1 -> POST finalize.
+# Chunks are appended to <UPLOAD_FOLDER>/.partial/<upload_id>.part in order,
+# hashed as they stream in, and the finished file is stored once under its
+# SHA-256 so identical uploads share one file on disk.
+CHUNK_SIZE = 4 * 1024 * 1024        # bytes per PUT (the last chunk may be shorter)
+IO_BLOCK = 64 * 1024                # read/write granularity, bounds memory per request
+MAX_UPLOAD_SIZE = 16 * 1024 ** 3    # 16 GiB
+SESSION_TTL = 24 * 3600             # unfinished uploads are dropped after a day
+
+
+class UploadError(Exception):
+    """Client-visible upload failure; `status` is the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploads:
+    """Stores chunked uploads under `folder`, content-addressed by SHA-256.
+
+    Upload sessions live in the upload_sessions table so any worker can take
+    the next chunk. The running hash is kept in memory for the worker that
+    wrote the last chunk; another worker rebuilds it by re-reading the
+    partial file in IO_BLOCK pieces, so memory stays bounded either way.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.hashers = {}           # upload_id -> (offset, sha256)
+        self.lock = threading.Lock()
+
+    def partial_path(self, upload_id):
+        return os.path.join(self.folder, ".partial", f"{upload_id}.part")
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.folder, digest[:2], digest + ext)
+
+    # --- Sessions ---
+    def start(self, uploader_id, title, filename, size):
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise UploadError("Invalid file size.")
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(self.partial_path(upload_id)), exist_ok=True)
+        open(self.partial_path(upload_id), "wb").close()
+
+        writer.write(lambda cur: cur.execute("""
+            INSERT INTO upload_sessions (id, uploader_id, title, filename, size, received, created_at)
+            VALUES (?, ?, ?, ?, ?, 0, ?)
+        """, (upload_id, uploader_id, title, filename, size, int(time.time()))))
+        return self.status(upload_id, uploader_id)
+
+    def session(self, upload_id, uploader_id):
+        conn = get_reader()
+        row = conn.execute("SELECT * FROM upload_sessions WHERE id=?", (upload_id,)).fetchone()
+        conn.close()
+        if not row or row["uploader_id"] != uploader_id:
+            raise UploadError("Upload not found.", 404)
+        return row
+
+    def status(self, upload_id, uploader_id):
+        row = self.session(upload_id, uploader_id)
+        return {
+            "upload_id": row["id"],
+            "size": row["size"],
+            "received": row["received"],
+            "chunk_size": CHUNK_SIZE,
+            "next_chunk": row["received"] // CHUNK_SIZE,
+        }
+
+    def expire(self, max_age=SESSION_TTL):
+        cutoff = int(time.time()) - max_age
+
+        def delete(cur):
+            cur.execute("DELETE FROM upload_sessions WHERE created_at < ? RETURNING id", (cutoff,))
+            return [r["id"] for r in cur.fetchall()]
+
+        for upload_id in writer.write(delete):
+            self.discard(upload_id)
+
+    def discard(self, upload_id):
+        with self.lock:
+            self.hashers.pop(upload_id, None)
+        try:
+            os.remove(self.partial_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    # --- Chunks ---
+    def write_chunk(self, upload_id, uploader_id, index, stream, length):
+        """Append chunk `index` from `stream`; returns the new status.
+
+        Chunks must arrive in order. Re-sending a chunk that was already
+        stored is a no-op, so a client can always retry its last PUT.
+        """
+        row = self.session(upload_id, uploader_id)
+        offset = index * CHUNK_SIZE
+        if offset < row["received"]:
+            return self.status(upload_id, uploader_id)
+        if offset != row["received"]:
+            raise UploadError(f"Expected chunk {row['received'] // CHUNK_SIZE}.", 409)
+        expected = min(CHUNK_SIZE, row["size"] - offset)
+        if length is None or length != expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes.", 400)
+
+        hasher = self._hasher(upload_id, offset)
+        path = self.partial_path(upload_id)
+        written = 0
+        with open(path, "r+b") as f:
+            # drop whatever a dropped connection left past the last good chunk
+            f.truncate(offset)
+            f.seek(offset)
+            while written < expected:
+                block = stream.read(min(IO_BLOCK, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                written += len(block)
+        if written != expected:
+            with self.lock:
+                self.hashers.pop(upload_id, None)
+            raise UploadError("Chunk was cut short, resend it.", 400)
+
+        updated = writer.write(lambda cur: cur.execute(
+            "UPDATE upload_sessions SET received=? WHERE id=? AND received=?",
+            (offset + written, upload_id, offset)).rowcount)
+        if not updated:
+            raise UploadError("Chunk was written concurrently, check status.", 409)
+        with self.lock:
+            self.hashers[upload_id] = (offset + written, hasher)
+        return self.status(upload_id, uploader_id)
+
+    def _hasher(self, upload_id, offset):
+        with self.lock:
+            cached = self.hashers.pop(upload_id, None)
+        if cached and cached[0] == offset:
+            return cached[1]
+        # another worker took the previous chunks: re-hash what is on disk
+        hasher = hashlib.sha256()
+        with open(self.partial_path(upload_id), "rb") as f:
+            remaining = offset
+            while remaining:
+                block = f.read(min(IO_BLOCK, remaining))
+                if not block:
+                    raise UploadError("Partial upload is missing data, restart it.", 409)
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    # --- Finalize ---
+    def finish(self, upload_id, uploader_id):
+        """Move a complete upload into the store; returns (row, stored path)."""
+        row = self.session(upload_id, uploader_id)
+        if row["received"] != row["size"]:
+            raise UploadError(f"Upload incomplete: {row['received']} of {row['size']} bytes.", 409)
+        digest = self._hasher(upload_id, row["size"]).hexdigest()
+        path = self.store(self.partial_path(upload_id), digest, row["filename"])
+
+        writer.write(lambda cur: cur.execute("DELETE FROM upload_sessions WHERE id=?", (upload_id,)))
+        self.discard(upload_id)
+        return row, path
+
+    def store(self, src, digest, filename):
+        """Move `src` to its content address, or drop it if already stored."""
+        ext = os.path.splitext(werkzeug.utils.secure_filename(filename or ""))[1].lower() or ".mp4"
+        dest = self.blob_path(digest, ext)
+        if os.path.exists(dest):
+            os.remove(src)
+            os.utime(dest)  # fresh again, so cleanup_uploads() leaves it for the new row
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(src, dest)
+        return os.path.relpath(dest, self.folder).replace(os.sep, "/")
+
+    def store_stream(self, stream, filename):
+        """Hash and store a whole file from a single (non-chunked) form post."""
+        tmp = self.partial_path(uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        hasher = hashlib.sha256()
+        with open(tmp, "wb") as f:
+            while True:
+                block = stream.read(IO_BLOCK)
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+        return self.store(tmp, hasher.hexdigest(), filename)
@@ -0,0 +1,148 @@
+import hashlib, logging, math, threading, time, os, atexit
+from db import get_reader
+from writer import writer, busy
+
+FLUSH_INTERVAL = 5.0   # seconds between view flushes
+HLL_P = 12             # 2**12 one-byte registers per video, ~1.6% error
+HLL_M = 1 << HLL_P
+
+log = logging.getLogger("buzz.views")
+
+
+class HyperLogLog:
+    """Fixed-size distinct-count sketch; registers serialise to a BLOB."""
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_M)
+
+    def add(self, item):
+        x = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - HLL_P)
+        rest = x & ((1 << (64 - HLL_P)) - 1)
+        rank = (64 - HLL_P) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / HLL_M)
+        raw = alpha * HLL_M * HLL_M / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * HLL_M and zeros:
+            return round(HLL_M * math.log(HLL_M / zeros))  # linear counting
+        return round(raw)
+
+    def to_blob(self):
+        return bytes(self.registers)
+
+
+class ViewCounter:
+    """Counts video page views in memory and flushes them in batches.
+
+    Each worker keeps a view count and a HyperLogLog of viewers per video;
+    every FLUSH_INTERVAL one write (see writer.py) adds the counts to
+    videos.views, merges the sketches into view_sketches and stores the new
+    unique-viewer estimate in videos.unique_views. A page view itself never
+    writes to SQLite. The flush bumps no data version: on a watched video it
+    would change the page's ETag and cached comment list and card every few
+    seconds, so cached HTML shows view counts as of cache.views_epoch().
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.sketches = {}
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def record(self, video_id, viewer):
+        self._ensure_flusher()
+        with self.lock:
+            self.counts[video_id] = self.counts.get(video_id, 0) + 1
+            sketch = self.sketches.get(video_id)
+            if sketch is None:
+                sketch = self.sketches[video_id] = HyperLogLog()
+            sketch.add(viewer)
+
+    def pending(self, video_id):
+        """Views recorded by this worker but not flushed yet."""
+        with self.lock:
+            return self.counts.get(video_id, 0)
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            sketches, self.sketches = self.sketches, {}
+        if not counts:
+            return
+        ids = list(counts)
+
+        def apply(cur):
+            # read-merge-write of the sketches, under the writer's BEGIN IMMEDIATE
+            cur.execute(f"SELECT video_id, hll FROM view_sketches WHERE video_id IN ({','.join('?' * len(ids))})",
+                        ids)
+            stored = {row["video_id"]: HyperLogLog(row["hll"]) for row in cur.fetchall()}
+            rows = []
+            for video_id in ids:
+                sketch = sketches[video_id]
+                if video_id in stored:
+                    sketch.merge(stored[video_id])
+                rows.append((video_id, sketch.to_blob(), counts[video_id], sketch.estimate()))
+            cur.executemany("""
+                INSERT INTO view_sketches (video_id, hll) VALUES (?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET hll = excluded.hll
+            """, [(video_id, blob) for video_id, blob, _, _ in rows])
+            cur.executemany("UPDATE videos SET views = views + ?, unique_views = ? WHERE id=?",
+                            [(count, unique, video_id) for video_id, _, count, unique in rows])
+
+        try:
+            writer.write(apply)
+        except Exception:
+            with self.lock:  # keep them for the next round
+                for video_id in ids:
+                    self.counts[video_id] = self.counts.get(video_id, 0) + counts[video_id]
+                    if video_id in self.sketches:
+                        self.sketches[video_id].merge(sketches[video_id])
+                    else:
+                        self.sketches[video_id] = sketches[video_id]
+            raise
+
+    def _ensure_flusher(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.counts, self.sketches = {}, {}
+            writer.start()
+            threading.Thread(target=self._run, name="view-flusher", daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                # counts were kept; a busy database is retried quietly next tick
+                if not busy(e):
+                    log.exception("view flush failed")
+
+
+def view_stats(ids):
+    """{video_id: (views, unique_views)} for a handful of videos."""
+    if not ids:
+        return {}
+    conn = get_reader()
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, views, unique_views FROM videos WHERE id IN ({','.join('?' * len(ids))})",
+                list(ids))
+    stats = {row["id"]: (row["views"], row["unique_views"]) for row in cur.fetchall()}
+    conn.close()
+    return stats
+
+
+views = ViewCounter()
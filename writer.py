@@ -0,0 +1,158 @@
+import queue, sqlite3, threading, time, os
+from concurrent.futures import Future
+from db import get_db
+from metrics import metrics, COUNT_BUCKETS
+
+WRITE_BATCH = 64        # operations per transaction at most
+WRITE_RETRIES = 5       # attempts when another worker holds the write lock
+RETRY_DELAY = 0.05      # seconds, doubled after each failed attempt
+
+metrics.describe("buzz_write_batch_size", "histogram", "Write operations committed per transaction.",
+                 COUNT_BUCKETS)
+metrics.describe("buzz_write_retries_total", "counter", "Write transactions retried because the database was busy.")
+
+
+class WriteQueue:
+    """Funnels this worker's writes through one writer thread and group-commits them.
+
+    A request hands a function to write(); the writer thread runs it as
+    fn(cursor, *args) together with whatever else is waiting (up to
+    WRITE_BATCH operations) inside one BEGIN IMMEDIATE transaction, each
+    under its own SAVEPOINT, and commits once. An operation that raises is
+    rolled back to its savepoint and only its caller sees the exception;
+    everyone else's result is delivered after the COMMIT. So under load a
+    worker takes the write lock once per batch instead of once per request,
+    and its request threads never wait on SQLite's lock themselves.
+
+    Workers still share the database file: between processes BEGIN
+    IMMEDIATE waits up to busy_timeout, and a batch that still finds the
+    database locked is retried whole, up to WRITE_RETRIES times.
+    Operations must only touch the database; side effects (caches, flashes)
+    belong in the caller, after write() returns.
+    """
+
+    def __init__(self, batch=WRITE_BATCH):
+        self.batch = batch
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.cur = None  # the open transaction, while a batch runs
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(cur, *args, **kwargs); returns a Future for its result."""
+        future = Future()
+        if threading.current_thread() is self.thread and self.cur is not None:
+            # already inside a batch (an operation writing again): run inline
+            try:
+                future.set_result(fn(self.cur, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self.start()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def write(self, fn, *args, **kwargs):
+        """Run fn(cur, *args, **kwargs) in the next batch and return its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def start(self):
+        """Start this worker's writer thread (submit() does it on first use).
+
+        Flushers call it up front so their final atexit flush finds the
+        thread running.
+        """
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # a forked child must not inherit the parent's queue
+            self.queue = queue.SimpleQueue()
+            self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            ops = [self.queue.get()]
+            while len(ops) < self.batch:
+                try:
+                    ops.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                ops = [op for op in ops if op[0].set_running_or_notify_cancel()]
+                if ops:
+                    self._commit(ops)
+            except Exception as e:
+                # never let the thread die: every later write() would wait forever
+                for future, *_ in ops:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, ops):
+        delay = RETRY_DELAY
+        for attempt in range(WRITE_RETRIES):
+            conn = None
+            try:
+                conn = get_db()
+                outcomes = self._apply(conn, ops)
+                conn.commit()
+            except Exception as e:
+                self._discard(conn)
+                if attempt + 1 < WRITE_RETRIES and busy(e):
+                    metrics.inc("buzz_write_retries_total")
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                for future, *_ in ops:
+                    future.set_exception(e)
+                return
+            conn.close()
+            for (future, *_), (ok, value) in zip(ops, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            metrics.observe("buzz_write_batch_size", "", len(ops))
+            return
+
+    def _discard(self, conn):
+        """Pool a connection after a failed batch (close() rolls back), or drop it if that fails too."""
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except sqlite3.Error:
+            conn.really_close()
+
+    def _apply(self, conn, ops):
+        """Run every operation in one transaction; returns [(ok, result or exception)]."""
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        self.cur = cur
+        outcomes = []
+        try:
+            for future, fn, args, kwargs in ops:
+                cur.execute("SAVEPOINT op")
+                try:
+                    outcomes.append((True, fn(cur, *args, **kwargs)))
+                except Exception as e:
+                    if busy(e):
+                        raise  # the whole batch is retried
+                    cur.execute("ROLLBACK TO op")
+                    outcomes.append((False, e))
+                cur.execute("RELEASE op")
+        finally:
+            self.cur = None
+        return outcomes
+
+
+def busy(error):
+    """True for SQLITE_BUSY/SQLITE_LOCKED: another worker holds the write lock."""
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+
+writer = WriteQueue()